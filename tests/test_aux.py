@@ -1,8 +1,11 @@
 """test auxilary functions"""
 
 import numpy as np
+import pytest
 from pytest import approx
 from wannierberri.formula.covariant import _spin_velocity_einsum_opt
+from wannierberri.__utility import fourier_q_to_R
+from wannierberri.calculators.static import fermi_derivative_weights
 
 
 def test_spin_velocity_einsum_opt():
@@ -18,3 +21,45 @@ def test_spin_velocity_einsum_opt():
         # Optimized version of C += np.einsum('knls,klma->knmas', A, B). Used in shc_B_H.
         C1 += np.einsum('knls,klma->knmas', A, B)
         assert C1 == approx(C)
+
+
+def test_fourier_q_to_R():
+    mp_grid = (3, 2, 4)
+    kpt_mp_grid = [tuple(k) for k in np.array(np.unravel_index(np.random.permutation(24), mp_grid)).T]
+    iRvec = np.random.randint(-4, 5, size=(10, 3))
+    ndegen = np.random.randint(1, 4, size=10)
+    AA_q = {'Ham': np.random.random((24, 2, 2)) + 1j * np.random.random((24, 2, 2)),
+            'AA': np.random.random((24, 2, 2, 3)) + 1j * np.random.random((24, 2, 2, 3))}
+    kpt = np.array(kpt_mp_grid) / np.array(mp_grid)
+    AA_R_all = fourier_q_to_R(AA_q, mp_grid, kpt_mp_grid, iRvec, ndegen, fft='numpy')
+    for key, A_q in AA_q.items():
+        phase = np.exp(-2j * np.pi * iRvec.dot(kpt.T)) / ndegen[:, None] / 24
+        ref = np.einsum('rk,kmn...->mnr...', phase, A_q)
+        for fft in "fftw", "numpy":
+            assert fourier_q_to_R(A_q, mp_grid, kpt_mp_grid, iRvec, ndegen, fft=fft) == approx(ref)
+        assert AA_R_all[key] == approx(ref)
+        assert AA_R_all[key].flags["C_CONTIGUOUS"]
+
+
+@pytest.mark.parametrize("fder", [0, 1, 2, 3])
+def test_fermi_derivative_weights_top(fder):
+    """a band exactly at the highest Fermi level (of the extended window) should not fail"""
+    Efermi = np.linspace(6, 8, 201)
+    extraEf = {0: 0, 1: 1, 2: 1, 3: 2}[fder]
+    dEF = Efermi[1] - Efermi[0]
+    EFmin = Efermi[0] - extraEf * dEF
+    EFmax = Efermi[-1] + extraEf * dEF
+    nEF = len(Efermi)
+    energies = np.array([-np.inf, 7.0, EFmax, 8.0])
+    values = np.array([1., 2., 4., 8.])
+    res = fermi_derivative_weights(energies, values, np.zeros(4, dtype=int), 1, nEF, EFmin, EFmax, dEF, fder)
+    assert res.shape == (1, nEF)
+    if fder == 0:
+        # cumulative sum as in the original implementation, restot[iEf:] += value
+        ref = np.zeros(nEF)
+        for E, v in zip(energies, values):
+            if E < EFmin:
+                ref += v
+            else:
+                ref[int(np.ceil((E - EFmin) / dEF)):] += v
+        assert res[0] == approx(ref)
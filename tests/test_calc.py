@@ -1,10 +1,12 @@
 import wannierberri as wberri
 from wannierberri.calculators import static
 from wannierberri.formula import covariant as frml
+from wannierberri.formula import covariant_basic as frml_basic
 from wannierberri.result import EnergyResult, KBandResult
 from common import OUTPUT_DIR, REF_DIR
 from common_comparers import error_message
 import numpy as np
+import io
 import os
 import pytest
 
@@ -104,6 +106,28 @@ def test_BD_trace(system_Haldane_PythTB):
     assert (np.max(abs(trace))) < 1e-10
 
 
+@pytest.mark.parametrize("formula", [frml.Omega, frml.Morb_H, frml.morb, frml.DerOmega,
+                                     frml_basic.tildeFab, frml_basic.tildeHab, frml_basic.tildeHGab,
+                                     frml_basic.tildeFc, frml_basic.tildeHGc, frml_basic.tildeFc_d])
+@pytest.mark.parametrize("external_terms", [True, False])
+def test_trace_batch(system_Fe_W90, formula, external_terms):
+    grid = wberri.Grid(system_Fe_W90, NKFFT=[3, 3, 3], NKdiv=1)
+    data_K = wberri.data_K.get_data_k(system_Fe_W90, dK=[0.1, 0.2, 0.3], grid=grid,
+                                      _FF_antisym=True, _CCab_antisym=True)
+    frm = formula(data_K, external_terms=external_terms)
+    NB = data_K.num_wann
+    groups = [(ik, ib1, ib2) for ik in (0, 5, 13) for ib1 in range(NB) for ib2 in (ib1, ib1 + 1, ib1 + 3, NB)
+              if ib2 <= NB]
+    ik_array = [g[0] for g in groups]
+    band_groups = [g[1:] for g in groups]
+    traces = frm.trace_batch(ik_array, band_groups, NB)
+    for (ik, ib1, ib2), tr in zip(groups, traces):
+        inn = np.arange(ib1, ib2)
+        out = np.concatenate((np.arange(0, ib1), np.arange(ib2, NB)))
+        assert tr == pytest.approx(frm.trace(ik, inn, out), rel=1e-10, abs=1e-8)
+    assert frm.trace_batch([], [], NB).shape == (0,) + (3,) * frm.ndim
+
+
 @pytest.fixture
 def check_save_result():
     def _inner(system, calc, result_type, filename="dummy"):
@@ -141,12 +165,115 @@ def test_save_KBandResult_add(system_Haldane_PythTB, check_calculator):
         res1 - res2
 
 
+@pytest.mark.parametrize("memmap", [False, True])
+def test_tabulate_collect_on_grid(system_Haldane_PythTB, tmp_path, memmap):
+    system = system_Haldane_PythTB
+    grid = wberri.Grid(system, NKFFT=[3, 3, 1], NK=[6, 6, 1])
+    tabulator = wberri.calculators.TabulatorAll(
+        {"berry": wberri.calculators.tabulate.BerryCurvature(kwargs_formula={"external_terms": False})},
+        memmap_dir=str(tmp_path) if memmap else None)
+    results = []
+    # the second and third K-points are the same, to check the averaging
+    for dK in [0, 0, 0], [1, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]:
+        data_K = wberri.data_K.get_data_k(system, dK=np.array(dK) / 6, grid=grid)
+        results.append(tabulator(data_K))
+    collected = sum(results)
+    assert collected._counts is not None
+    assert np.all(collected._counts == [2 if ((i // 6) % 2, i % 2) == (1, 0) else 1 for i in range(36)])
+    # `+` does not modify the operands
+    counts = np.copy(collected._counts)
+    berry = np.copy(collected.results["berry"].data)
+    added = collected + results[0]
+    assert added is not collected
+    assert np.all(collected._counts == counts)
+    assert np.all(collected.results["berry"].data == berry)
+    assert np.all(added._counts == counts + (np.arange(36) % 2 == 0) * ((np.arange(36) // 6) % 2 == 0))
+    assert all(res._counts is None for res in results)
+    # while axpy (used in run) and `+=` collect in place
+    accumulated = results[0].axpy(1, results[1])
+    assert accumulated.axpy(1, results[2]) is accumulated
+    accumulated_id = id(accumulated)
+    for res in results[3:]:
+        accumulated += res
+    assert id(accumulated) == accumulated_id
+    assert np.all(accumulated._counts == counts)
+    for key in "Energy", "berry":
+        assert np.all(accumulated.results[key].data == collected.results[key].data)
+    for res in results:
+        res.dense_grid = None
+    stacked = sum(results)
+    stacked.self_to_grid()
+    collected.self_to_grid()
+    assert np.all(stacked.grid == collected.grid)
+    for key in "Energy", "berry":
+        assert collected.results[key].data == pytest.approx(stacked.results[key].data, abs=1e-10)
+    assert np.all(collected.kpoints == stacked.kpoints)
+    if memmap:
+        # nothing of the size of the full grid is kept in RAM
+        assert collected._kpoints is None
+        assert isinstance(collected._counts, np.memmap)
+        for key in "Energy", "berry":
+            assert isinstance(collected.results[key].data, np.memmap)
+    for comp in None, "z":
+        quantity = None if comp is None else "berry"
+        frmsf = collected.fermiSurfer(quantity=quantity, component=comp)
+        frmsf_stacked = stacked.fermiSurfer(quantity=quantity, component=comp)
+        assert np.array(frmsf.split()[14:], dtype=float) == pytest.approx(
+            np.array(frmsf_stacked.split()[14:], dtype=float), abs=1e-7)
+        text = io.StringIO()
+        collected.write_fermiSurfer(text, quantity=quantity, component=comp, chunk=5)
+        assert text.getvalue() == frmsf
+    # when writing to a file, the text is still returned by default, but with a warning
+    fname = str(tmp_path / "berry-z")
+    with pytest.warns(FutureWarning):
+        assert collected.fermiSurfer(quantity="berry", component="z", frmsf_name=fname) == frmsf
+    assert collected.fermiSurfer(quantity="berry", component="z", frmsf_name=fname, return_text=False) is None
+    with open(fname + ".frmsf") as f:
+        assert f.read() == frmsf
+    # the points of the missing K-point are set to zero
+    partial = sum(results[:-1])
+    partial.self_to_grid()
+    missing = np.array([((i // 6) % 2, i % 2) == (0, 1) for i in range(36)])
+    for key in "Energy", "berry":
+        assert np.all(partial.results[key].data[missing] == 0)
+        assert partial.results[key].data[~missing] == pytest.approx(stacked.results[key].data[~missing], abs=1e-10)
+
+
 def test_save_EnergyResult(system_Haldane_PythTB, check_save_result):
     param = dict(Formula=frml.Identity, Efermi=Efermi_Fe, tetra=False, fder=0)
     calc = static.StaticCalculator(**param)
     check_save_result(system_Haldane_PythTB, calc, result_type=EnergyResult)
 
 
+def test_energyresult_axpy():
+    from wannierberri.result import ResultDict
+    from wannierberri.smoother import FermiDiracSmoother
+    Efermi = np.linspace(-1, 1, 21)
+    smoother = FermiDiracSmoother(Efermi, T_Kelvin=1000)
+    r1, r2, r3 = [EnergyResult(Efermi, data, smoothers=[smoother], transformTR=None, transformInv=None)
+                  for data in (np.random.random((21, 3)), np.random.random((21, 3)), 1j * np.random.random((21, 3)))]
+    expected = r1 + r2 * 0.5
+    r1.dataSmooth, r2.dataSmooth
+    res = r1.axpy(0.5, r2)
+    assert res is r1
+    assert res.data == pytest.approx(expected.data)
+    assert res._dataSmooth is not None
+    assert res._dataSmooth == pytest.approx(expected.dataSmooth)
+    # adding a complex result to a real one
+    expected = res + r3 * 2
+    res = res.iadd(r3 * 2)
+    assert res.data == pytest.approx(expected.data)
+    assert res._dataSmooth is None
+    assert res.dataSmooth == pytest.approx(expected.dataSmooth)
+    # result dictionaries
+    d1 = ResultDict({"a": r1 * 1, "b": r2 * 1})
+    d2 = ResultDict({"a": r2 * 1, "c": r3 * 1})
+    res = d1.axpy(-2, d2)
+    assert res is d1
+    assert list(res.results.keys()) == ["a"]
+    assert res.results["a"].data == pytest.approx((r1 - r2 * 2).data)
+
+
 def test_get_transform():
     from wannierberri.symmetry import transform_from_dict
     assert transform_from_dict({"asdasd": "aasd"}, "transformTR") is None
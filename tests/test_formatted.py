@@ -1,11 +1,13 @@
 """Test reading formatted Wannier90 files."""
 
 import os
+import shutil
 import numpy as np
 import pytest
 
 import wannierberri as wberri
-from wannierberri.system.w90_files import UHU, UIU, SHU, SIU, SPN
+from wannierberri.system.w90_files import UHU, UIU, SHU, SIU, SPN, MMN, mmap_fortran_records
+from wannierberri.__utility import FortranFileR, FortranFileW
 
 
 @pytest.fixture(scope="module")
@@ -96,3 +98,56 @@ def test_formatted_sXu(generate_formatted_files):
     sIu_unformatted = SIU(os.path.join(data_dir, "GaAs"))
     sIu_formatted = SIU(os.path.join(data_dir, "GaAs_formatted"), formatted=True)
     assert np.allclose(sIu_unformatted.data, sIu_formatted.data)
+
+
+def test_mmn_cache(create_files_GaAs_W90, tmp_path):
+    data_dir = create_files_GaAs_W90
+    shutil.copy(os.path.join(data_dir, "GaAs.mmn"), tmp_path)
+    seedname = os.path.join(tmp_path, "GaAs")
+    mmn_text = MMN(seedname, chunk=1000)
+    mmn_write = MMN(seedname, cache=True)
+    assert os.path.isfile(seedname + ".mmn.npy")
+    mmn_read = MMN(seedname, cache=True)
+    # the cache in another directory
+    cache_dir = os.path.join(tmp_path, "cache")
+    os.mkdir(cache_dir)
+    mmn_cache_dir = MMN(seedname, mmap=True, cache_dir=cache_dir)
+    assert os.path.isfile(os.path.join(cache_dir, "GaAs.mmn.npy"))
+    assert isinstance(mmn_cache_dir.data, np.memmap)
+    # if the cache cannot be written, the file is read without it
+    mmn_no_cache = MMN(seedname, cache=True, cache_dir=os.path.join(tmp_path, "missing"))
+    for mmn in mmn_write, mmn_read, mmn_cache_dir, mmn_no_cache:
+        assert np.all(mmn.data == mmn_text.data)
+        assert np.all(mmn.neighbours == mmn_text.neighbours)
+        assert np.all(mmn.G == mmn_text.G)
+
+
+def test_uXu_sXu_mmap(generate_formatted_files):
+    data_dir = generate_formatted_files
+    for cls in UHU, UIU, SHU, SIU:
+        data = cls(os.path.join(data_dir, "GaAs")).data
+        data_mmap = cls(os.path.join(data_dir, "GaAs"), mmap=True).data
+        assert data_mmap.shape == data.shape
+        assert np.all(data_mmap == data)
+
+
+def test_mmap_fortran_records(tmp_path):
+    NB = 3
+    rng = np.random.default_rng(0)
+    data = rng.random((2, 4, NB, NB)) + 1j * rng.random((2, 4, NB, NB))
+    fname = os.path.join(tmp_path, "records")
+    f = FortranFileW(fname)
+    f.write_record(np.frombuffer(b"header", dtype=np.uint8))
+    f.write_record(np.array([NB, 2, 4], dtype=np.int32))
+    for d in data.reshape(-1, NB, NB):
+        f.write_record(d)
+    f.write_record(np.zeros(NB, dtype=complex))  # a shorter record
+    f.close()
+    f = FortranFileR(fname)
+    for copy in True, False:
+        assert np.all(mmap_fortran_records(f, 2, (2, 4), NB, copy=copy) == data)
+    assert np.all(mmap_fortran_records(f, 3, (7,), NB) == data.reshape(-1, NB, NB)[1:])
+    # the records do not match the expected layout
+    assert mmap_fortran_records(f, 1, (8,), NB) is None
+    assert mmap_fortran_records(f, 2, (9,), NB) is None
+    assert mmap_fortran_records(f, 2, (10,), NB) is None
@@ -1,5 +1,6 @@
 """Test `wberri.run function"""
 import os
+import glob
 
 import numpy as np
 import pytest
@@ -283,6 +284,10 @@ def test_Fe(check_run, system_Fe_W90, compare_any_result, compare_fermisurfer):
                 suffix_ref=_quant + _comp,
                 fout_name_ref="tabulate_Fe_W90",
                 precision=prec)
+    # the text returned by fermiSurfer() is the same as written to the file
+    frmsf = result.results.get("tabulate").fermiSurfer(quantity="berry", component="z")
+    with open(os.path.join(OUTPUT_DIR, "berry_Fe_W90-tabulate_berry-z-run.frmsf")) as f:
+        assert f.read() == frmsf
 
 
 def test_Fe_sparse(check_run, system_Fe_W90_sparse, compare_any_result):
@@ -758,6 +763,25 @@ def test_Haldane_PythTB(check_run, system_Haldane_PythTB, compare_any_result):
         })
 
 
+def test_Haldane_save_mode_txtfinal(check_run, system_Haldane_PythTB):
+    for filename in glob.glob(os.path.join(OUTPUT_DIR, "berry_Haldane_save_mode-*")):
+        os.remove(filename)
+    calculators = {"ahc": calc.static.AHC(Efermi=Efermi_Haldane, save_mode="bin+txtfinal"),
+                   "dos": calc.static.DOS(Efermi=Efermi_Haldane, save_mode="bin")}
+    check_run(
+        system_Haldane_PythTB,
+        calculators,
+        fout_name="berry_Haldane_save_mode",
+        grid_param={'NK': [10, 10, 1], 'NKFFT': [5, 5, 1]},
+        adpt_num_iter=2,
+        do_not_compare=True)
+    for i_iter in range(3):
+        for quant in "ahc", "dos":
+            filename = os.path.join(OUTPUT_DIR, f"berry_Haldane_save_mode-{quant}_iter-{i_iter:04d}")
+            assert os.path.isfile(filename + ".npz")
+            assert os.path.isfile(filename + ".dat") == (quant == "ahc" and i_iter == 2)
+
+
 def test_GaAs_dynamic(check_run, system_GaAs_W90, compare_any_result):
     "Test shift current and injection current"
 
@@ -57,3 +57,54 @@ def test_smoother():
     assert get_smoother(e, 0.2, "Gaussian") != GaussianSmoother(e, 0.1)
     assert get_smoother(e + 0.1, 0.2, "Gaussian") != GaussianSmoother(e, 0.1)
     assert get_smoother(e, 0.1, "Gaussian") != FermiDiracSmoother(e, 0.1)
+
+
+def test_smoother_fft():
+    """the FFT convolution (wide kernels) should agree with the direct one"""
+    np.random.seed(123)
+    e = np.linspace(-1.0, 1.0, 401)
+    data = np.random.rand(3, len(e), 3) + 1j * np.random.rand(3, len(e), 3)
+    for smoother, param in [(GaussianSmoother, 0.1), (FermiDiracSmoother, 1000.0)]:
+        sm = smoother(e, param)
+        assert sm.NE1 > sm.NE1_direct_max
+        sm_direct = smoother(e, param)
+        sm_direct.NE1_direct_max = sm.NE1
+        assert sm(data, axis=1) == approx(sm_direct(data, axis=1), abs=1E-10)
+        # reference : the convolution evaluated point by point
+        ref = np.zeros(data.shape, dtype=complex)
+        for i in range(sm.NE):
+            start = max(0, i - sm.NE1)
+            end = min(sm.NE, i + sm.NE1 + 1)
+            smt = sm.smt[sm.NE1 - (i - start):sm.NE1 + (end - i)]
+            ref[:, i] = np.tensordot(data[:, start:end], smt, axes=(1, 0)) / smt.sum()
+        assert sm(data, axis=1) == approx(ref, abs=1E-10)
+
+    # identical smoothers are shared
+    assert get_smoother(e, 0.1, "Gaussian") is get_smoother(e, 0.1, "Gaussian")
+    assert get_smoother(e, 0.1, "Gaussian") is not get_smoother(e, 0.2, "Gaussian")
+
+
+def test_energyresult_smooth_incremental():
+    """the smoothed data, updated by arithmetic operations, should be equal to smoothing of the final data"""
+    from wannierberri.result import EnergyResult
+    from wannierberri.symmetry import transform_odd
+    np.random.seed(123)
+    e = np.linspace(-1.0, 1.0, 201)
+    sm = get_smoother(e, 0.1, "Gaussian")
+
+    def new_result():
+        return EnergyResult(e, np.random.rand(len(e), 3), smoothers=[sm],
+                            transformTR=transform_odd, transformInv=transform_odd)
+    res = [new_result() for i in range(4)]
+    for r in res[:3]:
+        r.dataSmooth
+    total = res[0] * 2 + res[1] - res[2] * 0.5
+    assert total._dataSmooth is not None
+    assert total.dataSmooth == approx(sm(total.data), abs=1E-10)
+    total.add(res[0])
+    assert total._dataSmooth is not None
+    assert total.dataSmooth == approx(sm(total.data), abs=1E-10)
+    # the smoothed data of res[3] are not known, so it should be evaluated from scratch
+    total = total + res[3]
+    assert total._dataSmooth is None
+    assert total.dataSmooth == approx(sm(total.data), abs=1E-10)
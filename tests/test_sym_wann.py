@@ -1,10 +1,14 @@
 """Test symmetrization of Wannier models"""
-from wannierberri.system.sym_wann import _dict_to_matrix, _matrix_to_dict, _get_H_select, _rotate_matrix
+from wannierberri.system.sym_wann import (_dict_to_matrix, _matrix_to_dict, _get_H_select, _rotate_matrix,
+                                          _rotate_matrix_array, _dict_to_dense, _unique_R, SymWann)
+from copy import deepcopy
+from types import SimpleNamespace
 import numpy as np
 import pytest
 from pytest import approx
 
 import wannierberri as wberri
+from wannierberri.system import sym_wann
 from wannierberri import calculators as calc
 
 from common_systems import (
@@ -307,3 +311,58 @@ def test_rotate_matrix():
     vec = np.random.random((num_wann, num_wann, 3)) + 1j * np.random.random((num_wann, num_wann, 3))
     assert _rotate_matrix(scal, L, R) == approx(np.einsum("lm,mn,np->lp", L, scal, R))
     assert _rotate_matrix(vec, L, R) == approx(np.einsum("lm,mna,np->lpa", L, vec, R))
+    nR = 4
+    vec_array = np.random.random((nR, num_wann, num_wann, 3)) + 1j * np.random.random((nR, num_wann, num_wann, 3))
+    rot_array = _rotate_matrix_array(vec_array, L, R)
+    for iR in range(nR):
+        assert rot_array[iR] == approx(_rotate_matrix(vec_array[iR], L, R))
+    assert _rotate_matrix_array(vec_array[:, :, :, 0], L, R) == approx(rot_array[:, :, :, 0])
+
+
+def test_dict_to_dense():
+    dic = {3: np.ones((2, 3)), 1: 2 * np.ones((2, 3))}
+    mat, mask = _dict_to_dense(dic, 5)
+    assert mask.tolist() == [False, True, False, True, False]
+    assert mat.shape == (5, 2, 3)
+    assert mat[:, 0, 0] == approx([0, 2, 0, 1, 0])
+
+
+def test_unique_R():
+    R = np.random.randint(-3, 4, size=(50, 3))
+    assert _unique_R(R).tolist() == np.unique(R, axis=0).tolist()
+    assert _unique_R(np.zeros((0, 3), dtype=int)).shape == (0, 3)
+
+
+def test_symmetrize_npar():
+    """symmetrization in parallel over pairs of atoms gives the same result as the serial one"""
+    lattice = np.array([[1, 0, 0], [-0.5, np.sqrt(3) / 2, 0], [0, 0, 1.6]]) * 5
+    n = 2
+    iRvec = np.array([[i, j, k] for i in range(-n, n + 1) for j in range(-n, n + 1) for k in range(-n, n + 1)])
+    num_wann = 8
+    XX_R = {'Ham': np.random.random((num_wann, num_wann, len(iRvec))) + 0j,
+            'AA': np.random.random((num_wann, num_wann, len(iRvec), 3)) + 0j}
+    results = []
+    for npar in 1, 2:
+        symwann = SymWann(positions=np.array([[1 / 3, 2 / 3, 0.25], [2 / 3, 1 / 3, 0.75]]),
+                          atom_name=['A', 'A'], projections=['A:sp3'], soc=False, num_wann=num_wann,
+                          lattice=lattice, iRvec=iRvec, XX_R=deepcopy(XX_R), npar=npar)
+        results.append(symwann.symmetrize())
+    (XX1, iRvec1), (XX2, iRvec2) = results
+    assert iRvec1.tolist() == iRvec2.tolist()
+    for key in XX1:
+        assert XX2[key] == approx(XX1[key], abs=1e-10)
+
+
+def _fail_on_negative(a):
+    if a < 0:
+        raise ValueError("negative")
+    return 2 * a
+
+
+@pytest.mark.parametrize("npar", [1, 2])
+def test_map_pairs(npar):
+    symwann = SimpleNamespace(npar=npar)
+    assert SymWann._map_pairs(symwann, _fail_on_negative, [(i,) for i in range(5)]) == [0, 2, 4, 6, 8]
+    with pytest.raises(ValueError, match="negative"):
+        SymWann._map_pairs(symwann, _fail_on_negative, [(1,), (-1,), (2,)])
+    assert sym_wann._map_pairs_func is None
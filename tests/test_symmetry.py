@@ -26,6 +26,48 @@ def test_symmetry_group():
     assert sym.Group([sym.Inversion, sym.C4z, sym.TimeReversal * sym.C2x]).size == 16
 
 
+@pytest.mark.parametrize("rank", [0, 1, 2, 3])
+@pytest.mark.parametrize("transformTR", [sym.transform_ident, sym.transform_odd, sym.transform_odd_conj,
+                                         sym.transform_trans])
+def test_symmetrize_tensor_projector(rank, transformTR):
+    if transformTR.transpose_axes is not None and rank != 2:
+        return
+    group = sym.Group([sym.C4z, sym.TimeReversal * sym.C2x, sym.Inversion * sym.C3z], recip_lattice=np.eye(3))
+    for transformInv in sym.transform_ident, sym.transform_odd:
+        for data in (np.random.random((5, 4) + (3,) * rank),
+                     np.random.random((5,) + (3,) * rank) + 1j * np.random.random((5,) + (3,) * rank)):
+            ref = sum(s.transform_tensor(data, rank, transformTR, transformInv) for s in group.symmetries) / group.size
+            assert group.symmetrize_tensor(data, transformTR, transformInv, rank=rank) == pytest.approx(ref)
+
+
+def test_symmetric_components():
+    group = sym.Group([sym.C4z, sym.Inversion])
+    assert group.get_symmetric_components(1, TRodd=True, Iodd=False) == ['0=x=y', 'z']
+    assert group.get_symmetric_components(2, TRodd=False, Iodd=False) == ['0=xz=yz=zx=zy', 'xx=yy', 'xy=-yx', 'zz']
+
+
+def test_mult_table_stars():
+    real_lattice = np.array([[1, 0, 0], [-0.5, np.sqrt(3) / 2, 0], [0, 0, 1.6]])
+    group = sym.Group([sym.C6z, sym.Inversion, sym.C2x, sym.TimeReversal], real_lattice=real_lattice)
+    assert group.size == 48
+    table = group.mult_table
+    for i, s1 in enumerate(group.symmetries):
+        for j, s2 in enumerate(group.symmetries):
+            assert group.symmetries[table[i, j]] == s1 * s2
+    k_array = np.random.random((20, 3))
+    k_array[:10] = np.round(k_array[:10] * 6) / 6
+    stars = group.stars(k_array)
+    for k, star in zip(k_array, stars):
+        images = np.array([s.transform_reduced_vector(k, group.recip_lattice) for s in group.symmetries])
+        # every image is in the star, and the star has no equivalent points
+        dif = images[:, None, :] - star[None, :, :]
+        assert np.all(np.abs(dif - dif.round()).max(axis=2).min(axis=1) < 1e-8)
+        dif = star[:, None, :] - star[None, :, :]
+        assert np.sum(np.abs(dif - dif.round()).max(axis=2) < 1e-8) == len(star)
+        assert group.size % len(star) == 0
+        assert group.star(k) == pytest.approx(star)
+
+
 def test_symmetry_group_failure():
     # sym.Group should fail for this generator
     with pytest.raises(RuntimeError):
@@ -201,6 +201,25 @@ def test_system_GaAs_tb(check_system, system_GaAs_tb):
     )
 
 
+@pytest.mark.parametrize("ext", ["dat", "npz"])
+def test_system_GaAs_tb_write_read(check_system, system_GaAs_tb, tmp_path, ext):
+    """write the _tb.dat (or .npz) file without the ws_distance correction, read it back and apply it"""
+    import wannierberri as wberri
+    from common_systems import symmetries_GaAs
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "GaAs_Wannier90")
+    system = wberri.system.System_tb(os.path.join(data_dir, "GaAs_tb.dat"), berry=True, use_ws=False)
+    tb_file = os.path.join(tmp_path, "GaAs_tb." + ext)
+    system.to_tb_file(tb_file)
+    system = wberri.system.System_tb(tb_file, berry=True)
+    system.set_symmetry(symmetries_GaAs)
+    check_system(
+        system, "GaAs_tb",
+        extra_properties=['wannier_centers_cart_auto'],
+        matrices=['Ham', 'AA'],
+        suffix="write_read_" + ext
+    )
+
+
 def test_system_GaAs_sym_tb_old(check_system, system_GaAs_sym_tb_old):
     check_system(
         system_GaAs_sym_tb_old, "GaAs_sym_tb",
@@ -355,3 +374,57 @@ def test_system_Mn3Sn_sym_tb(check_system, system_Mn3Sn_sym_tb):
     )
 
 # TODO : add tests for kp systems ?
+
+
+def test_system_Fe_W90_save_load(check_system, system_Fe_W90):
+    from wannierberri.system import System
+    path = os.path.join(OUTPUT_DIR, "systems", "Fe_W90_saved_npz")
+    system_Fe_W90.save_npz(path)
+    system = System.load(path)
+    assert system.symgroup.size == system_Fe_W90.symgroup.size
+    check_system(
+        system, "Fe_W90",
+        extra_properties=['mp_grid'],
+        matrices=['Ham', 'AA', 'BB', 'CC', 'SS', 'SR', 'SH', 'SHR', 'SA', 'SHA'],
+        suffix="loaded"
+    )
+
+
+def test_system_Fe_W90_lazy(check_system, create_files_Fe_W90):
+    import wannierberri as wberri
+    from common_systems import symmetries_Fe
+    system = wberri.system.System_w90(
+        os.path.join(create_files_Fe_W90, "Fe"), berry=True, morb=True, SHCqiao=True, SHCryoo=True,
+        transl_inv=False, use_wcc_phase=False, lazy_R_matrices=True)
+    system.set_symmetry(symmetries_Fe)
+    matrices = ['Ham', 'AA', 'BB', 'CC', 'SS', 'SR', 'SH', 'SHR', 'SA', 'SHA']
+    assert sorted(system.pending_R_matrices) == sorted(matrices[1:])
+    assert system.has_R_mat('CC')
+    assert system.get_R_mat('SS').shape[:3] == system.Ham_R.shape
+    assert system.R_mat_built_on_demand == ['SS']
+    check_system(
+        system, "Fe_W90",
+        extra_properties=['wannier_centers_cart_auto', 'mp_grid'],
+        matrices=matrices,
+        suffix="lazy"
+    )
+    assert system.pending_R_matrices == []
+
+
+def test_system_Fe_W90_mmap(check_system, create_files_Fe_W90, tmp_path):
+    import wannierberri as wberri
+    from common_systems import symmetries_Fe
+    # the binary copy of the .mmn file is written next to it
+    for ext in "chk", "eig", "mmn", "spn", "uHu", "uIu", "sHu", "sIu":
+        os.symlink(os.path.join(create_files_Fe_W90, "Fe." + ext), os.path.join(tmp_path, "Fe." + ext))
+    system = wberri.system.System_w90(
+        os.path.join(tmp_path, "Fe"), berry=True, morb=True, SHCqiao=True, SHCryoo=True,
+        transl_inv=False, use_wcc_phase=False, mmap_files=True)
+    assert os.path.isfile(os.path.join(tmp_path, "Fe.mmn.npy"))
+    system.set_symmetry(symmetries_Fe)
+    check_system(
+        system, "Fe_W90",
+        extra_properties=['wannier_centers_cart_auto', 'mp_grid'],
+        matrices=['Ham', 'AA', 'BB', 'CC', 'SS', 'SR', 'SH', 'SHR', 'SA', 'SHA'],
+        suffix="mmap"
+    )
@@ -94,3 +94,31 @@ def test_tetra_accurate(data):
     print("weights (old/acc):", weight_old, weight_acc)
     assert weight_old[0] == approx(data[5], abs=1e-8)
     assert weight_acc[0] == approx(data[6], abs=1e-8)
+
+
+@pytest.mark.parametrize("der", [0, 1, 2])
+def test_tetra_weights_groups(der):
+    """compare the batched evaluation of weights for all k-points and band groups with evaluation band-by-band"""
+    from wannierberri.grid.__tetrahedron import TetraWeights, TetraWeightsParal
+    np.random.seed(123)
+    nk, nb = 5, 6
+    Efermi = np.linspace(0.2, 0.8, 201)
+    eCenter = np.sort(np.random.random((nk, nb)), axis=1)
+    eCenter[:, 3] = eCenter[:, 2]  # a degenerate group
+    for tetra_class, eCorners in [
+            (TetraWeights, eCenter[:, None, :] + 0.1 * np.random.random((nk, 4, nb))),
+            (TetraWeightsParal, eCenter[:, None, None, None, :] + 0.1 * np.random.random((nk, 2, 2, 2, nb)))]:
+        tetra = tetra_class(eCenter=eCenter, eCorners=eCorners)
+        weights = tetra.weights_all_band_groups(Efermi, der=der, degen_thresh=1e-4)
+        ief = tetra.index_eFermi(Efermi)
+        for ik in range(nk):
+            for (ib1, ib2), w in weights[ik].items():
+                if der == 0 and np.all(w == 1):
+                    assert np.all(tetra.Emax[ik, ib1:ib2] < Efermi[0])
+                    continue
+                w_ref = sum(tetra.weight_1k1b(ief, ik, ib, der) for ib in range(ib1, ib2)) / (ib2 - ib1)
+                if tetra_class is TetraWeights:
+                    w_ref_direct = sum(weights_tetra(Efermi, *eCorners[ik, :, ib], der=der)
+                                       for ib in range(ib1, ib2)) / (ib2 - ib1)
+                    assert w_ref == approx(w_ref_direct, abs=1e-10)
+                assert w == approx(w_ref, abs=1e-10)
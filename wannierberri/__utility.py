@@ -153,16 +153,40 @@ def FFT(inp, axes, inverse=False, destroy=True, numthreads=1, fft='fftw'):
         raise ValueError(f"unknown type of fft : {fft}")
 
 
-def fourier_q_to_R(AA_q, mp_grid, kpt_mp_grid, iRvec, ndegen, numthreads=1, fft='fftw'):
-    print_my_name_start()
+def _fourier_q_to_R_first(AA_q, mp_grid, kpt_mp_grid, iRvec, ndegen, numthreads=1, fft='fftw'):
+    """the Fourier transform q->R, with the R index first in the result"""
     mp_grid = tuple(mp_grid)
     shapeA = AA_q.shape[1:]  # remember the shapes after q
     AA_q_mp = np.zeros(tuple(mp_grid) + shapeA, dtype=complex)
-    for i, k in enumerate(kpt_mp_grid):
-        AA_q_mp[k] = AA_q[i]
+    AA_q_mp[tuple(np.array(kpt_mp_grid).T)] = AA_q
     AA_q_mp = FFT(AA_q_mp, axes=(0, 1, 2), numthreads=numthreads, fft=fft, destroy=False)
-    AA_R = np.array([AA_q_mp[tuple(iR % mp_grid)] / nd for iR, nd in zip(iRvec, ndegen)]) / np.prod(mp_grid)
-    AA_R = AA_R.transpose((1, 2, 0) + tuple(range(3, AA_R.ndim)))
+    AA_R = AA_q_mp[tuple((np.array(iRvec) % mp_grid).T)]
+    AA_R /= (np.array(ndegen) * np.prod(mp_grid)).reshape((-1,) + (1,) * len(shapeA))
+    return AA_R
+
+
+def fourier_q_to_R(AA_q, mp_grid, kpt_mp_grid, iRvec, ndegen, numthreads=1, fft='fftw'):
+    """Fourier transform from the q-points of the Monkhorst-Pack grid to the R-vectors.
+
+    `AA_q` is an array of shape (NK, num_wann, num_wann, ...), or a dict of such arrays,
+    which are then transformed in one batched FFT call (and a dict with the same keys is returned).
+    Note that the batch needs a concatenated copy of all the arrays, so it is meant for the small ones.
+    The result is a contiguous array of shape (num_wann, num_wann, nRvec, ...)
+    """
+    print_my_name_start()
+    kwargs = dict(mp_grid=mp_grid, kpt_mp_grid=kpt_mp_grid, iRvec=iRvec, ndegen=ndegen,
+                  numthreads=numthreads, fft=fft)
+    if isinstance(AA_q, dict):
+        shapes = {key: A.shape[1:] for key, A in AA_q.items()}
+        AA_R = _fourier_q_to_R_first(
+            np.concatenate([A.reshape(A.shape[0], -1) for A in AA_q.values()], axis=1), **kwargs)
+        AA_R = np.split(AA_R, np.cumsum([int(np.prod(shape)) for shape in shapes.values()])[:-1], axis=1)
+        AA_R = {key: A.reshape((A.shape[0],) + shape) for (key, shape), A in zip(shapes.items(), AA_R)}
+        AA_R = {key: np.ascontiguousarray(A.transpose((1, 2, 0) + tuple(range(3, A.ndim))))
+                for key, A in AA_R.items()}
+    else:
+        AA_R = _fourier_q_to_R_first(AA_q, **kwargs)
+        AA_R = np.ascontiguousarray(AA_R.transpose((1, 2, 0) + tuple(range(3, AA_R.ndim))))
     print_my_name_end()
     return AA_R
 
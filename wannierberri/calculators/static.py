@@ -6,8 +6,6 @@
 
 
 import numpy as np
-from collections import defaultdict
-from math import ceil
 from copy import copy
 from ..formula import covariant as frml
 from ..formula import covariant_basic as frml_basic
@@ -20,6 +18,57 @@ from ..__utility import alpha_A, beta_A
 # particular calculators are below
 
 
+# for a band crossing the Fermi level between the points EFmin+(m-1)*dEF and EFmin+m*dEF of the grid
+# extended by `extraEf` points on each side, the contributions to Fermi levels (m+offset)
+# of the original grid are given by coef/dEF^fder.
+# This is equivalent to finite differences of the Fermi-sea result on the extended grid
+FERMI_DERIVATIVE_STENCIL = {
+    0: (np.array([0]), np.array([1.])),  # to be cumulated along the Fermi levels
+    1: (np.array([-2, -1]), np.array([0.5, 0.5])),
+    2: (np.array([-2, -1]), np.array([1., -1.])),
+    3: (np.array([-4, -3, -2, -1]), np.array([0.5, -0.5, -0.5, 0.5])),
+}
+
+
+def fermi_derivative_weights(energies, values, ik_result, nk_result, nEF, EFmin, EFmax, dEF, fder):
+    """distributes the values of band groups over the Fermi levels, according to their energies, without the
+    tetrahedron method. The contributions are scattered directly to the Fermi levels
+    using :data:`FERMI_DERIVATIVE_STENCIL`, so no extra Fermi levels and no finite differences are needed
+
+    Parameters
+    ----------
+    energies : array(ngroups)
+        the energies of the band groups (-inf for the Fermi sea below the window)
+    values : array(ngroups, ...)
+    ik_result : array(ngroups) of int
+        index of the k-point in the result to which the group contributes
+    EFmin, EFmax : float
+        the Fermi level window, extended by the points needed for the derivatives
+
+    Returns
+    -------
+    array(nk_result, nEF, ...)
+    """
+    res = np.zeros((nk_result, nEF) + values.shape[1:])
+    select = energies <= EFmax
+    energies, values, ik_result = energies[select], values[select], ik_result[select]
+    iEf = np.zeros(len(energies), dtype=int)
+    above = energies >= EFmin
+    iEf[above] = np.ceil((energies[above] - EFmin) / dEF)
+    if fder == 0:
+        # a band at EFmax may be rounded beyond the last Fermi level; it contributes to none of them
+        sel = iEf < nEF
+        np.add.at(res, (ik_result[sel], iEf[sel]), values[sel])
+        return np.cumsum(res, axis=1)
+    # bands below the window do not contribute to the Fermi surface
+    iEf, values, ik_result = iEf[above], values[above], ik_result[above]
+    for offset, coef in zip(*FERMI_DERIVATIVE_STENCIL[fder]):
+        j = iEf + offset
+        sel = (j >= 0) * (j < nEF)
+        np.add.at(res, (ik_result[sel], j[sel]), values[sel] * (coef / dEF ** fder))
+    return res
+
+
 class StaticCalculator(Calculator):
 
     def __init__(self, Efermi, tetra=False, smoother=None, constant_factor=1., use_factor=True, kwargs_formula={},
@@ -44,11 +93,12 @@ class StaticCalculator(Calculator):
         if self.hole_like and self.fder == 0:
             self.constant_factor *= -1
         if not self.tetra:
-            self.extraEf = 0 if self.fder == 0 else 1 if self.fder in (1, 2) else 2 if self.fder == 3 else None
+            if self.fder not in FERMI_DERIVATIVE_STENCIL:
+                raise NotImplementedError(f"Derivatives  d^{self.fder}f/dE^{self.fder} is not implemented")
+            self.extraEf = 0 if self.fder == 0 else 1 if self.fder in (1, 2) else 2
             self.dEF = Efermi[1] - Efermi[0] if len(Efermi) > 1 else 0.001
             self.EFmin = Efermi[0] - self.extraEf * self.dEF
             self.EFmax = Efermi[-1] + self.extraEf * self.dEF
-            self.nEF_extra = Efermi.shape[0] + 2 * self.extraEf
 
         super().__init__(**kwargs)
 
@@ -83,57 +133,41 @@ class StaticCalculator(Calculator):
                 Emax=self.Emax
             )  # here W is energy
 
-        #        """formula  - TraceFormula to evaluate
-        #           bands = a list of lists of k-points for every
         shape = (3,) * ndim
-
-        lambdadic = lambda: np.zeros(((3,) * ndim), dtype=float)
-        values = [defaultdict(lambdadic) for ik in range(nk)]
+        # evaluate the formula for all (ik, band group) at once, and store them as flat arrays
+        ik_groups = []
+        band_groups = []
+        weights_groups = []
         for ik, bnd in enumerate(weights):
-            if formula.additive:
-                for n in bnd:
-                    inn = np.arange(n[0], n[1])
-                    out = np.concatenate((np.arange(0, n[0]), np.arange(n[1], NB)))
-                    values[ik][n] = formula.trace(ik, inn, out)
-            else:
-                nnall = set([_ for n in bnd for _ in n])
-                _values = {}
-                for n in nnall:
-                    inn = np.arange(0, n)
-                    out = np.arange(n, NB)
-                    _values[n] = formula.trace(ik, inn, out)
-                for n in bnd:
-                    values[ik][n] = _values[n[1]] - _values[n[0]]
-
+            for n, w in bnd.items():
+                ik_groups.append(ik)
+                band_groups.append(n)
+                weights_groups.append(w)
+        band_groups = np.array(band_groups, dtype=int).reshape(-1, 2)
+        if formula.additive:
+            values = formula.trace_batch(ik_groups, band_groups, NB)
+        else:
+            # traces over the sea of bands below ib1 and below ib2, and take the difference
+            ng = len(ik_groups)
+            (ik_sea, ib_sea), index = np.unique(
+                np.array([ik_groups * 2, band_groups.T.reshape(-1)], dtype=int).reshape(2, -1),
+                axis=1, return_inverse=True)
+            values_sea = formula.trace_batch(ik_sea, [(0, ib) for ib in ib_sea], NB)
+            values = values_sea[index[ng:]] - values_sea[index[:ng]]
+        ik_result = np.array([ik_to_result(ik) for ik in ik_groups], dtype=int)
+
+        restot = np.zeros((nk_result,) + self.Efermi.shape + shape)
         if self.tetra:
-            # tetrahedron method
-            restot = np.zeros((nk_result,) + self.Efermi.shape + shape)
-            for ik, weights in enumerate(weights):
-                valuesik = values[ik]
-                for n, w in weights.items():
-                    restot[ik_to_result(ik)] += np.einsum("e,...->e...", w, valuesik[n])
+            # tetrahedron method : here the weights are arrays of shape Efermi
+            weights_groups = np.array(weights_groups).reshape(len(values), len(self.Efermi))
+            for ikr in np.unique(ik_result):
+                select = (ik_result == ikr)
+                restot[ikr] = np.tensordot(weights_groups[select].T, values[select], axes=1)
         else:
-            # no tetrahedron
-            restot = np.zeros((nk_result, self.nEF_extra,) + shape)
-            for ik, weights in enumerate(weights):
-                valuesik = values[ik]
-                for n, E in sorted(weights.items()):
-                    if E < self.EFmin:
-                        restot[ik_to_result(ik)] += valuesik[n][None]
-                    elif E <= self.EFmax:
-                        iEf = ceil((E - self.EFmin) / self.dEF)
-                        restot[ik_to_result(ik), iEf:] += valuesik[n]
-            if self.fder == 0:
-                pass
-            elif self.fder == 1:
-                restot = (restot[:, 2:] - restot[:, :-2]) / (2 * self.dEF)
-            elif self.fder == 2:
-                restot = (restot[:, 2:] + restot[:, :-2] - 2 * restot[:, 1:-1]) / (self.dEF ** 2)
-            elif self.fder == 3:
-                restot = (restot[:, 4:] - restot[:, :-4] - 2 * (restot[:, 3:-1] - restot[:, 1:-3])) / (
-                            2 * self.dEF ** 3)
-            else:
-                raise NotImplementedError(f"Derivatives  d^{self.fder}f/dE^{self.fder} is not implemented")
+            # no tetrahedron : here the weights are energies of the band groups
+            restot += fermi_derivative_weights(
+                np.array(weights_groups), values, ik_result, nk_result, len(self.Efermi),
+                EFmin=self.EFmin, EFmax=self.EFmax, dEF=self.dEF, fder=self.fder)
 
         restot /= data_K.cell_volume
         if not self.k_resolved:
@@ -42,15 +42,15 @@ class Tabulator(Calculator):
                         group[ik].append(n)
                         break
 
+        ik_groups = [ik for ik in range(nk) for n in band_groups[ik]]
+        groups = np.array([n for ik in range(nk) for n in band_groups[ik]], dtype=int).reshape(-1, 2)
+        values = formula.trace_batch(ik_groups, groups, NB)
+        values = values / (groups[:, 1] - groups[:, 0]).reshape((-1,) + (1,) * formula.ndim)
+        values = {(ik, tuple(n)): v for ik, n, v in zip(ik_groups, groups, values)}
         rslt = np.zeros((nk, len(ibands)) + (3, ) * formula.ndim)
         for ik in range(nk):
-            values = {}
-            for n in band_groups[ik]:
-                inn = np.arange(n[0], n[1])
-                out = np.concatenate((np.arange(0, n[0]), np.arange(n[1], NB)))
-                values[n] = formula.trace(ik, inn, out) / (n[1] - n[0])
             for ib, b in enumerate(ibands):
-                rslt[ik, ib] = values[group[ik][ib]]
+                rslt[ik, ib] = values[ik, group[ik][ib]]
         return KBandResult(rslt, transformTR=formula.transformTR, transformInv=formula.transformInv)
 
 
@@ -59,14 +59,16 @@ class TabulatorAll(Calculator):
     TabulatorAll - a pack of all k-resolved calculators (Tabulators)
     """
 
-    def __init__(self, tabulators, ibands=None, mode="grid", save_mode="frmsf", print_comment=False):
+    def __init__(self, tabulators, ibands=None, mode="grid", save_mode="frmsf", print_comment=False, memmap_dir=None):
         """ tabulators - dict 'key':tabulator
-        one of them should be "Energy" """
+        one of them should be "Energy"
+        memmap_dir - if given, the tabulated grid is stored in memory-mapped temporary files in this directory"""
         self.tabulators = tabulators
         mode = mode.lower()
         assert mode in ("grid", "path")
         self.mode = mode
         self.save_mode = save_mode
+        self.memmap_dir = memmap_dir
         if self.require_energy():
             if "Energy" not in self.tabulators.keys():
                 self.tabulators["Energy"] = Energy()
@@ -100,6 +102,9 @@ class TabulatorAll(Calculator):
             mode=self.mode,
             recip_lattice=data_K.system.recip_lattice,
             save_mode=self.save_mode,
+            dense_grid=data_K.grid.dense if self.mode == "grid" else None,
+            dK=data_K.dK,
+            memmap_dir=self.memmap_dir,
             results={k: v(data_K)
                      for k, v in self.tabulators.items()})
 
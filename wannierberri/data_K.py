@@ -376,6 +376,7 @@ class Data_K_R(_Data_K):
         self._bar_quantities = {}
         self._covariant_quantities = {}
         self._XX_R = {}
+        self._R_mat_builders = {}
 
     @property
     def HH_K(self):
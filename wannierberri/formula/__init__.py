@@ -1,5 +1,6 @@
 import numpy as np
 import abc
+from numba import njit
 """some basic classes to construct formulae for evaluation"""
 from ..symmetry import transform_ident, transform_odd, TransformProduct
 
@@ -64,6 +65,87 @@ class Formula_ln(abc.ABC):
         "Returns a trace over the `inn` states"
         return np.einsum("nn...->...", self.nn(ik, inn, out)).real
 
+    def trace_terms(self, ik):
+        r"""Returns the terms `(diag, inner, outer)` of the trace for k-points `ik` (array), such that
+        :math:`\mathrm{Tr}_{\mathrm{inn}} X = \mathrm{Re} \sum_{n \in \mathrm{inn}} \left( d_n
+        + \sum_{m \in \mathrm{inn}} I_{nm} + \sum_{l \in \mathrm{out}} O_{nl} \right)`.
+        Each term is an array of shape `(len(ik), NB, ...)` or `(len(ik), NB, NB, ...)` , or None if absent.
+        Returns None if the formula does not provide the terms, then :meth:`trace_batch` falls back to :meth:`trace`
+        """
+        return None
+
+    def trace_batch(self, ik_array, band_groups, num_wann):
+        """Returns traces for many pairs of k-point and band group at once
+
+        Parameters
+        ----------
+        ik_array : array(int)
+            indices of k-points
+        band_groups : array(int) of shape (len(ik_array), 2)
+            band groups `(ib1, ib2)`, the `inn` states are `ib1 <= n < ib2`, and `out` states are all the rest
+        num_wann : int
+            total number of bands
+
+        Returns
+        -------
+        array(float) of shape `(len(ik_array),) + (3,) * ndim`
+
+        Notes
+        -----
+        The fast path is used only by formulae that implement :meth:`trace_terms` (`Omega`, `Morb_H`, `Morb_Hpm`,
+        `tildeFab`, `tildeHab`, `tildeHGab` and their (anti)symmetric combinations, e.g. `tildeFc`, `tildeHGc`).
+        The other formulae fall back to a loop over :meth:`trace`, giving the same result without the speedup.
+        In particular, the derivatives `DerOmega`, `DerMorb`, `tildeFab_d`, `tildeHab_d`, `tildeHGab_d`
+        (and `tildeFc_d`, `tildeHGc_d`, `Der_morb`) are not accelerated: they involve the derivative
+        of `Dcov` (:class:`~wannierberri.formula.covariant.DerDcov`), which itself contains sums over the `inn` and
+        `out` states, so their traces cannot be split into the terms of :meth:`trace_terms`.
+        """
+        ik_array = np.array(ik_array, dtype=int).reshape(-1)
+        band_groups = np.array(band_groups, dtype=int).reshape(-1, 2)
+        shape = (len(ik_array),) + (3,) * self.ndim
+        if len(ik_array) == 0:
+            return np.zeros(shape)
+        ik_unique, ik_inverse = np.unique(ik_array, return_inverse=True)
+        terms = self.trace_terms(ik_unique)
+        if terms is None:
+            res = [
+                self.trace(ik, np.arange(ib1, ib2), np.concatenate((np.arange(0, ib1), np.arange(ib2, num_wann))))
+                for ik, (ib1, ib2) in zip(ik_array, band_groups)]
+            return np.array(res, dtype=float).reshape(shape)
+        ncomp = 3 ** self.ndim
+        nk = len(ik_unique)
+        diag, inner, outer = [
+            np.zeros((nk,) + (0,) * nbnd + (ncomp,), dtype=complex) if t is None else
+            np.ascontiguousarray(t, dtype=complex).reshape((nk,) + (num_wann,) * nbnd + (ncomp,))
+            for nbnd, t in zip((1, 2, 2), terms)]
+        res = _trace_band_groups(ik_inverse, band_groups[:, 0].copy(), band_groups[:, 1].copy(),
+                                 diag, inner, outer, num_wann)
+        return res.real.reshape(shape)
+
+
+@njit
+def _trace_band_groups(ik, ib1, ib2, diag, inner, outer, num_wann):
+    """sums the terms of :meth:`Formula_ln.trace_terms` over the band groups without temporary arrays"""
+    ncomp = outer.shape[-1]
+    res = np.zeros((ik.shape[0], ncomp), dtype=np.complex128)
+    for ig in range(ik.shape[0]):
+        k = ik[ig]
+        for n in range(ib1[ig], ib2[ig]):
+            for c in range(ncomp):
+                s = 0j
+                if diag.shape[1] > 0:
+                    s += diag[k, n, c]
+                if inner.shape[1] > 0:
+                    for m in range(ib1[ig], ib2[ig]):
+                        s += inner[k, n, m, c]
+                if outer.shape[1] > 0:
+                    for l in range(ib1[ig]):
+                        s += outer[k, n, l, c]
+                    for l in range(ib2[ig], num_wann):
+                        s += outer[k, n, l, c]
+                res[ig, c] += s
+    return res
+
 
 class Matrix_ln(Formula_ln):
     "anything that can be called just as elements of a matrix"
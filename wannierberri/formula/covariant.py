@@ -164,6 +164,22 @@ class Omega(Formula_ln):
         summ += summ.swapaxes(0, 1).conj()
         return summ
 
+    def trace_terms(self, ik):
+        D = self.D.matrix[ik]
+        DT = D.swapaxes(1, 2)
+        diag = inner = None
+        outer = np.zeros(D.shape, dtype=complex)
+        if self.internal_terms:
+            outer += -1j * D[..., alpha_A] * DT[..., beta_A]
+        if self.external_terms:
+            A = self.A.matrix[ik]
+            AT = A.swapaxes(1, 2)
+            diag = np.einsum("knnc->knc", self.O.matrix[ik])
+            outer += -D[..., alpha_A] * AT[..., beta_A] + D[..., beta_A] * AT[..., alpha_A]
+            inner = -2j * A[..., alpha_A] * AT[..., beta_A]
+        # the hermitian conjugate doubles the real part of the trace
+        return diag, inner, 2 * outer
+
     def ln(self, ik, inn, out):
         raise NotImplementedError()
 
@@ -299,6 +315,23 @@ class Morb_H(Formula_ln):
         summ += summ.swapaxes(0, 1).conj()
         return summ
 
+    def trace_terms(self, ik):
+        D = self.D.matrix[ik]
+        DT = D.swapaxes(1, 2)
+        E = self.E[ik][:, None, :, None]
+        diag = inner = None
+        outer = np.zeros(D.shape, dtype=complex)
+        if self.internal_terms:
+            outer += -1j * D[..., alpha_A] * E * DT[..., beta_A]
+        if self.external_terms:
+            A = self.A.matrix[ik]
+            BT = self.B.matrix[ik].swapaxes(1, 2)
+            diag = np.einsum("knnc->knc", self.C.matrix[ik])
+            outer += -D[..., alpha_A] * BT[..., beta_A] + D[..., beta_A] * BT[..., alpha_A]
+            inner = -2j * A[..., alpha_A] * E * A.swapaxes(1, 2)[..., beta_A]
+        # the hermitian conjugate doubles the real part of the trace
+        return diag, inner, 2 * outer
+
     def ln(self, ik, inn, out):
         raise NotImplementedError()
 
@@ -331,6 +364,17 @@ class Morb_Hpm(Formula_ln):
             res += self.sign * self.Eav.nn(ik, inn, out)[:, :, None] * self.O.nn(ik, inn, out)
         return res
 
+    def trace_terms(self, ik):
+        terms = self.H.trace_terms(ik)
+        if self.sign == 0:
+            return terms
+        # only the diagonal elements of Eav contribute to the trace
+        E = self.sign * self.Eav.matrix[ik].diagonal(axis1=1, axis2=2)
+        return tuple(
+            th if to is None else
+            (0 if th is None else th) + E.reshape(E.shape + (1,) * (to.ndim - 2)) * to
+            for th, to in zip(terms, self.O.trace_terms(ik)))
+
     def ln(self, ik, inn, out):
         raise NotImplementedError()
 
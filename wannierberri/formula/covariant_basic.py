@@ -11,6 +11,12 @@ Foe practical reasons more eficient formulae may be constructed (e.g. by  exclud
 some terms that cancel out). However, the following may be used as benchmark.
 """
 
+
+def _hermitian_ab(terms):
+    """the terms of the trace of `0.5 * (X + X.transpose((1, 0, 3, 2)).conj())`, given the terms of `X`"""
+    return tuple(None if t is None else 0.5 * (t + t.swapaxes(-1, -2).conj()) for t in terms)
+
+
 ########################
 #   Berry curvature    #
 ########################
@@ -54,6 +60,20 @@ class tildeFab(Formula_ln):
         summ = 0.5 * (summ + summ.transpose((1, 0, 3, 2)).conj())
         return summ
 
+    def trace_terms(self, ik):
+        D = self.D.matrix[ik][..., :, None]
+        DT = self.D.matrix[ik].swapaxes(1, 2)[..., None, :]
+        diag = inner = None
+        outer = np.zeros(D.shape[:3] + (3, 3), dtype=complex)
+        if self.internal_terms:
+            outer += -D * DT
+        if self.external_terms:
+            A = self.A.matrix[ik]
+            diag = np.einsum("knnab->knab", self.F.matrix[ik])
+            outer += 2j * D * A.swapaxes(1, 2)[..., None, :]
+            inner = -A[..., :, None] * A.swapaxes(1, 2)[..., None, :]
+        return _hermitian_ab((diag, inner, outer))
+
     def ln(self, ik, inn, out):
         raise NotImplementedError()
 
@@ -154,6 +174,25 @@ class tildeHab(Formula_ln):
         summ = 0.5 * (summ + summ.transpose((1, 0, 3, 2)).conj())
         return summ
 
+    def trace_terms(self, ik):
+        D = self.D.matrix[ik][..., :, None]
+        DT = self.D.matrix[ik].swapaxes(1, 2)[..., None, :]
+        E = self.E[ik][:, None, :, None, None]
+        diag = inner = None
+        outer = np.zeros(D.shape[:3] + (3, 3), dtype=complex)
+        if self.internal_terms:
+            outer += -D * E * DT
+        if self.external_terms:
+            A = self.A.matrix[ik]
+            AT = A.swapaxes(1, 2)[..., None, :]
+            BT = self.B.matrix[ik].swapaxes(1, 2)[..., None, :]
+            diag = np.einsum("knnab->knab", self.H.matrix[ik])
+            outer += 2j * D * BT
+            inner = -A[..., :, None] * E * AT
+            if self.correction_wcc:
+                inner += 2 * self.T_wcc.matrix[ik][..., :, None] * (BT - E * AT)
+        return _hermitian_ab((diag, inner, outer))
+
     def ln(self, ik, inn, out):
         raise NotImplementedError()
 
@@ -174,6 +213,14 @@ class tildeHGab(Formula_ln):
     def nn(self, ik, inn, out):
         return self.H.nn(ik, inn, out) + self.sign * self.E.nn(ik, inn, out)[:, :, None, None] * self.F.nn(ik, inn, out)
 
+    def trace_terms(self, ik):
+        # only the diagonal elements of Eav contribute to the trace
+        E = self.sign * self.E.matrix[ik].diagonal(axis1=1, axis2=2)
+        return tuple(
+            th if tf is None else
+            (0 if th is None else th) + E.reshape(E.shape + (1,) * (tf.ndim - 2)) * tf
+            for th, tf in zip(self.H.trace_terms(ik), self.F.trace_terms(ik)))
+
     def ln(self, ik, inn, out):
         raise NotImplementedError()
 
@@ -283,6 +330,18 @@ class AntiSymmetric(Formula_ln):
         fab = self.full.nn(ik, inn, out)
         return 1j * (fab[:, :, alpha_A, beta_A] - fab[:, :, beta_A, alpha_A])
 
+    def trace_terms(self, ik):
+        terms = self.full.trace_terms(ik)
+        if terms is None:
+            return None
+        res = []
+        for t in terms:
+            if t is not None:
+                i0 = (slice(None),) * (t.ndim - self.full.ndim)
+                t = 1j * (t[i0 + (alpha_A, beta_A)] - t[i0 + (beta_A, alpha_A)])
+            res.append(t)
+        return tuple(res)
+
     def ln(self, ik, inn, out):
         fab = self.full.ln(ik, inn, out)
         return 1j * (fab[:, :, alpha_A, beta_A] - fab[:, :, beta_A, alpha_A])
@@ -299,6 +358,15 @@ class Symmetric(Formula_ln):
         fab = self.full.nn(ik, inn, out)
         return fab + fab.swapaxes(self.axes[0] + 2, self.axes[1] + 2)
 
+    def trace_terms(self, ik):
+        terms = self.full.trace_terms(ik)
+        if terms is None:
+            return None
+        return tuple(
+            None if t is None else
+            t + t.swapaxes(t.ndim - self.ndim + self.axes[0], t.ndim - self.ndim + self.axes[1])
+            for t in terms)
+
     def ln(self, ik, inn, out):
         fab = self.full.nn(ik, inn, out)
         return fab + fab.swapaxes(self.axes[0] + 2, self.axes[1] + 2)
@@ -122,17 +122,17 @@ class Grid(GridAbstract):
         if use_symmetry:
             t0 = time()
             print("excluding symmetry-equivalent K-points from initial grid")
-            for z in range(self.div[2]):
-                for y in range(self.div[1]):
-                    for x in range(self.div[0]):
-                        KP = K_list[x][y][z]
-                        if KP is not None:
-                            star = KP.star
-                            star = [tuple(k) for k in np.array(np.round(KP.star * self.div), dtype=int) % self.div]
-                            for k in star:
-                                if k != (x, y, z):
-                                    KP.absorb(K_list[k[0]][k[1]][k[2]])
-                                    K_list[k[0]][k[1]][k[2]] = None
+            # same order as looping over z, y, x (x is the innermost)
+            ind_grid = np.array(np.meshgrid(*[range(d) for d in self.div[::-1]], indexing='ij')).reshape(3, -1).T[:, ::-1]
+            stars = self.symgroup.stars(ind_grid * dK)
+            for (x, y, z), star in zip(ind_grid, stars):
+                KP = K_list[x][y][z]
+                if KP is not None:
+                    star = [tuple(k) for k in np.array(np.round(star * self.div), dtype=int) % self.div]
+                    for k in star:
+                        if k != (x, y, z):
+                            KP.absorb(K_list[k[0]][k[1]][k[2]])
+                            K_list[k[0]][k[1]][k[2]] = None
             print("Done in {} s ".format(time() - t0))
 
         K_list = [K for Kyz in K_list for Kz in Kyz for K in Kz if K is not None]
@@ -8,8 +8,8 @@
 #                                                            #
 # ------------------------------------------------------------#
 
-from collections import defaultdict
 import numpy as np
+import lazy_property
 from numba import njit
 
 from functools import lru_cache
@@ -139,6 +139,48 @@ def weights_tetra(efall, e0, e1, e2, e3, der=0, accurate=True):
     return occ
 
 
+@njit
+def weights_tetra_groups(efall, eTetra, groups, der=0):
+    """evaluates the weights for many groups of bands at once
+
+    efall : array(nEF)
+        Fermi levels, sorted in ascending order
+    eTetra : array(nk, nb, ntetra, 4)
+        energies in the vertices of the tetrahedra
+    groups : array(ngroups, 3)
+        every row is (ik, ib1, ib2) - the k-point and the range of bands ib1:ib2
+
+    returns array(ngroups, nEF) - the weights averaged over the tetrahedra and over the bands of each group"""
+    ntetra = eTetra.shape[2]
+    nEF = len(efall)
+    res = np.zeros((groups.shape[0], nEF))
+    occ = np.zeros(nEF)
+    # number of tetrahedra completely below the Fermi level
+    nfilled = np.zeros(nEF + 1)
+    for ig in range(groups.shape[0]):
+        ik, ib1, ib2 = groups[ig, 0], groups[ig, 1], groups[ig, 2]
+        for ib in range(ib1, ib2):
+            occ[:] = 0.
+            nfilled[:] = 0.
+            for it in range(ntetra):
+                e = eTetra[ik, ib, it]
+                # outside [emin,emax] the weights are trivial (0 or 1), so evaluate only inside
+                # the margin accounts for the splitting of degenerate energies in weights_tetra
+                i1 = np.searchsorted(efall, e.min())
+                i2 = np.searchsorted(efall, e.max() + 4e-12, side='right')
+                if i2 > i1:
+                    occ[i1:i2] += weights_tetra(efall[i1:i2], e[0], e[1], e[2], e[3], der)
+                nfilled[i2] += 1
+            if der == 0:
+                occ += np.cumsum(nfilled[:nEF])
+            if ntetra > 1:
+                occ /= ntetra
+            res[ig] += occ
+        if ib2 - ib1 > 1:
+            res[ig] /= ib2 - ib1
+    return res
+
+
 # @njit
 def get_borders(A, degen_thresh, degen_Kramers=False):
     borders = [0] + list(np.where((A[1:] - A[:-1]) > degen_thresh)[0] + 1) + [len(A)]
@@ -180,8 +222,38 @@ def get_bands_above_range(emax, Eband, Ebandmin=None):
         return len(Eband)
 
 
+
+def get_bands_in_range_all(emin, emax, Eband, degen_thresh=-1, degen_Kramers=False, Ebandmin=None, Ebandmax=None):
+    """vectorized version of :func:`get_bands_in_range` for all k-points at once
+
+    Eband : array(nk, nb)
+
+    returns array(ngroups, 3), every row is (ik, ib1, ib2), sorted by ik and ib1"""
+    if Ebandmin is None:
+        Ebandmin = Eband
+    if Ebandmax is None:
+        Ebandmax = Eband
+    nk, nb = Eband.shape
+    is_border = np.ones((nk, nb + 1), dtype=bool)
+    is_border[:, 1:-1] = (Eband[:, 1:] - Eband[:, :-1]) > degen_thresh
+    if degen_Kramers:
+        is_border[:, 1::2] = False
+    ik, ib = np.nonzero(is_border)
+    groups = np.array([ik[:-1], ib[:-1], ib[1:]]).T[ik[1:] == ik[:-1]]
+    if len(groups) == 0:
+        return groups
+    borders = np.array([groups[:, 0] * nb + groups[:, 1], groups[:, 0] * nb + groups[:, 2]]).T.reshape(-1)
+    # reduceat goes up to the end of the array after the last index
+    if borders[-1] == nk * nb:
+        borders = borders[:-1]
+    groupmax = np.maximum.reduceat(Ebandmax.reshape(-1), borders)[::2]
+    groupmin = np.minimum.reduceat(Ebandmin.reshape(-1), borders)[::2]
+    return groups[(groupmax >= emin) * (groupmin <= emax)]
+
+
 class TetraWeights():
-    """the idea is to make a lazy evaluation, i.e. the weights are evaluated only once for a particular ik,ib
+    """the idea is to make a lazy evaluation, i.e. the weights are evaluated only once for a particular set
+       of Fermi levels and band groups, all k-points and bands in one call of a compiled kernel.
        the Fermi level list remains the same throughout calculation"""
 
     def __init__(self, eCenter, eCorners):
@@ -195,28 +267,33 @@ class TetraWeights():
             self.null = True
         else:
             self.null = False
-            #        self.eFermis = []
-            self.weights = []
+            self.weights = {}
             Eall = np.concatenate((self.eCenter[:, None, :], self.eCorners.reshape(self.nk, -1, self.nb)), axis=1)
             self.Emin = Eall.min(axis=1)
             self.Emax = Eall.max(axis=1)
 
+    @lazy_property.LazyProperty
+    def eTetra(self):
+        """energies in the vertices of the tetrahedra, array (nk, nb, ntetra, 4)"""
+        return np.ascontiguousarray(self.eCorners.transpose(0, 2, 1)[:, :, None, :])
+
     def weight_1k1b(self, ief, ik, ib, der):
         if self.null:
             return 0.
-        if der == -1:
-            return 1 - self.weight_1k1b(ief, ik, ib, der=0)
-        return self.weight_1k1b_priv(self.eFermis[ief], ik, ib, der=der)
-
-    def weight_1k1b_priv(self, eFermi, ik, ib, der):
-        eCorners = self.eCorners[ik, :, ib]
-        return weights_tetra(eFermi, eCorners[0], eCorners[1], eCorners[2], eCorners[3], der=der)
+        return self.weights_groups(ief, np.array([[ik, ib, ib + 1]]), der)[0]
 
-    def __weight_1b(self, ief, ik, ib, der):
-        if ib not in self.weights[ief][der][ik]:
-            self.weights[ief][der][ik][ib] = self.weight_1k1b(ief, ik, ib, der)
-        #                self.eFermis[ief], self.eCenter[ik, ib], self.eCorners[ik, :, :, :, ib], der=der)
-        return self.weights[ief][der][ik][ib]
+    def weights_groups(self, ief, groups, der):
+        """returns the weights averaged over groups of bands, array(ngroups, nEF)"""
+        if der == -1:
+            return 1 - self.weights_groups(ief, groups, der=0)
+        eFermi = self.eFermis[ief]
+        if np.all(eFermi[1:] >= eFermi[:-1]):
+            return weights_tetra_groups(eFermi, self.eTetra, groups, der)
+        else:
+            srt = np.argsort(eFermi)
+            res = np.empty((len(groups), len(eFermi)))
+            res[:, srt] = weights_tetra_groups(eFermi[srt], self.eTetra, groups, der)
+            return res
 
     def index_eFermi(self, eFermi):
         for i, eF in enumerate(self.eFermis):
@@ -231,55 +308,60 @@ class TetraWeights():
              here  the key of the return dict is a pair of integers (ib1,ib2)
         """
         ief = self.index_eFermi(eFermi)
-        #        print ("debug, index_eFermi:",ief)
         if ief < 0:
-            ief = len(self.weights)
-            self.weights.append(defaultdict(lambda: defaultdict(lambda: {})))
+            ief = len(self.eFermis)
             self.eFermis.append(eFermi)
-        res = []
-        for ik in range(self.nk):
-            bands_in_range = get_bands_in_range(
-                eFermi[0],
-                eFermi[-1],
-                self.eCenter[ik],
-                degen_thresh=degen_thresh,
-                degen_Kramers=degen_Kramers,
-                Ebandmin=self.Emin[ik],
-                Ebandmax=self.Emax[ik])
-            weights = {
-                (ib1, ib2): sum(self.__weight_1b(ief, ik, ib, der) for ib in range(ib1, ib2)) / (ib2 - ib1)
-                for ib1, ib2 in bands_in_range
-            }
-
+        key = (ief, der, degen_thresh, degen_Kramers, Emin, Emax)
+        if key not in self.weights:
+            self.weights[key] = self._weights_all_band_groups(ief, der, degen_thresh, degen_Kramers, Emin, Emax)
+        return self.weights[key]
+
+    def _weights_all_band_groups(self, ief, der, degen_thresh, degen_Kramers, Emin, Emax):
+        eFermi = self.eFermis[ief]
+        res = [{} for ik in range(self.nk)]
+        if self.null:
+            return res
+        groups = get_bands_in_range_all(eFermi[0], eFermi[-1], self.eCenter, degen_thresh=degen_thresh,
+                                        degen_Kramers=degen_Kramers, Ebandmin=self.Emin, Ebandmax=self.Emax)
+        for (ik, ib1, ib2), w in zip(groups, self.weights_groups(ief, groups, der)):
+            res[ik][(ib1, ib2)] = w
+
+        # the bands completely below (for der=0) or above (for der=-1) the range of Fermi levels
+        if der in (0, -1):
+            nb = self.nb
+            ik_first = np.unique(groups[:, 0], return_index=True)
+            ik_last = np.unique(groups[::-1, 0], return_index=True)
             if der == 0:
-                bandmax = get_bands_below_range(eFermi[0], self.eCenter[ik], Ebandmax=self.Emax[ik])
-                bandmin = get_bands_below_range(Emin, self.eCenter[ik], Ebandmax=self.Emax[ik])
-                if len(bands_in_range) > 0:
-                    bandmax = min(bandmax, bands_in_range[0][0])
-                if bandmax > bandmin:
-                    weights[(bandmin, bandmax)] = ones(len(eFermi))
-
-            if der == -1:
-                bandmin = get_bands_above_range(eFermi[-1], self.eCenter[ik], Ebandmin=self.Emin[ik])
-                bandmax = get_bands_above_range(Emax, self.eCenter[ik], Ebandmin=self.Emin[ik])
-                if len(bands_in_range) > 0:
-                    bandmin = max(bandmin, bands_in_range[-1][-1])
-                if bandmax > bandmin:
-                    weights[(bandmin, bandmax)] = ones(len(eFermi))
-
-            res.append(weights)
+                bandmax = _count_below(eFermi[0], self.Emax)
+                bandmin = _count_below(Emin, self.Emax)
+                bandmax[ik_first[0]] = np.minimum(bandmax[ik_first[0]], groups[ik_first[1], 1])
+            else:
+                bandmin = nb - _count_below(-eFermi[-1], -self.Emin[:, ::-1])
+                bandmax = nb - _count_below(-Emax, -self.Emin[:, ::-1])
+                bandmin[ik_last[0]] = np.maximum(bandmin[ik_last[0]], groups[len(groups) - 1 - ik_last[1], 2])
+            for ik in np.where(bandmax > bandmin)[0]:
+                res[ik][(bandmin[ik], bandmax[ik])] = ones(len(eFermi))
         return res
 
 
-class TetraWeightsParal(TetraWeights):
+def _count_below(emin, Ebandmax):
+    """for every k-point returns the number of the bands up to the last one with Ebandmax<emin
+    (same as get_bands_below_range, vectorized over k)"""
+    below = Ebandmax < emin
+    return np.where(below.any(axis=1), below.shape[1] - np.argmax(below[:, ::-1], axis=1), 0)
+
 
-    def weight_1k1b_priv(self, eFermi, ik, ib, der):
-        occ = np.zeros((eFermi.shape))
-        eCorner = self.eCorners[ik, ..., ib]
-        eCenter = self.eCenter[ik, ib]
+class TetraWeightsParal(TetraWeights):
 
+    @lazy_property.LazyProperty
+    def eTetra(self):
+        """every face of the parallelepiped is split in two triangles, which form tetrahedra with the center.
+        returns energies in the vertices of the 12 tetrahedra, array (nk, nb, 12, 4)"""
+        eCorner = self.eCorners
+        eTetra = []
         for iface in 0, 1:
-            for Eface in eCorner[iface, :, :], eCorner[:, iface, :], eCorner[:, :, iface]:
-                occ += weights_tetra(eFermi, eCenter, Eface[0, 0], Eface[0, 1], Eface[1, 1], der=der)
-                occ += weights_tetra(eFermi, eCenter, Eface[0, 0], Eface[1, 0], Eface[1, 1], der=der)
-        return occ / 12.
+            for Eface in eCorner[:, iface, :, :], eCorner[:, :, iface, :], eCorner[:, :, :, iface]:
+                eTetra.append([self.eCenter, Eface[:, 0, 0], Eface[:, 0, 1], Eface[:, 1, 1]])
+                eTetra.append([self.eCenter, Eface[:, 0, 0], Eface[:, 1, 0], Eface[:, 1, 1]])
+        # (12,4,nk,nb) -> (nk,nb,12,4)
+        return np.ascontiguousarray(np.array(eTetra).transpose(2, 3, 0, 1))
@@ -1,5 +1,4 @@
 import numpy as np
-from lazy_property import LazyProperty as Lazy
 from ..symmetry import transform_from_dict
 from ..smoother import VoidSmoother
 from .__result import Result
@@ -30,6 +29,9 @@ class EnergyResult(Result):
         | of the `data` array minus number of energies
     E_titles : list of str
         | titles to be printed above the energy columns
+    save_mode : str
+        | what to write in :meth:`savedata`, joined by `+` : "bin" - npz file, "txt" - text file at every iteration,
+        | "txtfinal" - text file only at the final iteration
     file_npz : str
         | path to a np file (if provided, the parameters `Enegries`, `data`, `transformTR`, `transformInv`, `rank` and
         | `E_titles` are neglected)
@@ -99,6 +101,10 @@ class EnergyResult(Result):
             self.comment = comment
 
 
+    @property
+    def save_mode(self):
+        return "+".join(self.save_modes)
+
     def set_smoother(self, smoothers):
         if smoothers is None:
             smoothers = (None, ) * self.N_energies
@@ -107,12 +113,26 @@ class EnergyResult(Result):
         assert len(smoothers) == self.N_energies
         self.smoothers = [(VoidSmoother() if s is None else s) for s in smoothers]
 
-    @Lazy
+    # smoothed data, unknown until evaluated
+    _dataSmooth = None
+
+    @property
     def dataSmooth(self):
-        data_tmp = self.data.copy()
-        for i in range(self.N_energies - 1, -1, -1):
-            data_tmp = self.smoothers[i](self.data, axis=i)
-        return data_tmp
+        """the smoothed data. Evaluated at the first call. Because smoothing is linear, after arithmetic
+        operations it is obtained from the smoothed data of the operands, if those are known"""
+        if self._dataSmooth is None:
+            data_tmp = self.data.copy()
+            for i in range(self.N_energies - 1, -1, -1):
+                data_tmp = self.smoothers[i](self.data, axis=i)
+            self._dataSmooth = data_tmp
+        return self._dataSmooth
+
+    def _set_smooth_from(self, *operands, operation):
+        """sets the smoothed data as operation(*smoothed data of operands), if all of them are known"""
+        smooth = [op._dataSmooth for op in operands]
+        if all(sm is not None for sm in smooth):
+            self._dataSmooth = operation(*smooth)
+        return self
 
     def mul_array(self, other, axes=None):
         if isinstance(axes, int):
@@ -130,7 +150,8 @@ class EnergyResult(Result):
             transformTR=self.transformTR,
             transformInv=self.transformInv,
             rank=self.rank,
-            E_titles=self.E_titles)
+            E_titles=self.E_titles,
+            save_mode=self.save_mode)
 
     def __mul__(self, number):
         if isinstance(number, int) or isinstance(number, float):
@@ -142,30 +163,35 @@ class EnergyResult(Result):
                 transformInv=self.transformInv,
                 rank=self.rank,
                 E_titles=self.E_titles,
-                comment=self.comment)
+                save_mode=self.save_mode,
+                comment=self.comment)._set_smooth_from(self, operation=lambda x: x * number)
         else:
             raise TypeError("result can only be multiplied by a number")
 
     def __truediv__(self, number):
         return self * (1. / number)
 
-    def __add__(self, other):
+    def _check_fit(self, other):
+        """check that the results may be added and return the comment for the sum"""
         if (self.transformTR is not None) and (other.transformTR is not None):
             assert self.transformTR == other.transformTR
         if (self.transformInv is not None) and (other.transformInv is not None):
             assert self.transformInv == other.transformInv
-        if other == 0:
-            return self
-        if len(self.comment) > len(other.comment):
-            comment = self.comment
-        else:
-            comment = other.comment
         for i in range(self.N_energies):
             if np.linalg.norm(self.Energies[i] - other.Energies[i]) > 1e-8:
                 raise RuntimeError(f"Adding results with different energies {i} ({self.E_titles[i]}) - not allowed")
             if self.smoothers[i] != other.smoothers[i]:
                 raise RuntimeError(
                     f"Adding results with different smoothers [{i}]: {self.smoothers[i]} and {other.smoothers[i]}")
+        if len(self.comment) > len(other.comment):
+            return self.comment
+        else:
+            return other.comment
+
+    def __add__(self, other):
+        if other == 0:
+            return self
+        comment = self._check_fit(other)
         return self.__class__(
             Energies=self.Energies,
             data=self.data + other.data,
@@ -174,30 +200,31 @@ class EnergyResult(Result):
             transformInv=self.transformInv,
             rank=self.rank,
             E_titles=self.E_titles,
-            comment=comment)
+            save_mode=self.save_mode,
+            comment=comment)._set_smooth_from(self, other, operation=lambda x, y: x + y)
+
+    def axpy(self, factor, other):
+        """adds `factor * other` to self in place, and returns self"""
+        if other == 0:
+            return self
+        self.comment = self._check_fit(other)
+        self.data = _axpy(self.data, factor, other.data)
+        if self._dataSmooth is not None:
+            if other._dataSmooth is not None:
+                self._dataSmooth = _axpy(self._dataSmooth, factor, other._dataSmooth)
+            else:
+                self._dataSmooth = None
+        return self
 
     def add(self, other):
-        self.data += other.data
+        self.axpy(1, other)
 
     def __sub__(self, other):
         return self + (-1) * other
 
-    def __write(self, data, datasm, i):
-        if i > self.N_energies:
-            raise ValueError("not allowed value i={} > {}".format(i, self.N_energies))
-        elif i == self.N_energies:
-            data_tmp = list(data.reshape(-1)) + list(datasm.reshape(-1))
-            if data.dtype == complex:
-                return ["    " + "    ".join("{0:15.6e} {1:15.6e}".format(x.real, x.imag) for x in data_tmp)]
-            elif data.dtype == float:
-                return ["    " + "    ".join("{0:15.6e}".format(x) for x in data_tmp)]
-        else:
-            return [
-                "{0:15.6e}    {1:s}".format(E, s) for j, E in enumerate(self.Energies[i])
-                for s in self.__write(data[j], datasm[j], i + 1)
-            ]
-
-    def savetxt(self, name):
+    def savetxt(self, name, chunk=2 ** 12):
+        """writes the data and the smoothed data as a text file. The numbers are formatted by
+        chunks of `chunk` lines with a single %-format call each"""
         frmt = "{0:^31s}" if self.data.dtype == complex else "{0:^15s}"
 
         def getHead(n):
@@ -210,10 +237,22 @@ class EnergyResult(Result):
             frmt.format(b) for b in getHead(self.rank) * 2) + "\n"
         name = name.format('')
 
-        open(name, "w").write(head + "\n".join(self.__write(self.data, self.dataSmooth, i=0)))
-
-
-
+        nrow = int(np.prod([len(E) for E in self.Energies]))
+        energies = np.array(np.meshgrid(*self.Energies, indexing='ij')).reshape(self.N_energies, nrow).T
+        values = np.concatenate((self.data.reshape(nrow, -1), self.dataSmooth.reshape(nrow, -1)), axis=1)
+        nval = values.shape[1]
+        if np.iscomplexobj(values):
+            value_fmt = "%15.6e %15.6e"
+            values = np.stack((values.real, values.imag), axis=-1).reshape(nrow, -1)
+        else:
+            value_fmt = "%15.6e"
+        line = "%15.6e    " * self.N_energies + "    " + "    ".join([value_fmt] * nval)
+        rows = np.concatenate((energies, values), axis=1)
+        with open(name, "w") as f:
+            f.write(head)
+            for i in range(0, nrow, chunk):
+                part = rows[i:i + chunk]
+                f.write(("" if i == 0 else "\n") + "\n".join([line] * part.shape[0]) % tuple(part.reshape(-1)))
 
     def as_dict(self):
         """
@@ -233,13 +272,13 @@ class EnergyResult(Result):
                 **energ)
 
 
-    def savedata(self, name, prefix, suffix, i_iter):
+    def savedata(self, name, prefix, suffix, i_iter, final=True):
         suffix = "-" + suffix if len(suffix) > 0 else ""
         prefix = prefix + "-" if len(prefix) > 0 else ""
         filename = prefix + name + suffix + f"_iter-{i_iter:04d}"
         if "bin" in self.save_modes:
             self.save(filename)
-        if "txt" in self.save_modes:
+        if "txt" in self.save_modes or (final and "txtfinal" in self.save_modes):
             self.savetxt(filename + ".dat")
 
     @property
@@ -258,15 +297,43 @@ class EnergyResult(Result):
     def max(self):
         return np.array([self._maxval, self._norm, self._normder])
 
+    def symmetrize(self, group):
+        def _symmetrize(data):
+            return group.symmetrize_tensor(data, rank=self.rank, transformTR=self.transformTR,
+                                           transformInv=self.transformInv)
+        return self.__class__(
+            Energies=self.Energies,
+            data=_symmetrize(self.data),
+            smoothers=self.smoothers,
+            transformTR=self.transformTR,
+            transformInv=self.transformInv,
+            rank=self.rank,
+            E_titles=self.E_titles,
+            save_mode=self.save_mode,
+            comment=self.comment)._set_smooth_from(self, operation=_symmetrize)
+
     def transform(self, sym):
+        def _transform(data):
+            return sym.transform_tensor(data, self.rank, transformTR=self.transformTR, transformInv=self.transformInv)
         return self.__class__(
             Energies=self.Energies,
-            data=sym.transform_tensor(self.data, self.rank,
-                                      transformTR=self.transformTR,
-                                      transformInv=self.transformInv),
+            data=_transform(self.data),
             smoothers=self.smoothers,
             transformTR=self.transformTR,
             transformInv=self.transformInv,
             rank=self.rank,
             E_titles=self.E_titles,
-            comment=self.comment)
+            save_mode=self.save_mode,
+            comment=self.comment)._set_smooth_from(self, operation=_transform)
+
+
+def _axpy(x, a, y):
+    """x + a * y, in place if the type of x allows"""
+    if np.can_cast(np.result_type(x, y, a), x.dtype, casting="same_kind"):
+        if a == 1:
+            x += y
+        else:
+            x += a * y
+        return x
+    else:
+        return x + a * y
@@ -119,9 +119,26 @@ class K__Result(Result):
                 transformInv=self.transformInv.as_dict()
         )
 
-    def to_grid(self, k_map):
-        dataall = self.data
-        data = np.array([sum(dataall[ik] for ik in km) / len(km) for km in k_map])
+    def to_grid(self, ind_grid, counts):
+        """average the data over the k-points mapped to the same point of the grid
+
+        Parameters
+        ----------
+        ind_grid : array(int)
+            the index of the grid point for each k-point, -1 for k-points to be skipped
+        counts : array(int)
+            the number of k-points mapped to each grid point
+        """
+        select = ind_grid >= 0
+        dataall = self.data[select].reshape(np.count_nonzero(select), -1)
+        ind_grid = ind_grid[select]
+        data = np.zeros((len(counts), dataall.shape[1]), dtype=dataall.dtype)
+        for i in range(dataall.shape[1]):
+            data[:, i] = np.bincount(ind_grid, weights=dataall[:, i].real, minlength=len(counts))
+            if np.iscomplexobj(dataall):
+                data[:, i] += 1j * np.bincount(ind_grid, weights=dataall[:, i].imag, minlength=len(counts))
+        data[counts > 0] /= counts[counts > 0, None]
+        data = data.reshape((len(counts),) + self.data.shape[1:])
         return self.__class__(data=data,
                             transformTR=self.transformTR,
                             transformInv=self.transformInv,
@@ -18,6 +18,16 @@ class Result():
     def __sub__(self, other):
         raise NotImplementedError()
 
+    # self + factor * other
+    def axpy(self, factor, other):
+        """returns `self + factor * other`. Subclasses update `self` in place and return it,
+        so the result should always be taken from the returned value"""
+        return self + other * factor
+
+    def iadd(self, other):
+        """returns `self + other`, updating `self` in place if possible (see :meth:`axpy`)"""
+        return self.axpy(1, other)
+
     # writing to a file
     def savetxt(self, name):
         raise NotImplementedError()
@@ -42,6 +52,13 @@ class Result():
     def transform(self, sym):
         raise NotImplementedError()
 
+    # average over the symmetry group
+    def symmetrize(self, group):
+        res = self.transform(group.symmetries[0])
+        for s in group.symmetries[1:]:
+            res = res.axpy(1, self.transform(s))
+        return res / group.size
+
     # a list of numbers, by each of those the refinement points will be selected
     @property
     def max(self):
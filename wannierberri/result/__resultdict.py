@@ -50,20 +50,30 @@ class ResultDict(Result):
         results = {k: self.results[k] + other.results[k] for k in self.results if k in other.results}
         return ResultDict(results)
 
+    # in place self + factor * other
+    def axpy(self, factor, other):
+        if other == 0:
+            return self
+        self.results = {k: self.results[k].axpy(factor, other.results[k]) for k in self.results if k in other.results}
+        return self
+
     # -
     def __sub__(self, other):
         return self + (-1) * other
 
     # writing to a text file
-    def savedata(self, prefix, suffix, i_iter):
+    def savedata(self, prefix, suffix, i_iter, final=True):
         for k, v in self.results.items():
-            v.savedata(k, prefix, suffix, i_iter)
+            v.savedata(k, prefix, suffix, i_iter, final=final)
 
     #  how result transforms under symmetry operations
     def transform(self, sym):
         results = {k: self.results[k].transform(sym) for k in self.results}
         return ResultDict(results)
 
+    def symmetrize(self, group):
+        return ResultDict({k: v.symmetrize(group) for k, v in self.results.items()})
+
     # a list of numbers, by each of those the refinement points will be selected
     @property
     def max(self):
@@ -1,27 +1,72 @@
 import numpy as np
 from time import time
-import multiprocessing
-import functools
+import io
+import tempfile
+import warnings
 from collections.abc import Iterable
 from .__result import Result
 
 
 class TABresult(Result):
-
-    def __init__(self, kpoints, recip_lattice, results={}, mode="grid", save_mode="frmsf"):
+    """
+    Results tabulated on a set of k-points
+
+    Parameters
+    ----------
+    dense_grid : array(int) of shape (3,)
+        the full grid on which the k-points lie, if known. Then results of different K-points (distinguished by `dK`)
+        are not stacked when added, but collected directly into arrays defined on the full grid,
+        and averaged there over k-points which are equivalent by symmetry.
+    dK : tuple(float)
+        the shift of the K-point, which the k-points belong to
+    memmap_dir : str
+        if given, the arrays on the full grid (and the counts of collected k-points)
+        are memory-mapped to temporary files in this directory, so that large grids do not need to fit into RAM.
+        The k-points of the full grid are then not stored, but generated on demand (see :meth:`grid_kpoints`)
+    """
+
+    def __init__(self, kpoints, recip_lattice, results={}, mode="grid", save_mode="frmsf",
+                 dense_grid=None, dK=None, memmap_dir=None):
         self.nband = results['Energy'].nband
         self.mode = mode
         self.grid = None
         self.gridorder = None
         self.recip_lattice = recip_lattice
-        self.kpoints = np.array(kpoints, dtype=float) % 1
+        self.kpoints = kpoints
         self.save_mode = save_mode
         self.results = results
+        self.dense_grid = None if dense_grid is None else np.array(dense_grid, dtype=int)
+        self.dK = None if dK is None else tuple(dK)
+        self.memmap_dir = memmap_dir
+        self._counts = None  # number of k-points collected at each point of the dense grid
         for k, res in results.items():
-            assert len(kpoints) == res.nk
+            assert kpoints is None or len(kpoints) == res.nk
             if hasattr(res, "nband"):
                 assert self.nband == res.nband
 
+    @property
+    def kpoints(self):
+        """the k-points in reduced coordinates. If they are not stored (results collected on the dense grid),
+        they are generated from the grid"""
+        if self._kpoints is None:
+            return self.grid_kpoints(np.arange(np.prod(self.grid)))
+        return self._kpoints
+
+    @kpoints.setter
+    def kpoints(self, kpoints):
+        self._kpoints = None if kpoints is None else np.array(kpoints, dtype=float) % 1
+
+    def grid_kpoints(self, index):
+        """the reduced coordinates of the points of the ('C'-ordered) grid with the flat indices `index`"""
+        assert self.gridorder == 'C'
+        grid1 = [np.linspace(0., 1., g, False) for g in self.grid]
+        return np.array([g1[i] for g1, i in zip(grid1, np.unravel_index(index, self.grid))]).T
+
+    @property
+    def _parameters(self):
+        return dict(recip_lattice=self.recip_lattice, mode=self.mode, save_mode=self.save_mode,
+                    dense_grid=self.dense_grid, memmap_dir=self.memmap_dir)
+
     @property
     def Enk(self):
         return self.results['Energy']
@@ -35,6 +80,17 @@ class TABresult(Result):
         return self
 
     def __add__(self, other):
+        return self._add(other, inplace=False)
+
+    def axpy(self, factor, other):
+        """adds `other` to self (the factor plays no role in tabulating). If self is already collected
+        on the dense grid, the grid storage is updated in place and returned"""
+        return self._add(other, inplace=True)
+
+    def __iadd__(self, other):
+        return self.axpy(1, other)
+
+    def _add(self, other, inplace):
         if other == 0:
             return self
         assert self.mode == other.mode
@@ -42,8 +98,73 @@ class TABresult(Result):
         if self.nband != other.nband:
             raise RuntimeError(
                 "Adding results with different number of bands {} and {} - not allowed".format(self.nband, other.nband))
+        if self._collect_on_grid(other):
+            if inplace and self._counts is not None:
+                res = self
+            else:
+                res = self._new_grid_storage(other)
+                res._collect(self)
+            res._collect(other)
+            return res
         results = {r: self.results[r] + other.results[r] for r in self.results if r in other.results}
-        return TABresult(np.vstack((self.kpoints, other.kpoints)), recip_lattice=self.recip_lattice, results=results, mode=self.mode, save_mode=self.save_mode)
+        return TABresult(np.vstack((self.kpoints, other.kpoints)), results=results, dK=self.dK, **self._parameters)
+
+    def _collect_on_grid(self, other):
+        """whether the sum should be collected on the dense grid"""
+        if self.dense_grid is None or other.dense_grid is None or np.any(self.dense_grid != other.dense_grid):
+            return False
+        return (self._counts is not None) or (other._counts is not None) or (self.dK != other.dK)
+
+    def _new_grid_storage(self, other):
+        """create an empty TABresult on the dense grid with the results present in both self and other"""
+        grid = self.dense_grid
+        ngrid = np.prod(grid)
+        results = {}
+        for r, res in self.results.items():
+            if r not in other.results:
+                continue
+            data = self._zeros((ngrid,) + res.data.shape[1:], dtype=res.data.dtype)
+            results[r] = res.__class__(data=data, transformTR=res.transformTR, transformInv=res.transformInv,
+                                       rank=res.rank, other_properties=res.other_properties)
+        storage = TABresult(None, results=results, **self._parameters)
+        storage.grid = np.copy(grid)
+        storage.gridorder = 'C'
+        storage._counts = self._zeros(ngrid, dtype=int)
+        return storage
+
+    def _zeros(self, shape, dtype):
+        """an array of zeros, memory-mapped to a temporary file if `memmap_dir` is set"""
+        if self.memmap_dir is None:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(tempfile.TemporaryFile(dir=self.memmap_dir), dtype=dtype, mode="w+", shape=shape)
+
+    def _collect(self, other):
+        """add the k-points of `other` to the averages stored on the dense grid"""
+        grid = self.dense_grid
+        if other._counts is not None:
+            ind_grid = np.where(other._counts > 0)[0]
+            weights = other._counts[ind_grid]
+            select = ind_grid
+        else:
+            # check if each k point is on the regular grid
+            kpoints_int = np.rint(other.kpoints * grid[None, :]).astype(int)
+            select = np.all(abs(kpoints_int / grid[None, :] - other.kpoints) < 1e-5, axis=1)
+            for ik in np.where(~select)[0]:
+                print(f"WARNING: k-point {ik}={other.kpoints[ik]} is not on the grid, skipping.")
+            kpoints_int = kpoints_int[select] % grid[None, :]
+            ind_grid = kpoints_int[:, 2] + grid[2] * (kpoints_int[:, 1] + grid[1] * kpoints_int[:, 0])
+            weights = np.ones(len(ind_grid), dtype=int)
+        ind_unique, ind_inverse = np.unique(ind_grid, return_inverse=True)
+        counts_old = self._counts[ind_unique]
+        counts_new = counts_old + np.bincount(ind_inverse, weights=weights, minlength=len(ind_unique)).astype(int)
+        for r, res in self.results.items():
+            data_other = other.results[r].data[select]
+            shape = (-1,) + (1,) * (data_other.ndim - 1)
+            summ = np.zeros((len(ind_unique),) + data_other.shape[1:], dtype=res.data.dtype)
+            np.add.at(summ, ind_inverse, data_other * weights.reshape(shape))
+            data = res.data
+            data[ind_unique] = (data[ind_unique] * counts_old.reshape(shape) + summ) / counts_new.reshape(shape)
+        self._counts[ind_unique] = counts_new
 
     def save(self, name):
         return  # do nothing so far
@@ -51,7 +172,7 @@ class TABresult(Result):
     def savetxt(self, name):
         return  # do nothing so far
 
-    def savedata(self, name, prefix, suffix, i_iter):
+    def savedata(self, name, prefix, suffix, i_iter, final=True):
         if i_iter > 0:
             pass  # so far do nothing on iterations, chang in future
         elif self.mode == "grid":
@@ -68,19 +189,15 @@ class TABresult(Result):
     def find_grid(self):
         """ Find the full grid."""
         # TODO: make it cleaner, to work with iterations
-        grid = np.zeros(3, dtype=int)
         kp = np.array(self.kpoints)
         kp = np.concatenate((kp, [[1, 1, 1]]))  # in case only k=0 is used in some direction
-        for i in range(3):
-            k = np.sort(kp[:, i])
-            dk = np.max(k[1:] - k[:-1])
-            grid[i] = int(np.round(1. / dk))
-        return grid
+        dk = np.max(np.diff(np.sort(kp, axis=0), axis=0), axis=0)
+        return np.round(1. / dk).astype(int)
 
     def transform(self, sym):
         results = {r: self.results[r].transform(sym) for r in self.results}
         kpoints = [sym.transform_reduced_vector(k, self.recip_lattice) for k in self.kpoints]
-        return TABresult(kpoints=kpoints, recip_lattice=self.recip_lattice, results=results, mode=self.mode, save_mode=self.save_mode)
+        return TABresult(kpoints=kpoints, results=results, dK=self.dK, **self._parameters)
 
     def to_grid(self, grid, order='C'):
         assert (self.mode == "grid")
@@ -97,19 +214,19 @@ class TABresult(Result):
         kpoints_int = kpoints_int % grid[None, :]
         ind_grid = kpoints_int[:, 2] + grid[2] * (kpoints_int[:, 1] + grid[1] * kpoints_int[:, 0])
 
-        # construct the map from the grid indices to the k-point indices
-        k_map = [[] for i in range(np.prod(grid))]
-        for ik in range(len(self.kpoints)):
-            if on_grid[ik]:
-                k_map[ind_grid[ik]].append(ik)
-            else:
-                print(f"WARNING: k-point {ik}={self.kpoints[ik]} is not on the grid, skipping.")
+        for ik in np.where(~on_grid)[0]:
+            print(f"WARNING: k-point {ik}={self.kpoints[ik]} is not on the grid, skipping.")
+        ind_grid[~on_grid] = -1
+        ngrid = np.prod(grid)
+        counts = np.bincount(ind_grid[on_grid], minlength=ngrid)
+        if np.any(counts == 0):
+            print(f"WARNING: {np.count_nonzero(counts == 0)} points of the grid have no k-points, setting them to zero")
         t0 = time()
         print("collecting")
-        results = {r: self.results[r].to_grid(k_map) for r in self.results}
+        results = {r: self.results[r].to_grid(ind_grid, counts) for r in self.results}
         t1 = time()
         print("collecting: to_grid  : {}".format(t1 - t0))
-        res = TABresult(k_new, recip_lattice=self.recip_lattice, results=results, mode=self.mode, save_mode=self.save_mode)
+        res = TABresult(k_new, results=results, **self._parameters)
         t2 = time()
         print("collecting: TABresult  : {}".format(t2 - t1))
         res.grid = np.copy(grid)
@@ -119,6 +236,8 @@ class TABresult(Result):
         return res
 
     def self_to_grid(self):
+        if self._counts is not None:
+            return  # already collected on the grid
         res = self.to_grid(self.find_grid, order='C')
         self.__dict__.update(res.__dict__)  # another dirty trick, TODO : clean it
 
@@ -144,37 +263,79 @@ class TABresult(Result):
         else:
             return self.__get_data_grid(quantity, iband, component=component, efermi=efermi)
 
-    def fermiSurfer(self, quantity=None, component=None, efermi=0, npar=0, iband=None, frmsf_name=None):
+    def fermiSurfer(self, quantity=None, component=None, efermi=0, npar=0, iband=None, frmsf_name=None,
+                    return_text=None):
+        """
+        Generate the FermiSurfer file
+
+        Parameters
+        ----------
+        frmsf_name : str or None
+            if given, the data are written to this file (the extension ``.frmsf`` is appended, if needed)
+            chunk by chunk, without holding the full text in memory
+        return_text : bool or None
+            whether to return the text, when `frmsf_name` is given. It is then read back from the file.
+            The default (None) returns it as before, but issues a `FutureWarning`: in future versions
+            the text will not be returned, when writing to a file. Pass `False` to write large grids without
+            keeping the text in memory
+        npar : int
+            kept for backward compatibility, ignored
+
+        Returns
+        -------
+        str or None
+            the content of the file (None if `frmsf_name` is given and `return_text` is False)
+        """
+        if frmsf_name is None:
+            FSfile = io.StringIO()
+            self.write_fermiSurfer(FSfile, quantity=quantity, component=component, efermi=efermi, iband=iband)
+            return FSfile.getvalue()
+        if not (frmsf_name.endswith(".frmsf")):
+            frmsf_name += ".frmsf"
+        with open(frmsf_name, "w") as FSfile:
+            self.write_fermiSurfer(FSfile, quantity=quantity, component=component, efermi=efermi, iband=iband)
+        if return_text is None:
+            warnings.warn("fermiSurfer(frmsf_name=...) will not return the text of the file in future versions. "
+                          "Pass return_text=True to keep getting it, or return_text=False to skip it",
+                          FutureWarning, stacklevel=2)
+            return_text = True
+        if return_text:
+            with open(frmsf_name) as FSfile:
+                return FSfile.read()
+        return None
+
+    def write_fermiSurfer(self, FSfile, quantity=None, component=None, efermi=0, iband=None, chunk=2 ** 16):
+        """write the FermiSurfer data to an open text file object `FSfile`,
+        band by band and `chunk` k-points at once (so the data on the full grid are never copied).
+        Returns the times (in seconds) spent on formatting the text and on writing it"""
         if iband is None:
             iband = np.arange(self.nband)
         elif isinstance(iband, int):
             iband = [iband]
-        if not (quantity is None):
-            Xnk = self.results[quantity].get_component(component)
         if self.grid is None:
             raise RuntimeError("the data should be on a grid before generating FermiSurfer files. use to_grid() method")
         if self.gridorder != 'C':
             raise RuntimeError("the data should be on a 'C'-ordered grid for generating FermiSurfer files")
-        FSfile = ""
-        FSfile += (" {0}  {1}  {2} \n".format(self.grid[0], self.grid[1], self.grid[2]))
-        FSfile += ("1 \n")  # so far only this option of Fermisurfer is implemented
-        FSfile += ("{} \n".format(len(iband)))
-        FSfile += ("".join(["  ".join("{:14.8f}".format(x) for x in v) + "\n" for v in self.recip_lattice]))
-
-        FSfile += _savetxt(a=self.Enk.data[:, iband].flatten(order='F') - efermi, npar=npar)
-
-        if quantity is None:
-            return FSfile
-
-        if quantity not in self.results:
+        if not (quantity is None or quantity in self.results):
             raise RuntimeError("requested quantity '{}' was not calculated".format(quantity))
-            return FSfile
-        FSfile += _savetxt(a=Xnk[:, iband].flatten(order='F'), npar=npar)
-        if frmsf_name is not None:
-            if not (frmsf_name.endswith(".frmsf")):
-                frmsf_name += ".frmsf"
-            open(frmsf_name, "w").write(FSfile)
-        return FSfile
+        FSfile.write(" {0}  {1}  {2} \n".format(self.grid[0], self.grid[1], self.grid[2]))
+        FSfile.write("1 \n")  # so far only this option of Fermisurfer is implemented
+        FSfile.write("{} \n".format(len(iband)))
+        FSfile.write("".join(["  ".join("{:14.8f}".format(x) for x in v) + "\n" for v in self.recip_lattice]))
+        ngrid = np.prod(self.grid)
+        times = np.zeros(2)
+        for ib in iband:
+            for start in range(0, ngrid, chunk):
+                times += _savetxt(FSfile, self.Enk.data[start:start + chunk, ib] - efermi)
+        if quantity is not None:
+            res = self.results[quantity]
+            for ib in iband:
+                for start in range(0, ngrid, chunk):
+                    part = res.__class__(data=res.data[start:start + chunk, ib:ib + 1], transformTR=res.transformTR,
+                                         transformInv=res.transformInv, rank=res.rank,
+                                         other_properties=res.other_properties)
+                    times += _savetxt(FSfile, part.get_component(component))
+        return tuple(times)
 
     def plot_path_fat(
             self,
@@ -299,42 +460,32 @@ class TABresult(Result):
 def write_frmsf(frmsf_name, Ef0, numproc, quantities, res, suffix=""):
     if len(suffix) > 0:
         suffix = "-" + suffix
+    ttxt = 0
+    twrite = 0
     if frmsf_name is not None:
-        open(f"{frmsf_name}_E{suffix}.frmsf", "w").write(res.fermiSurfer(quantity=None, efermi=Ef0, npar=numproc))
-        ttxt = 0
-        twrite = 0
-        for Q in quantities:
-            for comp in res.results[Q].get_component_list():
-                t31 = time()
-                txt = res.fermiSurfer(quantity=Q, component=comp, efermi=Ef0, npar=numproc)
-                t32 = time()
-                open(f"{frmsf_name}_{Q}-{comp}{suffix}.frmsf", "w").write(txt)
-                t33 = time()
-                ttxt += t32 - t31
-                twrite += t33 - t32
-    else:
-        ttxt = 0
-        twrite = 0
+        files = [(f"{frmsf_name}_E{suffix}.frmsf", None, None)]
+        files += [(f"{frmsf_name}_{Q}-{comp}{suffix}.frmsf", Q, comp)
+                  for Q in quantities for comp in res.results[Q].get_component_list()]
+        for fname, Q, comp in files:
+            with open(fname, "w") as FSfile:
+                t_txt, t_write = res.write_fermiSurfer(FSfile, quantity=Q, component=comp, efermi=Ef0)
+            ttxt += t_txt
+            twrite += t_write
     return ttxt, twrite
 
 
-def _savetxt(limits=None, a=None, fmt=".8f", npar=0):
-    assert a.ndim == 1, "only 1D arrays are supported. found shape{}".format(a.shape)
-    if npar is None:
-        npar = multiprocessing.cpu_count()
-    if npar <= 0:
-        if limits is None:
-            limits = (0, a.shape[0])
-        fmtstr = "{0:" + fmt + "}\n"
-        return "".join(fmtstr.format(x) for x in a[limits[0]:limits[1]])
-    else:
-        if limits is not None:
-            raise ValueError("limits shpould not be used in parallel mode")
-        nppproc = a.shape[0] // npar + (1 if a.shape[0] % npar > 0 else 0)
-        print("using a pool of {} processes to write txt frmsf of {} points per process".format(npar, nppproc))
-        asplit = [(i, i + nppproc) for i in range(0, a.shape[0], nppproc)]
-        p = multiprocessing.Pool(npar)
-        res = p.map(functools.partial(_savetxt, a=a, fmt=fmt, npar=0), asplit)
-        p.close()
-        p.join()
-        return "".join(res)
+def _savetxt(fout, a, fmt="%.8f", chunk=2 ** 16):
+    """write the array `a` (flattened in C order) to the open file `fout`, one number per line,
+    formatting and writing `chunk` numbers at once. Returns the times spent on formatting and on writing"""
+    a = np.ascontiguousarray(a).reshape(-1)
+    line = fmt + "\n"
+    ttxt = twrite = 0
+    for i in range(0, a.shape[0], chunk):
+        part = a[i:i + chunk]
+        t0 = time()
+        txt = (line * part.shape[0]) % tuple(part)
+        t1 = time()
+        fout.write(txt)
+        ttxt += t1 - t0
+        twrite += time() - t1
+    return ttxt, twrite
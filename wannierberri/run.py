@@ -38,6 +38,15 @@ def print_progress(count, total, t0, tprev, print_progress_step):
     return tprev
 
 
+def _axpy(result, factor, other):
+    """returns result + factor * other, updating `result` in place. `None` values are treated as zero"""
+    if other is None:
+        return result
+    if result is None:
+        return other * factor
+    return result.axpy(factor, other)
+
+
 def process(paralfunc, K_list, parallel, symgroup=None, remote_parameters={}, print_progress_step=5):
     print(f"symgroup : {symgroup}")
     t0 = time()
@@ -214,6 +223,8 @@ def run(
     remote_parameters = {'_system': system, '_grid': grid, 'npar_k': parallel.npar_k, '_calculators': calculators}
     if parallel.method == 'ray':
         ray = parallel.ray
+        # the remote copies of the system cannot build the postponed matrices
+        system.build_R_mat()
         remote_parameters = {k: ray.put(v) for k, v in remote_parameters.items()}
 
         @ray.remote
@@ -335,17 +346,27 @@ def run(
 
         time0 = time()
 
+        if i_iter < adpt_num_iter:
+            # the smoothed results of the new K-points are needed for the refinement anyway.
+            # Evaluating them before the summation allows to update the smoothed total result incrementally
+            for kp in K_list[nk_prev:]:
+                kp.max
+
         if (result_all is None) or (not fast_iter):
-            result_all = sum(kp.get_res for kp in K_list)
+            result_all = None
+            K_list_add = K_list
         else:
-            if result_excluded is not None:
-                result_all -= result_excluded
-            result_all += sum(kp.get_res for kp in K_list[nk_prev:])
+            result_all = _axpy(result_all, -1, result_excluded)
+            K_list_add = K_list[nk_prev:]
+        for kp in K_list_add:
+            kp.check_evaluated
+            result_all = _axpy(result_all, kp.factor, kp.res)
 
         time1 = time()
         print("time1 = ", time1 - time0)
         if not (restart and i_iter == 0):
-            result_all.savedata(prefix=fout_name, suffix=suffix, i_iter=i_iter + start_iter)
+            result_all.savedata(prefix=fout_name, suffix=suffix, i_iter=i_iter + start_iter,
+                                final=(i_iter >= adpt_num_iter))
 
         if i_iter >= adpt_num_iter:
             break
@@ -364,14 +385,11 @@ def run(
         nk_prev = nk
 
         for iK in select_points:
-            results = K_list[iK].get_res
+            prev_factor = K_list[iK].factor
             K_list += K_list[iK].divide(adpt_mesh, periodic=system.periodic, use_symmetry=use_irred_kpt)
             if abs(K_list[iK].factor) < 1.e-10:
                 excluded_Klist.append(iK)
-                if result_excluded is None:
-                    result_excluded = results - K_list[iK].get_res
-                else:
-                    result_excluded += results - K_list[iK].get_res
+                result_excluded = _axpy(result_excluded, prev_factor - K_list[iK].factor, K_list[iK].res)
 
         if use_irred_kpt and isinstance(grid, Grid):
             print("checking for equivalent points in all points (of new  {} points)".format(len(K_list) - l1))
@@ -383,7 +401,7 @@ def run(
         print("sum of weights now :{}".format(sum(Kp.factor for Kp in K_list)))
 
         for iK, prev_factor in weight_changed_old.items():
-            result_excluded += K_list[iK].res * (prev_factor - K_list[iK].factor)
+            result_excluded = _axpy(result_excluded, prev_factor - K_list[iK].factor, K_list[iK].res)
 
         if do_write_Klist:
             print(f"Writing file_Klist_factor_changed to {file_Klist_factor_changed}")
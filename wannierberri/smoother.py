@@ -1,4 +1,6 @@
 from scipy.constants import Boltzmann, elementary_charge
+from scipy.signal import oaconvolve
+from lazy_property import LazyProperty as Lazy
 import abc
 import numpy as np
 
@@ -45,27 +47,54 @@ class AbstractSmoother(abc.ABC):
         return f"<{type(self).__name__}>"
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if type(self) != type(other):
             return False
         else:
             for param in self._params:
-                if not np.allclose(getattr(self, param), getattr(other, param)):
+                a, b = getattr(self, param), getattr(other, param)
+                if np.shape(a) != np.shape(b) or not np.allclose(a, b):
                     return False
         return True
 
+    # for narrow kernels the direct convolution is faster than FFT
+    NE1_direct_max = 16
+
     def __call__(self, A, axis=0):
         """Apply smoother to ``A`` along the given axis"""
         assert self.E.shape[0] == A.shape[axis]
-        A = A.transpose((axis, ) + tuple(range(0, axis)) + tuple(range(axis + 1, A.ndim)))
-        res = np.zeros(A.shape, dtype=A.dtype)
-        # TODO maybe change tensordot to numba
-        for i in range(self.NE):
-            start = max(0, i - self.NE1)
-            end = min(self.NE, i + self.NE1 + 1)
-            start1 = self.NE1 - (i - start)
-            end1 = self.NE1 + (end - i)
-            res[i] = np.tensordot(A[start:end], self.smt[start1:end1], axes=(0, 0)) / self.smt[start1:end1].sum()
-        return res.transpose(tuple(range(1, axis + 1)) + (0, ) + tuple(range(axis + 1, A.ndim)))
+        A = np.moveaxis(A, axis, 0)
+        if self.NE1 <= self.NE1_direct_max:
+            res = self._convolve_direct(A)
+        else:
+            # the part of the kernel wider than the energy range does not contribute
+            width = min(self.NE1, self.NE - 1)
+            kernel = self.smt[self.NE1 - width:self.NE1 + width + 1][::-1]
+            kernel = kernel.reshape((-1, ) + (1, ) * (A.ndim - 1))
+            res = oaconvolve(A, kernel, mode='same', axes=0)
+        res /= self.norm.reshape((-1, ) + (1, ) * (A.ndim - 1))
+        return np.moveaxis(res, 0, axis)
+
+    def _convolve_direct(self, A):
+        """convolution along the axis 0, by summing the shifted arrays"""
+        res = np.zeros(A.shape, dtype=np.result_type(A.dtype, self.smt.dtype))
+        for d in range(max(-self.NE1, 1 - self.NE), min(self.NE1, self.NE - 1) + 1):
+            if d >= 0:
+                res[:self.NE - d] += self.smt[self.NE1 + d] * A[d:]
+            else:
+                res[-d:] += self.smt[self.NE1 + d] * A[:self.NE + d]
+        return res
+
+    @Lazy
+    def norm(self):
+        """the sum of the kernel within the energy range, for every energy point.
+        Used to normalize the result near the edges of the range"""
+        i = np.arange(self.NE)
+        start = np.maximum(0, self.NE1 - i)
+        end = np.minimum(2 * self.NE1 + 1, self.NE1 + self.NE - i)
+        smt_cumsum = np.concatenate(([0.], np.cumsum(self.smt)))
+        return smt_cumsum[end] - smt_cumsum[start]
 
 
 class FermiDiracSmoother(AbstractSmoother):
@@ -164,8 +193,19 @@ def get_smoother(energy, smear, mode=None):
     if len(energy) <= 1:
         return VoidSmoother()
     if mode == "Fermi-Dirac":
-        return FermiDiracSmoother(energy, smear)
+        smoother = FermiDiracSmoother(energy, smear)
     elif mode == "Gaussian":
-        return GaussianSmoother(energy, smear)
+        smoother = GaussianSmoother(energy, smear)
     else:
         raise ValueError("Smoother mode not recognized.")
+    # re-use an identical smoother, if it was created before, so that the results can share it
+    for sm in _smoothers_cache:
+        if sm == smoother:
+            return sm
+    _smoothers_cache.append(smoother)
+    del _smoothers_cache[:-_smoothers_cache_size]
+    return smoother
+
+
+_smoothers_cache = []
+_smoothers_cache_size = 16
@@ -50,6 +50,7 @@ from packaging import version as pversion
 
 from scipy.spatial.transform import Rotation as rotmat
 from copy import deepcopy
+import lazy_property
 from .__utility import real_recip_lattice
 from collections.abc import Iterable
 
@@ -98,6 +99,12 @@ class Symmetry():
     def __eq__(self, other):
         return np.linalg.norm(self.R - other.R) < 1e-12 and self.TR == other.TR and self.Inv == other.Inv
 
+    @property
+    def key(self):
+        """hashable key identifying the symmetry operation (rotation matrix rounded to integers
+        in units of SYMMETRY_PRECISION, TR and Inv)"""
+        return (np.round(self.R / SYMMETRY_PRECISION).astype(int).tobytes(), self.TR, self.Inv)
+
     def copy(self):
         return deepcopy(self)
 
@@ -242,12 +249,21 @@ class Group():
         if len(sym_list) == 0:
             sym_list = [Identity]
 
+        keys = {}
+        unique = []
+        for s in sym_list:
+            if s.key not in keys:
+                keys[s.key] = len(unique)
+                unique.append(s)
+        sym_list = unique
+
         while True:
             lenold = len(sym_list)
             for s1 in sym_list:
                 for s2 in sym_list:
                     s3 = s1 * s2
-                    if s3 not in sym_list:
+                    if s3.key not in keys:
+                        keys[s3.key] = len(sym_list)
                         sym_list.append(s3)
                         if len(sym_list) > 1000:
                             raise RuntimeError("Cannot define a finite group")
@@ -255,6 +271,8 @@ class Group():
                 break
 
         self.symmetries = sym_list
+        self._keys = keys
+        self._projectors = {}
         msg_not_symmetric = (
                 " : please check if  the symmetries are consistent with the lattice vectors," +
                 " and that  enough digits were written for the lattice vectors (at least 6-7 after coma)")
@@ -294,7 +312,7 @@ class Group():
         return sum(s.transform_polar_vector(res) for s in self.symmetries) / self.size
 
     def symmetrize(self, result):
-        return sum(result.transform(s) for s in self.symmetries) / self.size
+        return result.symmetrize(self)
 
     def gen_symmetric_tensor(self, rank, TRodd, Iodd):
         r"""generates a random tensor, which respects the given symmetry pointgroup. May be used to get an idea, what components of the tensr are allowed by the symmetry.
@@ -313,7 +331,9 @@ class Group():
         `numpy.array(float)`
              :math:`3 \times 3\times \ldots` array respecting the symmetry
         """
-        A = self.symmetrize_tensor(np.random.random((3,) * rank), TRodd=TRodd, Iodd=Iodd)
+        A = self.symmetrize_tensor(np.random.random((3,) * rank),
+                                   transformTR=transform_odd if TRodd else transform_ident,
+                                   transformInv=transform_odd if Iodd else transform_ident)
         A[abs(A) < 1e-14] = 0
         return A
 
@@ -368,17 +388,83 @@ class Group():
         shape = np.array(data.shape)
         assert np.all(shape[dim - rank:dim] == 3), "the last rank={} dimensions should be 3, found : {}".format(
             rank, shape)
-        return sum(s.transform_tensor(data, rank=rank,
-                                      transformTR=transformTR, transformInv=transformInv)
-                   for s in self.symmetries) / self.size
+        for transform in transformTR, transformInv:
+            if getattr(transform, "transpose_axes", None) is not None and len(transform.transpose_axes) > rank:
+                # the transform acts not only on the cartesian indices
+                return sum(s.transform_tensor(data, rank=rank, transformTR=transformTR, transformInv=transformInv)
+                           for s in self.symmetries) / self.size
+        P, Q = self.projector(rank, transformTR, transformInv)
+        n = 3 ** rank
+        data_flat = data.reshape(data.shape[:dim - rank] + (n,))
+        if np.iscomplexobj(data):
+            res = data_flat @ P.T + data_flat.conj() @ Q.T
+        else:
+            res = data_flat @ (P + Q).real.T
+        return res.reshape(data.shape)
+
+    def projector(self, rank, transformTR, transformInv):
+        r"""Returns the group average of the transformations of a rank-`rank` tensor, as :math:`3^r\times 3^r`
+        matrices `P` and `Q` acting on the flattened cartesian indices, such that the symmetrized tensor is
+        :math:`P x + Q x^*` (`Q` is nonzero for the antiunitary transformations involving complex conjugation).
+        The matrices are evaluated once per group and stored."""
+        key = (rank, str(transformTR), str(transformInv))
+        if key not in self._projectors:
+            n = 3 ** rank
+            basis = np.eye(n).reshape((n,) + (3,) * rank)
+            T_re, T_im = [
+                sum(s.transform_tensor(b, rank=rank, transformTR=transformTR, transformInv=transformInv)
+                    for s in self.symmetries).reshape(n, n).T / self.size
+                for b in (basis, 1j * basis)]
+            self._projectors[key] = ((T_re - 1j * T_im) / 2, (T_re + 1j * T_im) / 2)
+        return self._projectors[key]
+
+    def index(self, sym):
+        """returns the position of `sym` in the list of symmetries (raises KeyError if it is not in the group)"""
+        return self._keys[sym.key]
+
+    @lazy_property.LazyProperty
+    def mult_table(self):
+        """multiplication table : `mult_table[i, j]` is the index of `symmetries[i] * symmetries[j]`"""
+        return np.array([[self.index(s1 * s2) for s2 in self.symmetries] for s1 in self.symmetries], dtype=int)
+
+    @lazy_property.LazyProperty
+    def reduced_matrices(self):
+        """(nsym, 3, 3) array of matrices transforming k-vectors in reduced coordinates (`k @ M`)"""
+        basis = self.recip_lattice
+        basis_inv = np.linalg.inv(basis)
+        return np.array([(basis @ S.R.T @ basis_inv) * (S.iTR * S.iInv) for S in self.symmetries])
+
+    def stars(self, k_array, chunk=256):
+        """returns the stars of an array of k-vectors (in reduced coordinates)
+
+        Parameters
+        ----------
+        k_array : array(nk, 3)
+            k-vectors in reduced coordinates
+        chunk : int
+            number of k-vectors processed at once (limits memory usage)
+
+        Returns
+        -------
+        list of array(nstar, 3)
+            for each k-vector, its images under the symmetries of the group.
+            Images equivalent (up to a reciprocal lattice vector) to an earlier one are excluded,
+            so the order follows `self.symmetries`
+        """
+        k_array = np.array(k_array, dtype=float).reshape(-1, 3)
+        nsym = self.size
+        earlier = np.tril(np.ones((nsym, nsym), dtype=bool), -1)  # earlier[i, j] = j < i
+        result = []
+        for start in range(0, k_array.shape[0], chunk):
+            st = np.einsum("ka,sab->ksb", k_array[start:start + chunk], self.reduced_matrices)
+            diff = st[:, :, None, :] - st[:, None, :, :]
+            same = np.linalg.norm(diff - diff.round(), axis=-1) < SYMMETRY_PRECISION
+            duplicate = np.any(same & earlier[None], axis=2)
+            result += [s[~d] for s, d in zip(st, duplicate)]
+        return result
 
     def star(self, k):
-        st = [S.transform_reduced_vector(k, self.recip_lattice) for S in self.symmetries]
-        for i in range(len(st) - 1, 0, -1):
-            diff = np.array(st[:i]) - np.array(st[i])[None, :]
-            if np.linalg.norm(diff - diff.round(), axis=-1).min() < SYMMETRY_PRECISION:
-                del st[i]
-        return np.array(st)
+        return self.stars(k)[0]
 
 
 ########
@@ -3,8 +3,11 @@ import spglib
 from .sym_wann_orbitals import Orbitals
 from irrep.spacegroup import SymmetryOperation
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import multiprocessing
+from time import time
 import lazy_property
-import copy
 
 
 class SymWann():
@@ -12,7 +15,8 @@ class SymWann():
     default_parameters = {
             'soc': False,
             'magmom': None,
-            'DFT_code': 'qe'}
+            'DFT_code': 'qe',
+            'npar': 1}
 
     __doc__ = """
     Symmetrize wannier matrices in real space: Ham_R, AA_R, BB_R, SS_R,...
@@ -48,6 +52,11 @@ class SymWann():
     DFT_code: str
         ``'qe'`` or ``'vasp'``   Default: ``{DFT_code}``
         vasp and qe have different orbitals arrangement with SOC.
+    npar: int
+        number of processes used to symmetrize the matrix elements (the pairs of atoms are distributed
+        between processes, forked from the current one; threads are used instead, where fork is not available).
+        The input matrices are shared with the forked processes (copy-on-write), but each of them needs memory
+        for the blocks it computes and its temporary arrays. Default: ``{npar}``
 
     Return
     ------
@@ -75,6 +84,11 @@ class SymWann():
         self.iRvec = [tuple(R) for R in iRvec]
         self.iRvec_index = {r: i for i, r in enumerate(self.iRvec)}
         self.nRvec = len(self.iRvec)
+        # table for the vectorized search of R-vectors: R -> index (or -1)
+        iRvec_array = np.array(self.iRvec, dtype=int).reshape(-1, 3)
+        self._iRvec_min = iRvec_array.min(axis=0)
+        self._iRvec_table = -np.ones(iRvec_array.max(axis=0) - self._iRvec_min + 1, dtype=int)
+        self._iRvec_table[tuple((iRvec_array - self._iRvec_min).T)] = np.arange(self.nRvec)
         self.num_wann = num_wann
         self.lattice = lattice
         self.positions = positions
@@ -379,6 +393,14 @@ class SymWann():
         except KeyError:
             return None
 
+    def index_R_array(self, R):
+        """vectorized version of `index_R` for an array of R-vectors (nR,3). Returns -1 for the missing ones"""
+        R = np.asarray(R, dtype=int) - self._iRvec_min
+        inside = np.all((R >= 0) & (R < self._iRvec_table.shape), axis=-1)
+        result = -np.ones(R.shape[:-1], dtype=int)
+        result[inside] = self._iRvec_table[tuple(R[inside].T)]
+        return result
+
     def symmetrize(self, method="new"):
         # TODO : eventually remove the "old"
         if method == "old":
@@ -449,51 +471,68 @@ class SymWann():
         Return
         --------
         dict { (a,b):set([index of Rvecotr, if it is irreducible])}
+
+        Notes
+        -----
+        The set (iR,a,b) is irreducible if it is the smallest (in the lexicographic order of (a,b,iR))
+        among its images (which are present in the list of R-vectors) under all symmetry operations.
         """
         print("searching irreducible Rvectors for pairs of a,b")
 
         R_list = np.array(self.iRvec, dtype=int)
-        irreducible = np.ones((self.nRvec, self.num_wann_atom, self.num_wann_atom), dtype=bool)
-
-#  Alternative implementation - not sure if it can behave differently
-#        for symop in self.symmetry_operations:
-#            if symop.sym_only or symop.sym_T:
-#                print('symmetry operation  ', symop.ind)
-#                R_map = np.dot(R_list, np.transpose(symop.rotation))
-#                atom_R_map = R_map[:, None, None, :] - symop.vec_shift[None, :, None, :] + symop.vec_shift[None, None, :, :]
-#                for a in range(self.num_wann_atom):
-#                    a1 = symop.rot_map[a]
-#                    for b in range(self.num_wann_atom):
-#                        b1 = symop.rot_map[b]
-#                        for iR in range(self.nRvec):
-#                            if irreducible[iR,a,b]:
-#                                iR1 = self.index_R(atom_R_map[iR, a, b])
-#                                if iR1 is not None and not (a,b,iR) == (a1,b1,iR1):
-#                                    irreducible[iR1,a1,b1]=False
-
-        for a in range(self.num_wann_atom):
-            for b in range(self.num_wann_atom):
-                for symop in self.symmetry_operations:
-                    if symop.sym_only or symop.sym_T:
-                        print('symmetry operation  ', symop.ind)
-                        a1 = symop.rot_map[a]
-                        b1 = symop.rot_map[b]
-                        if (a1, b1) >= (a, b):
-                            R_map = np.dot(R_list, np.transpose(symop.rotation))
-                            atom_R_map = R_map[:, None, None, :] - symop.vec_shift[None, :, None, :] + symop.vec_shift[None, None, :, :]
-                            for iR in range(self.nRvec):
-                                if irreducible[iR, a, b]:
-                                    iR1 = self.index_R(atom_R_map[iR, a, b])
-                                    if iR1 is not None and (a1, b1, iR1) > (a, b, iR):
-                                        irreducible[iR1, a1, b1] = False
+        nRvec, num_wann_atom = self.nRvec, self.num_wann_atom
+        # key[iR,a,b] defines the lexicographic order of (a,b,iR)
+        key = (np.arange(num_wann_atom)[None, :, None] * num_wann_atom + np.arange(num_wann_atom)[None, None, :]
+               ) * nRvec + np.arange(nRvec)[:, None, None]
+        min_key = np.copy(key)
+        for symop in self.symmetry_operations:
+            if symop.sym_only or symop.sym_T:
+                R_map = np.dot(R_list, np.transpose(symop.rotation))
+                key_b1 = symop.rot_map[None, :] * nRvec
+                for a in range(num_wann_atom):
+                    iR1 = self.index_R_array(R_map[:, None, :] - symop.vec_shift[a] + symop.vec_shift[None, :, :])
+                    key1 = symop.rot_map[a] * num_wann_atom * nRvec + key_b1 + iR1
+                    key1[iR1 < 0] = key[:, a, :][iR1 < 0]
+                    np.minimum(min_key[:, a, :], key1, out=min_key[:, a, :])
+        irreducible = (min_key == key)
 
         print(f"Found {np.sum(irreducible)} sets of (R,a,b) out of the total {self.nRvec*self.num_wann_atom**2} ({self.nRvec}*{self.num_wann_atom}^2)")
-        dic = {(a, b): set([iR for iR in range(self.nRvec)  if irreducible[iR, a, b]])
-               for a in range(self.num_wann_atom)  for b in range(self.num_wann_atom)}
+        dic = {(a, b): set(np.where(irreducible[:, a, b])[0].tolist())
+               for a in range(self.num_wann_atom) for b in range(self.num_wann_atom)}
         res = {k: v for k, v in dic.items() if len(v) > 0}
         return res
 
 
+    def _map_pairs(self, func, args_list):
+        """
+        evaluates `func(*args)` for all `args` in `args_list` (one item per pair of atoms),
+        using `npar` processes (or threads, if processes cannot be forked), and reports the progress.
+        Returns the list of results (in the same order)
+        """
+        npairs = len(args_list)
+        if self.npar > 1 and "fork" in multiprocessing.get_all_start_methods():
+            # `func` is handed to the forked processes (without pickling) by the initializer,
+            # and the processes share the tables referenced by it
+            executor = multiprocessing.get_context("fork").Pool(
+                self.npar, initializer=_map_pairs_init, initargs=(func,))
+            get_iterator = lambda: executor.imap(_map_pairs_call, args_list)
+        elif self.npar > 1:
+            executor = ThreadPoolExecutor(max_workers=self.npar)
+            get_iterator = lambda: executor.map(lambda args: func(*args), args_list)
+        else:
+            executor = nullcontext()
+            get_iterator = lambda: (func(*args) for args in args_list)
+        t0 = time()
+        step = max(1, npairs // 10)
+        results = []
+        # the pool is terminated (and the threads are joined) also if an exception is raised
+        with executor:
+            for i, res in enumerate(get_iterator()):
+                results.append(res)
+                if (i + 1) % step == 0 or i + 1 == npairs:
+                    print(f"symmetrized {i + 1} of {npairs} pairs of atoms ({time() - t0:.1f} s)")
+        return results
+
     def average_H_irreducible(self, iRab_new, matrix_dict_in, iRvec_new, mode):
         """
         Return
@@ -503,87 +542,107 @@ class SymWann():
                 {"Ham":{ (a,b):{iR:mat} }, "AA":{...}, ...} , where iR is the index of R-vector in the old set of R-vectors
         """
         assert mode in ["sum", "single"]
-        iRab_new = copy.deepcopy(iRab_new)
         iRvec_new_array = np.array(iRvec_new, dtype=int)
-
-        matrix_dict_list_res = {k: defaultdict(lambda: defaultdict(lambda: 0))  for k, v in self.matrix_dict_list.items()}
-
-        iRab_all = defaultdict(lambda: set())
-
+        nRvec_new = len(iRvec_new)
         iR0 = iRvec_new.index((0, 0, 0))
-        for symop in self.symmetry_operations:
-            if symop.sym_only or symop.sym_T:
-                print('symmetry operation  ', symop.ind)
 
-                R_map = np.dot(iRvec_new_array, np.transpose(symop.rotation))
-                atom_R_map = R_map[:, None, None, :] - symop.vec_shift[None, :, None, :] + symop.vec_shift[None, None, :, :]
-
-                # TODO try numba
-                for (atom_a, atom_b), iR_new_list in iRab_new.items():
-                    exclude_set = set()
-#                    print (f"{atom_a},{atom_b} : iR_new_list ({iR_new_list})")
-                    for iR in iR_new_list:
-                        new_Rvec = tuple(atom_R_map[iR, atom_a, atom_b])
-                        iRab_all[(symop.rot_map[atom_a], symop.rot_map[atom_b])].add(new_Rvec)
-                        new_Rvec_index = self.index_R(new_Rvec)
-                        # print (f"symop={symop.ind}, atoms={atom_a},{atom_b}, iR[{iR}]={iRvec_new[iR]} iR0_old={iR0_old}, iR0={iR0}, new_Rvec={new_Rvec}, new_Rvec_index={new_Rvec_index}")
-                        if new_Rvec_index is not None:
-                            '''
-                            H_ab_sym = P_dagger_a dot H_ab dot P_b
-                            H_ab_sym_T = ul dot H_ab_sym.conj() dot ur
-                            '''
-                            for X in matrix_dict_list_res:
-                                if new_Rvec_index in matrix_dict_in[X][(symop.rot_map[atom_a], symop.rot_map[atom_b])]:
-                                    if mode == "single":
-                                        exclude_set.add(iR)
-                                    # X_L: only rotation wannier centres from L to L' before rotating orbitals.
-                                    XX_L = matrix_dict_in[X][(symop.rot_map[atom_a], symop.rot_map[atom_b])][
-                                                               new_Rvec_index]
-                                    # special even with R == [0,0,0] diagonal terms.
-                                    if iR == iR0 and atom_a == atom_b:
-                                        # print (f"setting diagonal AA/BB for {atom_a}, {atom_b}")
-                                        if X in ['AA', 'BB']:
-                                            v_tmp = (symop.vec_shift[atom_a] - symop.translation).dot(self.lattice)
-                                            m_tmp = np.zeros(XX_L.shape, dtype=complex)
-                                            for i in range(self.wann_atom_info[atom_a].num_wann):
-                                                m_tmp[i, i, :] = v_tmp
-                                            # print (f"(new) setting diagonal for atoms {atom_a},{atom_b}, operation {symop.ind}. v_tmp={v_tmp}")
-                                            if X == 'AA':
-                                                XX_L = XX_L + m_tmp
-                                            elif X == 'BB':
-                                                XX_L = XX_L + (m_tmp *
-                                                    self.matrix_dict_list['Ham'][(symop.rot_map[atom_a], symop.rot_map[atom_b])][
-                                                        new_Rvec_index][:, :, None])
-                                    if XX_L.ndim == 3:
-                                        # X_all: rotating vector.
-                                        XX_L = np.tensordot(XX_L, symop.rotation_cart, axes=1).reshape(XX_L.shape)
-                                    elif XX_L.ndim > 3:
-                                        raise ValueError("transformation of tensors is not implemented")
-                                    if symop.inversion:
-                                        XX_L *= self.parity_I[X]
-                                    if symop.sym_only:
-                                        matrix_dict_list_res[X][(atom_a, atom_b)][iR] += _rotate_matrix(XX_L, symop.p_mat_atom_dagger[atom_a], symop.p_mat_atom[atom_b])
-                                    if symop.sym_T and (mode == "sum" or not symop.sym_only):
-                                        matrix_dict_list_res[X][(atom_a, atom_b)][iR] += _rotate_matrix(XX_L, symop.p_mat_atom_dagger_T[atom_a], symop.p_mat_atom_T[atom_b]).conj() * self.parity_TR[X]
+        # all R-blocks of a pair (a,b) are grouped into one array (nRvec, num_w_a, num_w_b, ...)
+        # with a mask showing which of them are set
+        dense_in = {X: {ab: _dict_to_dense(dic, self.nRvec) for ab, dic in matrix_dict_in[X].items()}
+                    for X in self.matrix_dict_list}
+        Ham_in = {ab: _dict_to_dense(dic, self.nRvec)[0] for ab, dic in self.matrix_dict_list['Ham'].items()}
+        symops = [symop for symop in self.symmetry_operations if symop.sym_only or symop.sym_T]
+        R_maps = [np.dot(iRvec_new_array, np.transpose(symop.rotation)) for symop in symops]
+
+        def average_pair(atom_a, atom_b, iR_list):
+            # R-vectors (indices in iRvec_new) which still need to be evaluated
+            active_ab = np.zeros(nRvec_new, dtype=bool)
+            active_ab[list(iR_list)] = True
+            result_ab = {}
+            result_set_ab = np.zeros(nRvec_new, dtype=bool)
+            iRab_all_ab = []
+            for symop, R_map in zip(symops, R_maps):
+                iR_arr = np.where(active_ab)[0]
+                if len(iR_arr) == 0:
+                    break
+                a1, b1 = symop.rot_map[atom_a], symop.rot_map[atom_b]
+                new_Rvec = R_map[iR_arr] - symop.vec_shift[atom_a] + symop.vec_shift[atom_b]
+                iRab_all_ab.append(((a1, b1), new_Rvec))
+                new_Rvec_index = self.index_R_array(new_Rvec)
+                found = new_Rvec_index >= 0
+                for X in self.matrix_dict_list:
+                    if (a1, b1) not in dense_in[X]:
+                        continue
+                    XX_in, mask = dense_in[X][(a1, b1)]
+                    select = np.copy(found)
+                    select[found] = mask[new_Rvec_index[found]]
+                    if not np.any(select):
+                        continue
+                    iR_sel = iR_arr[select]
+                    iR_old = new_Rvec_index[select]
+                    # X_L: only rotation wannier centres from L to L' before rotating orbitals.
+                    XX_L = XX_in[iR_old]
+                    # special even with R == [0,0,0] diagonal terms.
+                    if atom_a == atom_b and X in ['AA', 'BB']:
+                        i0 = np.where(iR_sel == iR0)[0]
+                        if len(i0) > 0:
+                            v_tmp = (symop.vec_shift[atom_a] - symop.translation).dot(self.lattice)
+                            diag = np.arange(XX_L.shape[1])
+                            if X == 'AA':
+                                XX_L[i0[:, None], diag, diag] += v_tmp
+                            elif X == 'BB':
+                                XX_L[i0[:, None], diag, diag] += (
+                                    Ham_in[(a1, b1)][iR_old[i0][:, None], diag, diag][:, :, None] * v_tmp)
+                    if XX_L.ndim == 4:
+                        # X_all: rotating vector.
+                        XX_L = XX_L @ symop.rotation_cart
+                    elif XX_L.ndim > 4:
+                        raise ValueError("transformation of tensors is not implemented")
+                    if symop.inversion:
+                        XX_L *= self.parity_I[X]
+                    res = 0
+                    if symop.sym_only:
+                        res = _rotate_matrix_array(XX_L, symop.p_mat_atom_dagger[atom_a], symop.p_mat_atom[atom_b])
+                    if symop.sym_T and (mode == "sum" or not symop.sym_only):
+                        res = res + _rotate_matrix_array(XX_L, symop.p_mat_atom_dagger_T[atom_a],
+                                                         symop.p_mat_atom_T[atom_b]).conj() * self.parity_TR[X]
+                    if X not in result_ab:
+                        result_ab[X] = np.zeros((nRvec_new,) + XX_L.shape[1:], dtype=complex)
+                    result_ab[X][iR_sel] += res
+                    result_set_ab[iR_sel] = True
                     # in single mode we need to determine it only once
                     if mode == "single":
-                        # print (f"{atom_a},{atom_b} : excluding ({exclude_set})")
-                        iR_new_list -= exclude_set
-                        # print (f"{atom_a},{atom_b} : iR_new_list -upd ({iR_new_list})")
-
-        if mode == "single":
-            for (atom_a, atom_b), iR_new_list in iRab_new.items():
+                        active_ab[iR_sel] = False
+            if mode == "single":
+                iR_new_list = np.where(active_ab)[0]
                 assert len(iR_new_list) == 0, f"for atoms ({atom_a},{atom_b}) some R vectors were not set : {iR_new_list}" + ", ".join(str(iRvec_new[ir]) for ir in iR_new_list)
+            return result_ab, result_set_ab, iRab_all_ab
+
+        # the pairs of atoms are independent, and share the tables defined above
+        result = {X: {} for X in self.matrix_dict_list}
+        result_set = {}
+        iRab_all = defaultdict(lambda: [])
+        pairs = list(iRab_new.keys())
+        for ab, (result_ab, result_set_ab, iRab_all_ab) in zip(
+                pairs, self._map_pairs(average_pair, [ab + (iRab_new[ab],) for ab in pairs])):
+            for X, res in result_ab.items():
+                result[X][ab] = res
+            result_set[ab] = result_set_ab
+            for ab1, new_Rvec in iRab_all_ab:
+                iRab_all[ab1].append(new_Rvec)
 
         if mode == "sum":
-            for x in matrix_dict_list_res.values():
-                for d in x.values():
-                    for k, v in d.items():
-                        v /= self.nrot
+            for res_X in result.values():
+                for res_ab in res_X.values():
+                    res_ab /= self.nrot
+        matrix_dict_list_res = {X: {ab: dict(zip(np.where(result_set[ab])[0], res_ab[result_set[ab]]))
+                                    for ab, res_ab in res_X.items()}
+                                for X, res_X in result.items()}
+        iRab_all = {ab: set(map(tuple, _unique_R(np.concatenate(R_list)).tolist()))
+                    for ab, R_list in iRab_all.items()}
         print('number of symmetry operations == ', self.nrot)
         return matrix_dict_list_res, iRab_all
 
-
     def symmetrize_new(self):
 
         # ========================================================
@@ -703,6 +762,49 @@ def _rotate_matrix(X, L, R):
 
 
 
+_map_pairs_func = None  # the function evaluated by SymWann._map_pairs, set only in the worker processes
+
+
+def _map_pairs_init(func):
+    global _map_pairs_func
+    _map_pairs_func = func
+
+
+def _map_pairs_call(args):
+    return _map_pairs_func(*args)
+
+
+def _unique_R(R):
+    """unique rows of an integer array R(n,3) (faster than np.unique(R, axis=0), same order)"""
+    R = np.asarray(R, dtype=int)
+    if R.shape[0] == 0:
+        return R.reshape(0, 3)
+    R_min = R.min(axis=0)
+    span = R.max(axis=0) - R_min + 1
+    key = np.ravel_multi_index(tuple((R - R_min).T), span)
+    return np.array(np.unravel_index(np.unique(key), span)).T + R_min
+
+
+def _rotate_matrix_array(X, L, R):
+    """rotates an array of blocks X[iR,m,n,...] as L.X[iR].R"""
+    X = np.moveaxis(X, (1, 2), (-2, -1))
+    return np.moveaxis(L @ X @ R, (-2, -1), (1, 2))
+
+
+def _dict_to_dense(dic, nRvec):
+    """transforms a dictionary {iR: np.array(num_w_a, num_w_b,...)} into an array (nRvec,num_w_a,num_w_b,...)
+    and a boolean mask of the R-vectors present in the dictionary"""
+    mask = np.zeros(nRvec, dtype=bool)
+    if len(dic) == 0:
+        return None, mask
+    iR = np.array(list(dic.keys()), dtype=int)
+    values = np.array(list(dic.values()))
+    mat = np.zeros((nRvec,) + values.shape[1:], dtype=values.dtype)
+    mat[iR] = values
+    mask[iR] = True
+    return mat, mask
+
+
 def _matrix_to_dict(mat, H_select, wann_atom_info):
     """transforms a matrix X[m,n,iR,...] into a dictionary like
         {(a,b): {iR: np.array(num_w_a.num_w_b,...)}}
@@ -726,8 +828,13 @@ def _dict_to_matrix(dic, H_select, nRvec, ndimv):
     num_wann = H_select.shape[2]
     mat = np.zeros((num_wann, num_wann, nRvec) + (3,) * ndimv, dtype=complex)
     for (a, b), irX in dic.items():
-        for iR, X in irX.items():
-            mat[H_select[a, b], iR] = X.reshape((-1,) + X.shape[2:])
+        if len(irX) == 0:
+            continue
+        rows = np.where(H_select[a, b].any(axis=1))[0]
+        cols = np.where(H_select[a, b].any(axis=0))[0]
+        iR = np.array(list(irX.keys()), dtype=int)
+        mat[rows[:, None, None], cols[None, :, None], iR[None, None, :]] = np.moveaxis(
+            np.array(list(irX.values())), 0, 2)
     return mat
 
 
@@ -11,13 +11,15 @@
 #                                                            #
 # ------------------------------------------------------------
 
+import json
+import os
 import numpy as np
 import lazy_property
 from .sym_wann import SymWann
-from ..__utility import alpha_A, beta_A, iterate3dpm
+from ..__utility import alpha_A, beta_A, iterate3dpm, real_recip_lattice
 from ..symmetry import Symmetry, Group, TimeReversal
 from termcolor import cprint
-import functools
+import scipy.sparse
 import multiprocessing
 from collections import defaultdict
 
@@ -45,6 +47,8 @@ class System:
         'npar': None,
         '_getFF': False,
     }
+    # parameters which are not stored by save_npz()
+    _load_parameters_exclude = ('wannier_centers_cart', 'wannier_centers_reduced', 'npar')
 
     __doc__ = """
     The base class for describing a system. Does not have its own constructor,
@@ -133,6 +137,10 @@ class System:
             self.needed_R_matrices.update(['AA', 'SS', 'SR', 'SH', 'SHR'])
 
         self._XX_R = dict()
+        # matrices which are built only on first use (see add_R_mat_builder)
+        self._R_mat_builders = dict()
+        self._R_mat_postprocess = []
+        self.R_mat_built_on_demand = []
 
         if self.wannier_centers_cart is not None:
             self.wannier_centers_cart = np.array(self.wannier_centers_cart)
@@ -161,6 +169,8 @@ class System:
                 return True
 
     def get_R_mat(self, key):
+        if key not in self._XX_R and key in self._R_mat_builders:
+            self.build_R_mat([key])
         try:
             return self._XX_R[key]
         except KeyError:
@@ -168,7 +178,54 @@ class System:
                              " but are required for the current calculation. please check parameters of the System() initializer")
 
     def has_R_mat(self, key):
-        return (key in self._XX_R)
+        """returns True if the matrix is set, or will be built on first use"""
+        return (key in self._XX_R) or (key in self._R_mat_builders)
+
+    def add_R_mat_builder(self, key, builder):
+        """
+        Register a function that builds a real-space matrix on first use (by :meth:`get_R_mat`),
+        instead of building it in the constructor.
+
+        Parameters
+        ----------
+        key : str
+            `SS', 'AA' , etc
+        builder : callable
+            function without arguments, returning `array(num_wann,num_wann,nRvec0,...)` on the R-vectors
+            as they were at the moment of registration. The transformations applied to the other matrices
+            later (exclusion of non-periodic R-vectors, ws_dist) are applied automatically.
+        """
+        if key in self._XX_R:
+            raise RuntimeError(f"matrix {key} is already set, no need to build it")
+        self._R_mat_builders[key] = builder
+
+    @property
+    def pending_R_matrices(self):
+        """list of matrices which are not built yet, but will be built on first use"""
+        return list(self._R_mat_builders.keys())
+
+    def build_R_mat(self, keys=None):
+        """
+        Build the matrices that were postponed until first use (see :meth:`add_R_mat_builder`).
+        The built matrices are recorded in `R_mat_built_on_demand`
+
+        Parameters
+        ----------
+        keys : list of str
+            matrices to build. By default - all pending matrices
+        """
+        if keys is None:
+            keys = self.pending_R_matrices
+        for key in keys:
+            builder = self._R_mat_builders.pop(key)
+            cprint(f"building the real-space matrix {key} on demand", 'green')
+            XX_R = builder()
+            for func in self._R_mat_postprocess:
+                XX_R = func(XX_R)
+            self.set_R_mat(key, XX_R)
+            self.R_mat_built_on_demand.append(key)
+        if len(self._R_mat_builders) == 0:
+            self._R_mat_postprocess = []
 
     def has_R_mat_any(self, keys):
         for k in keys:
@@ -209,6 +266,7 @@ class System:
             XX[:, :, self.iR(R)] = value
             self.set_R_mat(key, XX, reset=reset, add=add)
         else:
+            self._R_mat_builders.pop(key, None)
             if key in self._XX_R:
                 if reset:
                     self._XX_R[key] = value
@@ -223,7 +281,7 @@ class System:
     def Ham_R(self):
         return self.get_R_mat('Ham')
 
-    def symmetrize(self, proj, positions, atom_name, soc=False, magmom=None, DFT_code='qe', method="new"):
+    def symmetrize(self, proj, positions, atom_name, soc=False, magmom=None, DFT_code='qe', method="new", npar=1):
         """
         Symmetrize Wannier matrices in real space: Ham_R, AA_R, BB_R, SS_R,...
 
@@ -252,11 +310,16 @@ class System:
             DFT code used : ``'qe'`` or ``'vasp'`` . This is needed, because vasp and qe have different orbitals arrangement with SOC.(grouped by spin or by orbital type)
         method : str
             `new` or `old`. They give same result but `new` is faster. `old` will be eventually removed.
+        npar : int
+            number of processes used for the symmetrization (only for `method="new"`). The processes are forked,
+            they share the input matrices, but each needs memory for the blocks it computes and its temporary arrays.
+            Threads are used instead, where fork is not available
 
         Notes:
             does not update wannier_centers. TODO: make the code update them
         """
 
+        self.build_R_mat()
         symmetrize_wann = SymWann(
             num_wann=self.num_wann,
             lattice=self.real_lattice,
@@ -267,7 +330,8 @@ class System:
             XX_R=self._XX_R,
             soc=soc,
             magmom=magmom,
-            DFT_code=DFT_code)
+            DFT_code=DFT_code,
+            npar=npar)
         self._XX_R, self.iRvec = symmetrize_wann.symmetrize(method=method)
         self.symmetrize_info = dict(proj=proj, positions=positions, atom_name=atom_name, soc=soc, magmom=magmom,
                                     DFT_code='qe')
@@ -288,7 +352,9 @@ class System:
             self.iRvec = self.iRvec[notexclude]
             for X in ['Ham', 'AA', 'BB', 'CC', 'SS', 'FF']:
                 if X in self._XX_R:
-                    self.set_R_mat(X, self.get_X_mat(X)[:, :, notexclude], reset=True)
+                    self.set_R_mat(X, self.get_R_mat(X)[:, :, notexclude], reset=True)
+            if len(self._R_mat_builders) > 0:
+                self._R_mat_postprocess.append(lambda XX_R: XX_R[:, :, notexclude])
 
     def set_spin(self, spins, axis=[0, 0, 1], **kwargs):
         """
@@ -417,6 +483,8 @@ class System:
             for key, val in self._XX_R.items():
                 print("using ws_dist for {}".format(key))
                 self.set_R_mat(key, ws_map(val), reset=True)
+            if len(self._R_mat_builders) > 0:
+                self._R_mat_postprocess.append(ws_map)
             self.iRvec = np.array(ws_map._iRvec_ordered, dtype=int)
         else:
             print("NOT using ws_dist")
@@ -430,8 +498,20 @@ class System:
             return self.wannier_centers_cart
 
     def to_tb_file(self, tb_file=None):
+        """
+        write the Hamiltonian (and the position matrix elements, if present) into a `_tb.dat` file,
+        in the format of Wannier90. If `tb_file` ends with ``.npz``, a binary file is written instead,
+        which can be read by :class:`~wannierberri.system.System_tb` as well
+        """
         if tb_file is None:
             tb_file = self.seedname + "_fromchk_tb.dat"
+        if tb_file.endswith(".npz"):
+            cprint(f"writing TB file {tb_file} (binary)", 'green', attrs=['bold'])
+            matrices = {'Ham_R': self.Ham_R}
+            if self.has_R_mat('AA'):
+                matrices['AA_R'] = self.get_R_mat('AA')
+            np.savez(tb_file, real_lattice=self.real_lattice, iRvec=self.iRvec, Ndegen=self.Ndegen, **matrices)
+            return
         f = open(tb_file, "w")
         f.write("written by wannier-berri form the chk file\n")
         cprint(f"writing TB file {tb_file}", 'green', attrs=['bold'])
@@ -441,23 +521,21 @@ class System:
         for i in range(0, self.nRvec, 15):
             a = self.Ndegen[i:min(i + 15, self.nRvec)]
             f.write("  ".join("{:2d}".format(x) for x in a) + "\n")
-        for iR in range(self.nRvec):
-            f.write("\n  {0:3d}  {1:3d}  {2:3d}\n".format(*tuple(self.iRvec[iR])))
-            f.write(
-                "".join(
-                    "{0:3d} {1:3d} {2:15.8e} {3:15.8e}\n".format(
-                        m + 1, n + 1, self.Ham_R[m, n, iR].real * self.Ndegen[iR], self.Ham_R[m, n, iR].imag *
-                        self.Ndegen[iR]) for n in range(self.num_wann) for m in range(self.num_wann)))
+        # indices m, n of the lines of each block, m running fastest
+        n, m = np.meshgrid(np.arange(self.num_wann) + 1, np.arange(self.num_wann) + 1, indexing='ij')
+        mn = np.array([m.reshape(-1), n.reshape(-1)]).T
+        matrices = [self.Ham_R[:, :, :, None]]
         if self.has_R_mat('AA'):
+            matrices.append(self.get_R_mat('AA'))
+        for X in matrices:
+            ncomp = X.shape[3]
+            line = "%3d %3d " + " ".join(["%15.8e %15.8e"] * ncomp) + "\n"
             for iR in range(self.nRvec):
                 f.write("\n  {0:3d}  {1:3d}  {2:3d}\n".format(*tuple(self.iRvec[iR])))
-                f.write(
-                    "".join(
-                        "{0:3d} {1:3d} ".format(m + 1, n + 1) + " ".join(
-                            "{:15.8e} {:15.8e}".format(a.real, a.imag)
-                            for a in self.get_R_mat('AA')[m, n, iR] * self.Ndegen[iR]) + "\n" for n in
-                        range(self.num_wann)
-                        for m in range(self.num_wann)))
+                values = (X[:, :, iR] * self.Ndegen[iR]).transpose(1, 0, 2).reshape(-1, ncomp)
+                values = np.concatenate([mn, np.array([values.real, values.imag]).transpose(1, 2, 0).reshape(-1, 2 * ncomp)],
+                                        axis=1)
+                f.write((line * len(values)) % tuple(values.reshape(-1).tolist()))
         f.close()
 
     def _FFT_compatible(self, FFT, iRvec):
@@ -757,80 +835,124 @@ class System:
             ret_dic['matrices'][k] = array_to_dict(self.get_R_mat(k), v)
         return ret_dic
 
+    def save_npz(self, path):
+        """
+        Save the system (after `ws_dist` and symmetrization) to a directory, so that it can be later
+        restored by :meth:`System.load` without re-reading the ab initio files.
+
+        Parameters
+        ----------
+        path : str
+            name of the directory. The general data (lattice, R-vectors, Wannier centers, symmetries, parameters)
+            are written to `system.npz`, and each real-space matrix `XX` is written to a separate file `XX_R.npy`
+        """
+        os.makedirs(path, exist_ok=True)
+        self.build_R_mat()
+        parameters = {p: getattr(self, p) for p in self.default_parameters if p not in self._load_parameters_exclude}
+        parameters = {p: (v.tolist() if hasattr(v, 'tolist') else v) for p, v in parameters.items()}
+        data = dict(
+            parameters=json.dumps(parameters),
+            real_lattice=self.real_lattice,
+            iRvec=self.iRvec,
+            wannier_centers_cart=self.wannier_centers_cart,
+            matrices=np.array(sorted(self._XX_R.keys())),
+        )
+        if hasattr(self, 'Ndegen'):
+            data['Ndegen'] = self.Ndegen
+        if hasattr(self, 'symgroup'):
+            data['symmetries_R'] = np.array([S.R * S.iInv for S in self.symgroup.symmetries])
+            data['symmetries_TR'] = np.array([S.TR for S in self.symgroup.symmetries])
+        np.savez(os.path.join(path, "system.npz"), **data)
+        for key, val in self._XX_R.items():
+            np.save(os.path.join(path, key + "_R.npy"), val)
+
+    @classmethod
+    def load(cls, path, mmap_mode='c'):
+        """
+        Load the system saved by :meth:`System.save_npz`
+
+        Parameters
+        ----------
+        path : str
+            name of the directory
+        mmap_mode : str or None
+            the real-space matrices are memory-mapped, and read from the disk only when accessed. The default
+            ``'c'`` (copy-on-write) does not modify the files. Use ``None`` to read everything into memory.
+
+        Returns
+        -------
+        :class:`System` (or the class on which the method was called)
+        """
+        system = cls.__new__(cls)
+        with np.load(os.path.join(path, "system.npz")) as data:
+            system.real_lattice, system.recip_lattice = real_recip_lattice(real_lattice=data['real_lattice'])
+            system.set_parameters(wannier_centers_cart=data['wannier_centers_cart'],
+                                  **json.loads(str(data['parameters'])))
+            system.iRvec = data['iRvec']
+            if 'Ndegen' in data:
+                system.Ndegen = data['Ndegen']
+            if 'symmetries_R' in data:
+                system.set_symmetry([Symmetry(R, TR=bool(TR))
+                                     for R, TR in zip(data['symmetries_R'], data['symmetries_TR'])])
+            else:
+                system.set_symmetry()
+            for key in data['matrices']:
+                system.set_R_mat(str(key), np.load(os.path.join(path, f"{key}_R.npy"), mmap_mode=mmap_mode))
+        return system
+
 
 class ws_dist_map():
 
-    def __init__(self, iRvec, wannier_centers, mp_grid, real_lattice, npar=multiprocessing.cpu_count()):
+    def __init__(self, iRvec, wannier_centers, mp_grid, real_lattice, npar=None, chunk=2 ** 22):
         # Find the supercell translation (i.e. the translation by a integer number of
         # supercell vectors, the supercell being defined by the mp_grid) that
         # minimizes the distance between two given Wannier functions, i and j,
         # the first in unit cell 0, the other in unit cell R.
         # I.e., we find the translation to put WF j in the Wigner-Seitz of WF i.
         # We also look for the number of equivalent translation, that happen when w_j,R
-        # is on the edge of the WS of w_i,0. The results are stored
-        # a dictionary shifts_iR[(iR,i,j)]
+        # is on the edge of the WS of w_i,0. The results are stored as a sparse (COO) map
+        # (iR, iw, jw) -> (iR_new, weight)
+        # npar is not used (kept for compatibility), the search is vectorized over R-vectors
         ws_search_size = np.array([2] * 3)
         ws_distance_tol = 1e-5
+        iRvec = np.array(iRvec, dtype=int)
         cRvec = iRvec.dot(real_lattice)
         mp_grid = np.array(mp_grid)
         shifts_int_all = np.array([ijk for ijk in iterate3dpm(ws_search_size + 1)]) * np.array(mp_grid[None, :])
-        self.num_wann = wannier_centers.shape[0]
-        self._iRvec_new = dict()
-        param = (shifts_int_all, wannier_centers, real_lattice, ws_distance_tol, wannier_centers.shape[0])
-        p = multiprocessing.Pool(npar)
-        irvec_new_all = p.starmap(functools.partial(ws_dist_stars, param=param), zip(iRvec, cRvec))
-        p.close()
-        p.join()
-        print('irvec_new_all shape', np.shape(irvec_new_all))
-        for ir, iR in enumerate(iRvec):
-            for ijw, irvec_new in irvec_new_all[ir].items():
-                self._add_star(ir, irvec_new, ijw[0], ijw[1])
-        self._iRvec_ordered = sorted(self._iRvec_new)
-        for ir, R in enumerate(iRvec):
-            chsum = 0
-            for irnew in self._iRvec_new:
-                if ir in self._iRvec_new[irnew]:
-                    chsum += self._iRvec_new[irnew][ir]
-            chsum = np.abs(chsum - np.ones((self.num_wann, self.num_wann))).sum()
-            if chsum > 1e-12:
-                print("WARNING: Check sum for {0} : {1}".format(ir, chsum))
+        shifts_cart = shifts_int_all.dot(real_lattice)
+        self.num_wann = num_wann = wannier_centers.shape[0]
+        self.nRvec_old = nRvec = iRvec.shape[0]
+        ir_old, iw, jw, ishift = [], [], [], []
+        nR_chunk = max(1, chunk // (num_wann ** 2 * shifts_int_all.shape[0]))
+        for start in range(0, nRvec, nR_chunk):
+            # R_in[iR, iw, jw] : function JW translated in the Wigner-Seitz around function IW
+            # (keep this order of operations: the degenerate cases are sensitive to rounding)
+            R_in = (-wannier_centers[None, :, None, :] + cRvec[start:start + nR_chunk, None, None, :]
+                    ) + wannier_centers[None, None, :, :]
+            dist = np.linalg.norm(R_in[:, :, :, None, :] + shifts_cart, axis=-1)
+            ind = np.nonzero(dist - dist.min(axis=-1, keepdims=True) < ws_distance_tol)
+            ir_old.append(ind[0] + start)
+            iw.append(ind[1])
+            jw.append(ind[2])
+            ishift.append(ind[3])
+        ir_old, iw, jw, ishift = [np.concatenate(a) for a in (ir_old, iw, jw, ishift)]
+        lin_old = (iw * num_wann + jw) * nRvec + ir_old
+        degen = np.bincount(lin_old, minlength=num_wann ** 2 * nRvec)
+        weight = 1. / degen[lin_old]
+        self._iRvec_ordered, ir_new = np.unique(iRvec[ir_old] + shifts_int_all[ishift], axis=0, return_inverse=True)
+        self.nRvec_new = self._iRvec_ordered.shape[0]
+        lin_new = (iw * num_wann + jw) * self.nRvec_new + ir_new.reshape(-1)
+        self._map = scipy.sparse.coo_matrix(
+            (weight, (lin_new, lin_old)), shape=(num_wann ** 2 * self.nRvec_new, num_wann ** 2 * nRvec)).tocsr()
+        chsum = np.abs(np.bincount(lin_old, weights=weight, minlength=num_wann ** 2 * nRvec) - 1).reshape(
+            num_wann ** 2, nRvec).sum(axis=0)
+        for ir in np.where(chsum > 1e-12)[0]:
+            print("WARNING: Check sum for {0} : {1}".format(ir, chsum[ir]))
 
     def __call__(self, matrix):
-        ndim = len(matrix.shape) - 3
-        num_wann = matrix.shape[0]
-        reshaper = (num_wann, num_wann) + (1,) * ndim
-        matrix_new = np.array(
-            [
-                sum(
-                    matrix[:, :, ir] * self._iRvec_new[irvecnew][ir].reshape(reshaper)
-                    for ir in self._iRvec_new[irvecnew]) for irvecnew in self._iRvec_ordered
-            ]).transpose((1, 2, 0) + tuple(range(3, 3 + ndim)))
+        shape = matrix.shape
+        assert shape[:3] == (self.num_wann, self.num_wann, self.nRvec_old)
+        matrix_new = (self._map @ matrix.reshape(self._map.shape[1], -1)).reshape(
+            (self.num_wann, self.num_wann, self.nRvec_new) + shape[3:])
         assert (np.abs(matrix_new.sum(axis=2) - matrix.sum(axis=2)).max() < 1e-12)
         return matrix_new
-
-    def _add_star(self, ir, irvec_new, iw, jw):
-        weight = 1. / irvec_new.shape[0]
-        for irv in irvec_new:
-            self._add(ir, irv, iw, jw, weight)
-
-    def _add(self, ir, irvec_new, iw, jw, weight):
-        irvec_new = tuple(irvec_new)
-        if irvec_new not in self._iRvec_new:
-            self._iRvec_new[irvec_new] = dict()
-        if ir not in self._iRvec_new[irvec_new]:
-            self._iRvec_new[irvec_new][ir] = np.zeros((self.num_wann, self.num_wann), dtype=float)
-        self._iRvec_new[irvec_new][ir][iw, jw] += weight
-
-
-def ws_dist_stars(iRvec, cRvec, param):
-    shifts_int_all, wannier_centers, real_lattice, ws_distance_tol, num_wann = param
-    irvec_new = {}
-    for jw in range(num_wann):
-        for iw in range(num_wann):
-            # function JW translated in the Wigner-Seitz around function IW
-            # and also find its degeneracy, and the integer shifts needed
-            # to identify it
-            R_in = -wannier_centers[iw] + cRvec + wannier_centers[jw]
-            dist = np.linalg.norm(R_in[None, :] + shifts_int_all.dot(real_lattice), axis=1)
-            irvec_new[(iw, jw)] = iRvec + shifts_int_all[dist - dist.min() < ws_distance_tol].copy()
-    return irvec_new
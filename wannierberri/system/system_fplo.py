@@ -16,7 +16,6 @@ import numpy as np
 from ..__utility import str2bool, real_recip_lattice
 from termcolor import cprint
 from .system import System
-from collections import defaultdict
 from scipy.constants import physical_constants, angstrom
 
 bohr = physical_constants['Bohr radius'][0] / angstrom
@@ -70,9 +69,8 @@ class System_fplo(System):
             elif l.startswith("spin:"):
                 ispin = int(next(f))
                 assert ispin == 1, f"spin = 1 expected, got {ispin}"
-                Ham_R = defaultdict(lambda: np.zeros((self.num_wann, self.num_wann), dtype=complex))
-                if self.spin:
-                    SS_R = defaultdict(lambda: np.zeros((self.num_wann, self.num_wann, 3), dtype=complex))
+                # the rows of all blocks, with the indices of the Wannier functions (iw, jw) of each row
+                rows, iw_all, jw_all = [], [], []
                 while True:
                     l = next(f)
                     if l.startswith("end spin:"):
@@ -80,35 +78,46 @@ class System_fplo(System):
                         break
                     if l.startswith("Tij, Hij"):
                         iw, jw = [int(x) for x in next(f).split()]
-                        iw -= 1
-                        jw -= 1
-                        arread = []
+                        lines = []
                         while True:
                             l = next(f)
                             if l.startswith("end Tij, Hij"):
                                 break
-                            arread.append(l.split())
-                        if len(arread) == 0:
+                            lines.append(l)
+                        if len(lines) == 0:
                             continue
-                        arread = np.array(arread, dtype=float)
-                        Rvec = arread[:, :3] + (
-                                self.wannier_centers_cart_auto[None, iw] - self.wannier_centers_cart_auto[None, jw])
-                        Rvec = Rvec.dot(inv_real_lattice)  # should be integer now
-                        iRvec = np.array(np.round(Rvec), dtype=int)
-                        assert (abs(iRvec - Rvec).max() < 1e-8)
-                        iRvec = [tuple(ir) for ir in iRvec]
-                        for iR, a in zip(iRvec, arread):
-                            Ham_R[iR][iw, jw] = a[3] + 1j * a[4]
-                            if self.spin:
-                                SS_R[iR][iw, jw, :] = a[5:11:2] + 1j * a[6:11:2]
+                        rows.append(np.fromstring("".join(lines), sep=" ").reshape(len(lines), -1))
+                        iw_all.append(np.full(len(lines), iw - 1))
+                        jw_all.append(np.full(len(lines), jw - 1))
         f.close()
         # Reading of file finished
 
         self.real_lattice, self.recip_lattice = real_recip_lattice(real_lattice=real_lattice_bohr * bohr)
-        iRvec = list(Ham_R.keys())
-        self.set_R_mat('Ham', np.array([Ham_R[iR] for iR in iRvec]).transpose((1, 2, 0)))
+        arread = np.concatenate(rows)
+        iw_all = np.concatenate(iw_all)
+        jw_all = np.concatenate(jw_all)
+        Rvec = arread[:, :3] + (self.wannier_centers_cart_auto[iw_all] - self.wannier_centers_cart_auto[jw_all])
+        Rvec = Rvec.dot(inv_real_lattice)  # should be integer now
+        iRvec_all = np.array(np.round(Rvec), dtype=int)
+        assert (abs(iRvec_all - Rvec).max() < 1e-8)
+        # number the R-vectors in the order of their first appearance in the file
+        R_min = iRvec_all.min(axis=0)
+        R_span = iRvec_all.max(axis=0) - R_min + 1
+        R_key = np.ravel_multi_index(tuple((iRvec_all - R_min).T), R_span)
+        _, first, inverse = np.unique(R_key, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        index_R = np.empty_like(order)
+        index_R[order] = np.arange(len(order))
+        index_R = index_R[inverse]
+        iRvec = iRvec_all[first[order]]
+
+        Ham_R = np.zeros((self.num_wann, self.num_wann, len(iRvec)), dtype=complex)
+        Ham_R[iw_all, jw_all, index_R] = arread[:, 3] + 1j * arread[:, 4]
+        self.set_R_mat('Ham', Ham_R)
         if self.need_R_any('SS'):
-            self.set_R_mat('SS', np.array([SS_R[iR] for iR in iRvec]).transpose((1, 2, 0, 3)))
+            SS_R = np.zeros((self.num_wann, self.num_wann, len(iRvec), 3), dtype=complex)
+            SS_R[iw_all, jw_all, index_R] = arread[:, 5:11:2] + 1j * arread[:, 6:11:2]
+            self.set_R_mat('SS', SS_R)
 
         self.nRvec0 = len(iRvec)
         self.iRvec = np.array(iRvec, dtype=int)
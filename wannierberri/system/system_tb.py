@@ -12,6 +12,7 @@
 # ------------------------------------------------------------
 
 import numpy as np
+from itertools import islice
 from termcolor import cprint
 from ..__utility import real_recip_lattice
 from .system import System
@@ -27,7 +28,8 @@ class System_tb(System):
     Parameters
     ----------
     tb_file : str
-        name (and path) of file to be read
+        name (and path) of file to be read. If it ends with ``.npz``, it is read as the binary file
+        written by :meth:`~wannierberri.system.System.to_tb_file`
 
     Notes
     -----
@@ -43,6 +45,16 @@ class System_tb(System):
             raise ValueError("System_tb class cannot be used for evaluation of spin properties")
 
         self.seedname = tb_file.split("/")[-1].split("_")[0]
+        if tb_file.endswith(".npz"):
+            self._read_npz(tb_file)
+        else:
+            self._read_text(tb_file)
+
+        self.do_at_end_of_init()
+
+        cprint("Reading the system from {} finished successfully".format(tb_file), 'green', attrs=['bold'])
+
+    def _read_text(self, tb_file):
         f = open(tb_file, "r")
         l = f.readline()
         cprint("reading TB file {0} ( {1} )".format(tb_file, l.strip()), 'green', attrs=['bold'])
@@ -56,35 +68,59 @@ class System_tb(System):
             self.Ndegen += f.readline().split()
         self.Ndegen = np.array(self.Ndegen, dtype=int)
 
-        self.iRvec = []
-
-        Ham_R = np.zeros((self.num_wann, self.num_wann, nRvec), dtype=complex)
-
-        for ir in range(nRvec):
-            f.readline()
-            self.iRvec.append(f.readline().split())
-            hh = np.array(
-                [[f.readline().split()[2:4] for n in range(self.num_wann)] for m in range(self.num_wann)],
-                dtype=float).transpose((1, 0, 2))
-            Ham_R[:, :, ir] = (hh[:, :, 0] + 1j * hh[:, :, 1]) / self.Ndegen[ir]
-        self.set_R_mat('Ham', Ham_R)
-
-        self.iRvec = np.array(self.iRvec, dtype=int)
+        self.iRvec, Ham_R = _read_tb_blocks(f, nRvec, self.num_wann, 1)
+        self.set_R_mat('Ham', Ham_R[:, :, :, 0] / self.Ndegen[None, None, :])
 
         if 'AA' in self.needed_R_matrices:
-            AA_R = np.zeros((self.num_wann, self.num_wann, nRvec, 3), dtype=complex)
-            for ir in range(nRvec):
-                f.readline()
-                assert (np.array(f.readline().split(), dtype=int) == self.iRvec[ir]).all()
-                aa = np.array(
-                    [[f.readline().split()[2:8] for n in range(self.num_wann)] for m in range(self.num_wann)],
-                    dtype=float)
-                AA_R[:, :, ir, :] = (aa[:, :, 0::2] + 1j * aa[:, :, 1::2]).transpose((1, 0, 2)) / self.Ndegen[ir]
+            iRvec, AA_R = _read_tb_blocks(f, nRvec, self.num_wann, 3)
+            assert (iRvec == self.iRvec).all()
+            AA_R /= self.Ndegen[None, None, :, None]
             self.wannier_centers_cart_auto = np.diagonal(AA_R[:, :, self.iR0, :], axis1=0, axis2=1).T
             self.set_R_mat('AA', AA_R)
 
         f.close()
 
-        self.do_at_end_of_init()
-
-        cprint("Reading the system from {} finished successfully".format(tb_file), 'green', attrs=['bold'])
+    def _read_npz(self, tb_file):
+        cprint("reading TB file {0} (binary)".format(tb_file), 'green', attrs=['bold'])
+        with np.load(tb_file) as data:
+            self.real_lattice, self.recip_lattice = real_recip_lattice(real_lattice=data['real_lattice'])
+            self.iRvec = data['iRvec']
+            self.Ndegen = data['Ndegen']
+            self.nRvec0 = len(self.iRvec)
+            self.num_wann = data['Ham_R'].shape[0]
+            self.set_R_mat('Ham', data['Ham_R'])
+            if 'AA' in self.needed_R_matrices:
+                AA_R = data['AA_R']
+                self.wannier_centers_cart_auto = np.diagonal(AA_R[:, :, self.iR0, :], axis1=0, axis2=1).T
+                self.set_R_mat('AA', AA_R)
+
+
+def _read_tb_blocks(f, nRvec, num_wann, ncomp, chunk=2 ** 22):
+    """
+    read `nRvec` blocks of the _tb.dat file, each consisting of an empty line, the R-vector,
+    and num_wann**2 lines  "m n Re(X_1) Im(X_1) ... Re(X_ncomp) Im(X_ncomp)"
+
+    Returns
+    -------
+    iRvec : numpy.ndarray(int, shape=(nRvec, 3))
+    X : numpy.ndarray(complex, shape=(num_wann, num_wann, nRvec, ncomp))
+        (as written in the file, not divided by the degeneracies)
+    """
+    block = 3 + num_wann ** 2 * (2 + 2 * ncomp)
+    iRvec = np.zeros((nRvec, 3), dtype=int)
+    X = np.zeros((num_wann, num_wann, nRvec, ncomp), dtype=complex)
+    nblocks = max(1, chunk // block)
+    for start in range(0, nRvec, nblocks):
+        stop = min(start + nblocks, nRvec)
+        x = np.fromstring("".join(islice(f, (stop - start) * (2 + num_wann ** 2))), sep=" ")
+        if x.size != (stop - start) * block:
+            raise RuntimeError(f"failed to read R-vectors {start} to {stop} from {f.name}: "
+                               f"expected {(stop - start) * block} numbers, found {x.size}")
+        x = x.reshape(stop - start, block)
+        iRvec[start:stop] = np.round(x[:, :3])
+        x = x[:, 3:].reshape(stop - start, num_wann ** 2, 2 + 2 * ncomp)
+        m = np.round(x[:, :, 0]).astype(int) - 1
+        n = np.round(x[:, :, 1]).astype(int) - 1
+        iR = np.arange(start, stop)[:, None]
+        X[m, n, iR] = x[:, :, 2::2] + 1j * x[:, :, 3::2]
+    return iRvec, X
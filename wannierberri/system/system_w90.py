@@ -45,6 +45,17 @@ class System_w90(System):
         tolerance to consider the b_k vectors (connecting to neighbouring k-points on the grid) belonging to the same shell
     bk_complete_tol : float
         tolerance to consider the set of b_k shells as complete.
+    lazy_R_matrices : bool
+        if True, the matrices requested by `berry`, `morb`, `spin`, etc. (except the Hamiltonian) are not evaluated
+        in the constructor, but only when they are first used by a calculator (the input files are also read only then).
+        Matrices which are modified by `use_wcc_phase=True` are still evaluated in the constructor.
+        The matrices evaluated this way are listed in `R_mat_built_on_demand`
+    mmap_files : bool
+        if True, the ``.mmn`` (via a binary copy ``seedname.mmn.npy`` written next to it;
+        if that directory is not writable, the ``.mmn`` file is read into memory as usual),
+        and the unformatted ``.uHu``, ``.uIu``, ``.sHu``, ``.sIu`` files are memory-mapped and read k-point by k-point,
+        so that the memory used by the constructor does not grow with the size of these files.
+        Ignored if `w90data` is provided
 
     Notes
     -----
@@ -61,13 +72,16 @@ class System_w90(System):
             npar=multiprocessing.cpu_count(),
             kmesh_tol=1e-7,
             bk_complete_tol=1e-5,
+            lazy_R_matrices=False,
+            mmap_files=False,
             **parameters):
 
         self.set_parameters(**parameters)
         self.npar = npar
         self.seedname = seedname
         if w90data is None:
-            w90data = Wannier90data(self.seedname, read_chk=True, kmesh_tol=kmesh_tol, bk_complete_tol=bk_complete_tol)
+            w90data = Wannier90data(self.seedname, read_chk=True, kmesh_tol=kmesh_tol, bk_complete_tol=bk_complete_tol,
+                                    mmap=mmap_files)
         w90data.check_wannierised(msg="creation of System_Wannierise")
         chk = w90data.chk
         self.real_lattice, self.recip_lattice = real_recip_lattice(chk.real_lattice, chk.recip_lattice)
@@ -96,14 +110,11 @@ class System_w90(System):
             numthreads=npar,
             fft=fft)
 
-        self.set_R_mat('Ham', fourier_q_to_R_loc(chk.get_HH_q(w90data.eig)))
+        iR0 = self.iR0
 
-        if self.need_R_any('AA'):
-            AAq = chk.get_AA_q(w90data.mmn, transl_inv=transl_inv)
-            self.set_R_mat('AA', fourier_q_to_R_loc(AAq))
+        def check_AA(AA_R):
             if transl_inv:
-                wannier_centers_cart_new = np.diagonal(self.get_R_mat('AA')[:, :, self.iR0, :], axis1=0,
-                                                       axis2=1).transpose()
+                wannier_centers_cart_new = np.diagonal(AA_R[:, :, iR0, :], axis1=0, axis2=1).transpose()
                 if not np.all(abs(wannier_centers_cart_new - self.wannier_centers_cart_auto) < 1e-6):
                     if guiding_centers:
                         print(
@@ -112,7 +123,7 @@ class System_w90(System):
                             "This can happen if guiding_centres was set to true in Wannier90.\n"
                             "Overwrite the evaluated centers using the read centers.")
                         for iw in range(self.num_wann):
-                            self.get_R_mat('AA')[iw, iw, self.iR0, :] = self.wannier_centers_cart_auto[iw, :]
+                            AA_R[iw, iw, iR0, :] = self.wannier_centers_cart_auto[iw, :]
                     else:
                         raise ValueError(
                             f"the difference between read\n{self.wannier_centers_cart_auto}\n"
@@ -120,27 +131,40 @@ class System_w90(System):
                             f"{self.wannier_centers_cart_auto - wannier_centers_cart_new}\n"
                             "If guiding_centres was set to true in Wannier90, pass guiding_centers = True to System_w90."
                         )
-
-        if 'BB' in self.needed_R_matrices:
-            self.set_R_mat('BB', fourier_q_to_R_loc(chk.get_AA_q(w90data.mmn, w90data.eig)))
-        if 'CC' in self.needed_R_matrices:
-            self.set_R_mat('CC', fourier_q_to_R_loc(chk.get_CC_q(w90data.uhu, w90data.mmn)))
-
-        if self.need_R_any('SS'):
-            self.set_R_mat('SS', fourier_q_to_R_loc(chk.get_SS_q(w90data.spn)))
-        if self.need_R_any('SR'):
-            self.set_R_mat('SR', fourier_q_to_R_loc(chk.get_SR_q(w90data.spn, w90data.mmn)))
-        if self.need_R_any('SH'):
-            self.set_R_mat('SH', fourier_q_to_R_loc(chk.get_SH_q(w90data.spn, w90data.eig)))
-        if self.need_R_any('SHR'):
-            self.set_R_mat('SHR', fourier_q_to_R_loc(chk.get_SHR_q(w90data.spn, w90data.mmn, w90data.eig)))
-
-        if 'SA' in self.needed_R_matrices:
-            self.set_R_mat('SA', fourier_q_to_R_loc(chk.get_SA_q(w90data.siu, w90data.mmn)))
-        if 'SHA' in self.needed_R_matrices:
-            self.set_R_mat('SHA', fourier_q_to_R_loc(chk.get_SHA_q(w90data.shu, w90data.mmn)))
-
-        del w90data
+            return AA_R
+
+        # the matrices in q-space, and the functions applied to them after the Fourier transform
+        getters_q = {
+            'Ham': lambda: chk.get_HH_q(w90data.eig),
+            'AA': lambda: chk.get_AA_q(w90data.mmn, transl_inv=transl_inv),
+            'BB': lambda: chk.get_AA_q(w90data.mmn, w90data.eig),
+            'CC': lambda: chk.get_CC_q(w90data.uhu, w90data.mmn),
+            'SS': lambda: chk.get_SS_q(w90data.spn),
+            'SR': lambda: chk.get_SR_q(w90data.spn, w90data.mmn),
+            'SH': lambda: chk.get_SH_q(w90data.spn, w90data.eig),
+            'SHR': lambda: chk.get_SHR_q(w90data.spn, w90data.mmn, w90data.eig),
+            'SA': lambda: chk.get_SA_q(w90data.siu, w90data.mmn),
+            'SHA': lambda: chk.get_SHA_q(w90data.shu, w90data.mmn),
+        }
+        postprocess = {'AA': check_AA}
+        keys = [key for key in getters_q if key == 'Ham' or key in self.needed_R_matrices]
+        if lazy_R_matrices:
+            keys_now = ['Ham']
+            for key in keys[1:]:
+                self.add_R_mat_builder(
+                    key, lambda key=key: postprocess.get(key, lambda A: A)(fourier_q_to_R_loc(getters_q[key]())))
+        else:
+            keys_now = keys
+        # the small matrices are transformed in one batched FFT. The larger ones are transformed one by one,
+        # so that only one of them is kept in q-space at a time
+        keys_batch = [key for key in keys_now if key in ('Ham', 'AA', 'BB', 'SS')]
+        XX_R = fourier_q_to_R_loc({key: getters_q[key]() for key in keys_batch})
+        for key in keys_now:
+            if key in keys_batch:
+                XX = XX_R.pop(key)
+            else:
+                XX = fourier_q_to_R_loc(getters_q[key]())
+            self.set_R_mat(key, postprocess.get(key, lambda A: A)(XX))
 
         self.do_at_end_of_init()
         print("Real-space lattice:\n", self.real_lattice)
@@ -14,6 +14,7 @@
 
 import multiprocessing
 import gc
+import os
 import functools
 from scipy.constants import physical_constants
 from time import time
@@ -96,47 +97,98 @@ class CheckPoint:
         gc.collect()
         print("Time to read .chk : {}".format(time() - t0))
 
+    @property
+    def v_matrix(self):
+        return self._v_matrix
+
+    @v_matrix.setter
+    def v_matrix(self, value):
+        self._v_matrix = value
+        if hasattr(self, '_v_matrix_padded'):
+            del self._v_matrix_padded
+
+    @lazy_property.LazyProperty
+    def v_matrix_padded(self):
+        """v_matrix[ik] placed in the columns win_min[ik]:win_max[ik] of a (num_wann, num_bands) zero matrix,
+        for all k-points"""
+        v = np.zeros((self.num_kpts, self.num_wann, self.num_bands), dtype=complex)
+        for ik, (v_k, wmin, wmax) in enumerate(zip(self.v_matrix, self.win_min, self.win_max)):
+            v[ik, :, wmin:wmax] = v_k
+        return v
+
+    def k_chunks(self, size_per_k, chunk=2 ** 22):
+        """slices of k-points, such that the data of each slice has about `chunk` elements"""
+        nk = max(1, chunk // max(1, size_per_k))
+        return [slice(ik, min(ik + nk, self.num_kpts)) for ik in range(0, self.num_kpts, nk)]
+
+    def wannier_gauge_batch(self, mat, ik1, ik2):
+        """
+        transform a set of matrices to the Wannier gauge: V^*_{ik1} mat V^T_{ik2}
+
+        Parameters
+        ----------
+        mat : numpy.ndarray(n, num_bands, num_bands, ...)  or  (n, num_bands)
+            matrices in the band basis (a 2D array is treated as the set of diagonals)
+        ik1, ik2 : array-like(int) of length n
+            k-points of the bra and ket states of each matrix
+
+        Returns
+        -------
+        numpy.ndarray(n, num_wann, num_wann, ...)
+        """
+        v1 = self.v_matrix_padded[ik1].conj()
+        v2 = self.v_matrix_padded[ik2].transpose(0, 2, 1)
+        assert mat.shape[1] == self.num_bands, f"mat.shape={mat.shape}, num_bands={self.num_bands}"
+        if mat.ndim == 2:
+            return (v1 * mat[:, None, :]) @ v2
+        assert mat.shape[2] == self.num_bands, f"mat.shape={mat.shape}, num_bands={self.num_bands}"
+        extra = (1,) * (mat.ndim - 3)
+        v1 = v1.reshape(v1.shape[:1] + extra + v1.shape[1:])
+        v2 = v2.reshape(v2.shape[:1] + extra + v2.shape[1:])
+        return np.moveaxis(v1 @ np.moveaxis(mat, (1, 2), (-2, -1)) @ v2, (-2, -1), (1, 2))
+
     def wannier_gauge(self, mat, ik1, ik2):
         # data should be of form NBxNBx ...   - any form later
-        if len(mat.shape) == 1:
-            mat = np.diag(mat)
-        assert mat.shape[:2] == (self.num_bands,) * 2, f"mat.shape={mat.shape}, num_bands={self.num_bands}"
-        mat = mat[self.win_min[ik1]:self.win_max[ik1], self.win_min[ik2]:self.win_max[ik2]]
-        v1 = self.v_matrix[ik1].conj()
-        v2 = self.v_matrix[ik2].T
-        return np.tensordot(
-            np.tensordot(v1, mat, axes=(1, 0)), v2, axes=(1, 0)).transpose((
-                                                                               0,
-                                                                               -1,
-                                                                           ) + tuple(range(1, mat.ndim - 1)))
+        return self.wannier_gauge_batch(mat[None], [ik1], [ik2])[0]
 
     def get_HH_q(self, eig):
         assert (eig.NK, eig.NB) == (self.num_kpts, self.num_bands)
-        HH_q = np.array([self.wannier_gauge(E, ik, ik) for ik, E in enumerate(eig.data)])
+        ik = np.arange(self.num_kpts)
+        HH_q = self.wannier_gauge_batch(eig.data, ik, ik)
         return 0.5 * (HH_q + HH_q.transpose(0, 2, 1).conj())
 
     def get_SS_q(self, spn):
         assert (spn.NK, spn.NB) == (self.num_kpts, self.num_bands)
-        SS_q = np.array([self.wannier_gauge(S, ik, ik) for ik, S in enumerate(spn.data)])
+        SS_q = np.zeros((self.num_kpts, self.num_wann, self.num_wann, 3), dtype=complex)
+        for ks in self.k_chunks(spn.data[0].size):
+            ik = np.arange(self.num_kpts)[ks]
+            SS_q[ks] = self.wannier_gauge_batch(np.array(spn.data[ks]), ik, ik)
         return 0.5 * (SS_q + SS_q.transpose(0, 2, 1, 3).conj())
 
+    def _iter_neighbours(self, mmn, size_per_k):
+        """yields the slices of k-points, and the bra and ket k-points (of shape (nk, NNB)) for the neighbours"""
+        for ks in self.k_chunks(size_per_k):
+            ik = np.arange(self.num_kpts)[ks]
+            yield ks, np.repeat(ik[:, None], mmn.NNB, axis=1), mmn.neighbours[ks]
+
     def get_AA_q(self, mmn, eig=None, transl_inv=False):  # if eig is present - it is BB_q
         if transl_inv and (eig is not None):
             raise RuntimeError("transl_inv cannot be used to obtain BB")
         mmn.set_bk_chk(self)
         AA_q = np.zeros((self.num_kpts, self.num_wann, self.num_wann, 3), dtype=complex)
-        for ik in range(self.num_kpts):
-            for ib in range(mmn.NNB):
-                iknb = mmn.neighbours[ik, ib]
-                data = mmn.data[ik, ib]
-                if eig is not None:
-                    data = data * eig.data[ik, :, None]
-                AAW = self.wannier_gauge(data, ik, iknb)
-                AA_q_ik = 1.j * AAW[:, :, None] * mmn.wk[ik, ib] * mmn.bk_cart[ik, ib, None, None, :]
-                if transl_inv:
-                    AA_q_ik[range(self.num_wann), range(self.num_wann)] = -np.log(
-                        AAW.diagonal()).imag[:, None] * mmn.wk[ik, ib] * mmn.bk_cart[ik, ib, None, :]
-                AA_q[ik] += AA_q_ik
+        wann = np.arange(self.num_wann)
+        for ks, ik, iknb in self._iter_neighbours(mmn, mmn.data[0].size):
+            data = np.array(mmn.data[ks])
+            if eig is not None:
+                data = data * eig.data[ks, None, :, None]
+            AAW = self.wannier_gauge_batch(data.reshape((-1,) + data.shape[2:]), ik.reshape(-1), iknb.reshape(-1))
+            AAW = AAW.reshape(data.shape[:2] + AAW.shape[1:])
+            wbk = mmn.wk[ks, :, None] * mmn.bk_cart[ks]
+            AA_q_ikb = 1.j * AAW[:, :, :, :, None] * wbk[:, :, None, None, :]
+            if transl_inv:
+                AA_q_ikb[:, :, wann, wann] = -np.log(
+                    AAW.diagonal(axis1=2, axis2=3)).imag[:, :, :, None] * wbk[:, :, None, :]
+            AA_q[ks] = AA_q_ikb.sum(axis=1)
         if eig is None:
             AA_q = 0.5 * (AA_q + AA_q.transpose((0, 2, 1, 3)).conj())
         return AA_q
@@ -145,83 +197,68 @@ class CheckPoint:
         mmn.set_bk_chk(self)
         assert uhu.NNB == mmn.NNB
         CC_q = np.zeros((self.num_kpts, self.num_wann, self.num_wann, 3), dtype=complex)
-        for ik in range(self.num_kpts):
-            for ib1 in range(mmn.NNB):
-                iknb1 = mmn.neighbours[ik, ib1]
-                for ib2 in range(mmn.NNB):
-                    iknb2 = mmn.neighbours[ik, ib2]
-                    data = uhu.data[ik, ib1, ib2]
-                    CC_q[ik] += (1.j * self.wannier_gauge(data, iknb1, iknb2)[:, :, None] *
-                                 (mmn.wk[ik, ib1] * mmn.wk[ik, ib2] *
-                                  (mmn.bk_cart[ik, ib1, alpha_A] * mmn.bk_cart[ik, ib2, beta_A] -
-                                     mmn.bk_cart[ik, ib1, beta_A] * mmn.bk_cart[ik, ib2, alpha_A])
-                                  )[None, None, :]
-                                 )
+        for ks, _, iknb in self._iter_neighbours(mmn, uhu.data[0].size):
+            data = np.array(uhu.data[ks])
+            nk, NNB = iknb.shape
+            iknb1 = np.repeat(iknb[:, :, None], NNB, axis=2)
+            iknb2 = np.repeat(iknb[:, None, :], NNB, axis=1)
+            CCW = self.wannier_gauge_batch(data.reshape((-1,) + data.shape[3:]), iknb1.reshape(-1), iknb2.reshape(-1))
+            CCW = CCW.reshape(data.shape[:3] + CCW.shape[1:])
+            wk = mmn.wk[ks]
+            bk = mmn.bk_cart[ks]
+            factor = (wk[:, :, None, None] * wk[:, None, :, None] *
+                      (bk[:, :, None, alpha_A] * bk[:, None, :, beta_A] -
+                       bk[:, :, None, beta_A] * bk[:, None, :, alpha_A]))
+            CC_q[ks] = 1.j * np.einsum('kabmn,kabi->kmni', CCW, factor)
         CC_q = 0.5 * (CC_q + CC_q.transpose((0, 2, 1, 3)).conj())
         return CC_q
 
-    def get_SA_q(self, siu, mmn):
+    def _get_SA_q(self, sxu, mmn):
         mmn.set_bk_chk(self)
         SA_q = np.zeros((self.num_kpts, self.num_wann, self.num_wann, 3, 3), dtype=complex)
-        assert siu.NNB == mmn.NNB
-        for ik in range(self.num_kpts):
-            for ib in range(mmn.NNB):
-                iknb = mmn.neighbours[ik, ib]
-                SAW = self.wannier_gauge(siu.data[ik, ib], ik, iknb)
-                SA_q_ik = 1.j * SAW[:, :, None, :] * mmn.wk[ik, ib] * mmn.bk_cart[ik, ib, None, None, :, None]
-                SA_q[ik] += SA_q_ik
+        assert sxu.NNB == mmn.NNB
+        for ks, ik, iknb in self._iter_neighbours(mmn, sxu.data[0].size):
+            data = np.array(sxu.data[ks])
+            SAW = self.wannier_gauge_batch(data.reshape((-1,) + data.shape[2:]), ik.reshape(-1), iknb.reshape(-1))
+            SAW = SAW.reshape(data.shape[:2] + SAW.shape[1:])
+            SA_q[ks] = 1.j * np.einsum('kbmnj,kbi->kmnij', SAW, mmn.wk[ks, :, None] * mmn.bk_cart[ks])
         return SA_q
 
+    def get_SA_q(self, siu, mmn):
+        return self._get_SA_q(siu, mmn)
+
     def get_SHA_q(self, shu, mmn):
-        mmn.set_bk_chk(self)
-        SHA_q = np.zeros((self.num_kpts, self.num_wann, self.num_wann, 3, 3), dtype=complex)
-        assert shu.NNB == mmn.NNB
-        for ik in range(self.num_kpts):
-            for ib in range(mmn.NNB):
-                iknb = mmn.neighbours[ik, ib]
-                SHAW = self.wannier_gauge(shu.data[ik, ib], ik, iknb)
-                SHA_q_ik = 1.j * SHAW[:, :, None, :] * mmn.wk[ik, ib] * mmn.bk_cart[ik, ib, None, None, :, None]
-                SHA_q[ik] += SHA_q_ik
-        return SHA_q
+        return self._get_SA_q(shu, mmn)
 
-    def get_SR_q(self, spn, mmn):
+    def _get_SR_q(self, spn, mmn, eig=None):
         mmn.set_bk_chk(self)
         SR_q = np.zeros((self.num_kpts, self.num_wann, self.num_wann, 3, 3), dtype=complex)
         assert (spn.NK, spn.NB) == (self.num_kpts, self.num_bands)
-        for ik in range(self.num_kpts):
-            for ib in range(mmn.NNB):
-                iknb = mmn.neighbours[ik, ib]
-                for i in range(3):
-                    SM_i = spn.data[ik, :, :, i].dot(mmn.data[ik, ib, :, :])
-                    SRW = self.wannier_gauge(SM_i, ik, iknb) - self.wannier_gauge(spn.data[ik, :, :, i], ik, ik)
-                    SR_q[ik, :, :, :, i] += 1.j * SRW[:, :, None] * mmn.wk[ik, ib] * mmn.bk_cart[ik, ib, None, None, :]
+        for ks, ik, iknb in self._iter_neighbours(mmn, mmn.data[0].size * 3):
+            S = np.array(spn.data[ks])
+            if eig is not None:
+                S = S * eig.data[ks, None, :, None]
+            # SM[k, b, m, n, i] = sum_l S[k, m, l, i] * M[k, b, l, n]
+            SM = np.moveaxis(np.moveaxis(S, 3, 1)[:, None] @ np.array(mmn.data[ks])[:, :, None], 2, 4)
+            SRW = self.wannier_gauge_batch(SM.reshape((-1,) + SM.shape[2:]), ik.reshape(-1), iknb.reshape(-1))
+            SRW = SRW.reshape(SM.shape[:2] + SRW.shape[1:])
+            SRW -= self.wannier_gauge_batch(S, ik[:, 0], ik[:, 0])[:, None]
+            SR_q[ks] = 1.j * np.einsum('kbmnj,kbi->kmnij', SRW, mmn.wk[ks, :, None] * mmn.bk_cart[ks])
         return SR_q
 
+    def get_SR_q(self, spn, mmn):
+        return self._get_SR_q(spn, mmn)
+
     def get_SH_q(self, spn, eig):
         SH_q = np.zeros((self.num_kpts, self.num_wann, self.num_wann, 3), dtype=complex)
         assert (spn.NK, spn.NB) == (self.num_kpts, self.num_bands)
-        for ik in range(self.num_kpts):
-            for i in range(3):
-                SH_q[ik, :, :, i] = self.wannier_gauge(spn.data[ik, :, :, i] * eig.data[ik, None, :], ik, ik)
+        for ks in self.k_chunks(spn.data[0].size):
+            ik = np.arange(self.num_kpts)[ks]
+            SH_q[ks] = self.wannier_gauge_batch(np.array(spn.data[ks]) * eig.data[ks, None, :, None], ik, ik)
         return SH_q
 
     def get_SHR_q(self, spn, mmn, eig):
-        mmn.set_bk_chk(self)
-        SHR_q = np.zeros((self.num_kpts, self.num_wann, self.num_wann, 3, 3), dtype=complex)
-        assert (spn.NK, spn.NB) == (self.num_kpts, self.num_bands)
-        for ik in range(self.num_kpts):
-            for ib in range(mmn.NNB):
-                iknb = mmn.neighbours[ik, ib]
-                for i in range(3):
-                    SH_i = spn.data[ik, :, :, i] * eig.data[ik, None, :]
-                    SHM_i = SH_i.dot(mmn.data[ik, ib])
-                    SHRW = self.wannier_gauge(SHM_i, ik, iknb) - self.wannier_gauge(SH_i, ik, ik)
-                    SHR_q[ik, :, :, :,
-                    i] += 1.j * SHRW[:, :, None] * mmn.wk[ik, ib] * mmn.bk_cart[ik, ib, None, None, :]
-        return SHR_q
-
-
-
+        return self._get_SR_q(spn, mmn, eig)
 
 
 class CheckPoint_bare(CheckPoint):
@@ -251,15 +288,30 @@ class CheckPoint_bare(CheckPoint):
 
 class Wannier90data:
     """A class to describe all input files of wannier90, and to construct the Wannier functions
-     via disentanglement procedure"""
+     via disentanglement procedure
+
+    Parameters
+    ----------
+    cache : bool
+        keep binary copies of the parsed text files (`.mmn`) next to them, and reuse them on subsequent runs
+    mmap : bool
+        memory-map the large files (`.mmn` via its binary cache, unformatted `.uHu`, `.uIu`, `.sHu`, `.sIu`),
+        so that they are read k-point by k-point when the matrices are constructed
+    cache_dir : str
+        directory for the binary copies, if the directory of the input files is not writable
+        (by default they are written next to the input files, or skipped with a warning, if that fails)
+    """
 
     # todo :  rotatre uHu and spn
     # todo : create a model from this
     # todo : symmetry
 
     def __init__(self, seedname="wannier90", read_chk=False,
-                 kmesh_tol=1e-7, bk_complete_tol=1e-5, ):  # ,sitesym=False):
+                 kmesh_tol=1e-7, bk_complete_tol=1e-5, cache=False, mmap=False, cache_dir=None):  # ,sitesym=False):
         self.seedname = copy(seedname)
+        self.__files_kwargs = {'mmn': {'cache': cache, 'mmap': mmap, 'cache_dir': cache_dir}}
+        for key in 'uhu', 'uiu', 'shu', 'siu':
+            self.__files_kwargs[key] = {'mmap': mmap}
         self.__files_classes = {'win': WIN,
                                 'eig': EIG,
                                 'mmn': MMN,
@@ -293,7 +345,7 @@ class Wannier90data:
         if not overwrite:
             assert key not in self.__files, f"file `{key}` was already set"
         if val is None:
-            val = self.__files_classes[key](self.seedname)
+            val = self.__files_classes[key](self.seedname, **self.__files_kwargs.get(key, {}))
         self.check_conform(key, val)
         self.__files[key] = val
 
@@ -413,10 +465,6 @@ class W90_file:
             return None
 
 
-def convert(A):
-    return np.array([l.split() for l in A], dtype=float)
-
-
 class MMN(W90_file):
     """
     MMN.data[ik, ib, m, n] = <u_{m,k}|u_{n,k+b}>
@@ -426,45 +474,95 @@ class MMN(W90_file):
     def n_neighb(self):
         return 1
 
-    def __init__(self, seedname, npar=multiprocessing.cpu_count()):
+    def __init__(self, seedname, npar=multiprocessing.cpu_count(), cache=False, mmap=False, chunk=2 ** 22,
+                 cache_dir=None):
+        """
+        Parameters
+        ----------
+        seedname : str
+            the .mmn file is `seedname.mmn`
+        npar : int
+            not used (the blocks are parsed in chunks directly into the array), kept for compatibility
+        cache : bool
+            if True, the parsed data are stored in binary files `seedname.mmn.npy` and `seedname.mmn.head.npy`,
+            which are read instead of the text file on subsequent runs (unless the `.mmn` file is newer)
+        mmap : bool
+            if True, `data` is memory-mapped from the binary cache (implies `cache=True`), so that
+            only the k-points being accessed are loaded into memory
+        chunk : int
+            approximate number of numbers parsed at once (limits the memory used for the text)
+        cache_dir : str
+            the directory for the binary cache (default : the directory of the `.mmn` file).
+            If the cache cannot be written there (e.g. the directory is read-only), a warning is printed,
+            and the data are read into memory without the cache
+        """
         t0 = time()
-        f_mmn_in = open(seedname + ".mmn", "r")
-        f_mmn_in.readline()
-        NB, NK, NNB = np.array(f_mmn_in.readline().split(), dtype=int)
-        self.data = np.zeros((NK, NNB, NB, NB), dtype=complex)
-        block = 1 + self.NB * self.NB
-        data = []
-        headstring = []
-        mult = 4
-
-        # FIXME: npar = 0 does not work
-        if npar > 0:
-            pool = multiprocessing.Pool(npar)
-        for j in range(0, NNB * NK, npar * mult):
-            x = list(islice(f_mmn_in, int(block * npar * mult)))
-            if len(x) == 0:
-                break
-            headstring += x[::block]
-            y = [x[i * block + 1:(i + 1) * block] for i in range(npar * mult) if (i + 1) * block <= len(x)]
-            if npar > 0:
-                data += pool.map(convert, y)
-            else:
-                data += [convert(z) for z in y]
-
-        if npar > 0:
-            pool.close()
-            pool.join()
-        f_mmn_in.close()
+        fname = seedname + ".mmn"
+        fname_cache = fname if cache_dir is None else os.path.join(cache_dir, os.path.basename(fname))
+        fname_data = fname_cache + ".npy"
+        fname_head = fname_cache + ".head.npy"
+        cache = cache or mmap
+        if cache and all(os.path.isfile(f) and os.path.getmtime(f) >= os.path.getmtime(fname)
+                         for f in (fname_data, fname_head)):
+            print(f"reading {fname} from the binary cache {fname_data}")
+        else:
+            if cache:
+                # the text is parsed directly into the file
+                try:
+                    data, headstring = self.read_text(fname, chunk=chunk, fname_data=fname_data)
+                    np.save(fname_head, headstring)
+                    del data
+                except OSError as err:
+                    print(f"WARNING: failed to write the binary cache {fname_data} : {err}\n"
+                          f"reading {fname} without the cache")
+                    for f in fname_data, fname_head:
+                        if os.path.isfile(f):
+                            try:
+                                os.remove(f)
+                            except OSError:
+                                pass
+                    cache = False
+            if not cache:
+                self.data, headstring = self.read_text(fname, chunk=chunk)
+        if cache:
+            self.data = np.load(fname_data, mmap_mode='r' if mmap else None)
+            headstring = np.load(fname_head)
         t1 = time()
-        data = [d[:, 0] + 1j * d[:, 1] for d in data]
-        self.data = np.array(data).reshape(self.NK, self.NNB, self.NB, self.NB).transpose((0, 1, 3, 2))
-        headstring = np.array([s.split() for s in headstring], dtype=int).reshape(self.NK, self.NNB, 5)
         assert np.all(headstring[:, :, 0] - 1 == np.arange(self.NK)[:, None])
         self.neighbours = headstring[:, :, 1] - 1
         self.G = headstring[:, :, 2:]
         t2 = time()
         print("Time for MMN.__init__() : {} , read : {} , headstring {}".format(t2 - t0, t1 - t0, t2 - t1))
 
+    @staticmethod
+    def read_text(fname, chunk=2 ** 22, fname_data=None):
+        """parse the text .mmn file. Returns data[ik, ib, m, n] and the headers of the blocks (NK, NNB, 5)
+        If `fname_data` is given, data is a memory-mapped .npy file written there"""
+        with open(fname, "r") as f_mmn_in:
+            f_mmn_in.readline()
+            NB, NK, NNB = np.array(f_mmn_in.readline().split(), dtype=int)
+            # each block is a header (ik, ikb, G) followed by NB*NB lines of (Re, Im), for m fast, n slow
+            block = 5 + 2 * NB * NB
+            if fname_data is None:
+                data = np.zeros((NK, NNB, NB, NB), dtype=complex)
+            else:
+                data = np.lib.format.open_memmap(fname_data, mode='w+', dtype=complex, shape=(NK, NNB, NB, NB))
+            data_flat = data.reshape(NK * NNB, NB, NB)
+            headstring = np.zeros((NK * NNB, 5), dtype=int)
+            nblocks = max(1, chunk // block)
+            for start in range(0, NK * NNB, nblocks):
+                stop = min(start + nblocks, NK * NNB)
+                text = "".join(islice(f_mmn_in, (stop - start) * (1 + NB * NB)))
+                x = np.fromstring(text, sep=" ")
+                if x.size != (stop - start) * block:
+                    raise RuntimeError(f"failed to parse blocks {start} to {stop} of {fname}: "
+                                       f"expected {(stop - start) * block} numbers, found {x.size}")
+                x = x.reshape(stop - start, block)
+                headstring[start:stop] = np.round(x[:, :5])
+                # the file stores M[m, n] with m running fastest
+                data_flat[start:stop] = (x[:, 5::2] + 1j * x[:, 6::2]).reshape(stop - start, NB, NB).transpose(0, 2, 1)
+        return data, headstring.reshape(NK, NNB, 5)
+
     def set_bk(self, kpt_latt, mp_grid, recip_lattice, kmesh_tol=1e-7, bk_complete_tol=1e-5):
         try:
             self.bk_cart
@@ -602,6 +700,52 @@ class SPN(W90_file):
         print("----------\n SPN OK  \n---------\n")
 
 
+def read_complex_text(f, count, chunk=2 ** 22):
+    """read `count` lines "Re Im" from the text file `f`, parsing `chunk` lines at a time.
+    Returns a complex array of length `count`"""
+    data = np.zeros(count, dtype=complex)
+    for start in range(0, count, chunk):
+        stop = min(start + chunk, count)
+        x = np.fromstring("".join(islice(f, stop - start)), sep=" ")
+        if x.size != 2 * (stop - start):
+            raise RuntimeError(f"failed to parse lines {start} to {stop} of {f.name}: "
+                               f"expected {2 * (stop - start)} numbers, found {x.size}")
+        data[start:stop] = x[0::2] + 1j * x[1::2]
+    return data
+
+
+def mmap_fortran_records(f, first_record, shape, NB, copy=True):
+    """Memory-map the records of a Fortran file starting from `first_record`, each holding
+    an NB x NB complex matrix in column-major order. The records are returned as an array
+    of shape `shape + (NB, NB)`, where the last two indices are transposed w.r.t. the matrix.
+    If `copy` is False, the array is a view into the file.
+    Returns None if the records do not have the expected uniform layout (e.g. subrecords are present)
+    """
+    nrec = int(np.prod(shape))
+    length = 16 * NB * NB
+    header = f.header_dtype
+    # find the offset of `first_record` by following the record markers
+    offset = 0
+    with open(f.file, "rb") as fp:
+        for _ in range(first_record):
+            fp.seek(offset)
+            head = np.fromfile(fp, dtype=header, count=1)
+            if head.size == 0 or head[0] < 0:
+                return None
+            offset += int(head[0]) + 2 * header.itemsize
+    if os.path.getsize(f.file) < offset + nrec * (length + 2 * header.itemsize):
+        return None
+    record_dtype = np.dtype([('head', header), ('data', f.byteorder + 'c16', (NB, NB)), ('tail', header)])
+    records = np.memmap(f.file, dtype=record_dtype, mode='r', offset=offset, shape=shape)
+    if np.any(records['head'] != length) or np.any(records['tail'] != length):
+        return None
+    data = records['data']
+    if copy:
+        data = np.array(data)
+        del records
+    return data
+
+
 class UXU(W90_file):
     """
     Read and setup uHu or uIu object.
@@ -614,7 +758,7 @@ class UXU(W90_file):
     def n_neighb(self):
         return 2
 
-    def __init__(self, seedname='wannier90', formatted=False, suffix='uHu'):
+    def __init__(self, seedname='wannier90', formatted=False, suffix='uHu', mmap=False):
         print("----------\n  {0}   \n---------".format(suffix))
         print('formatted == {}'.format(formatted))
         if formatted:
@@ -628,17 +772,19 @@ class UXU(W90_file):
 
         print("reading {}.{} : <{}>".format(seedname, suffix, header))
 
-        self.data = np.zeros((NK, NNB, NNB, NB, NB), dtype=complex)
         if formatted:
-            tmp = np.array([f_uXu_in.readline().split() for i in range(NK * NNB * NNB * NB * NB)], dtype=float)
-            tmp_cplx = tmp[:, 0] + 1.j * tmp[:, 1]
+            tmp_cplx = read_complex_text(f_uXu_in, NK * NNB * NNB * NB * NB)
             self.data = tmp_cplx.reshape(NK, NNB, NNB, NB, NB).transpose(0, 2, 1, 3, 4)
         else:
-            for ik in range(NK):
-                for ib2 in range(NNB):
-                    for ib1 in range(NNB):
-                        tmp = f_uXu_in.read_record('f8').reshape((2, NB, NB), order='F').transpose(2, 1, 0)
-                        self.data[ik, ib1, ib2] = tmp[:, :, 0] + 1j * tmp[:, :, 1]
+            # records for (ik, ib2, ib1), each holding data[ik, ib1, ib2].T in column-major order
+            tmp = mmap_fortran_records(f_uXu_in, 2, (NK, NNB, NNB), NB, copy=not mmap)
+            if tmp is None:
+                tmp = np.zeros((NK, NNB, NNB, NB, NB), dtype=complex)
+                for ik in range(NK):
+                    for ib2 in range(NNB):
+                        for ib1 in range(NNB):
+                            tmp[ik, ib2, ib1] = f_uXu_in.read_record('c16').reshape(NB, NB)
+            self.data = tmp.transpose(0, 2, 1, 3, 4)
         print("----------\n {0} OK  \n---------\n".format(suffix))
         f_uXu_in.close()
 
@@ -648,8 +794,8 @@ class UHU(UXU):
     UHU.data[ik, ib1, ib2, m, n] = <u_{m,k+b1}|H(k)|u_{n,k+b2}>
     """
 
-    def __init__(self, seedname='wannier90', formatted=False):
-        super().__init__(seedname=seedname, formatted=formatted, suffix='uHu')
+    def __init__(self, seedname='wannier90', formatted=False, mmap=False):
+        super().__init__(seedname=seedname, formatted=formatted, suffix='uHu', mmap=mmap)
 
 
 class UIU(UXU):
@@ -657,8 +803,8 @@ class UIU(UXU):
     UIU.data[ik, ib1, ib2, m, n] = <u_{m,k+b1}|u_{n,k+b2}>
     """
 
-    def __init__(self, seedname='wannier90', formatted=False):
-        super().__init__(seedname=seedname, formatted=formatted, suffix='uIu')
+    def __init__(self, seedname='wannier90', formatted=False, mmap=False):
+        super().__init__(seedname=seedname, formatted=formatted, suffix='uIu', mmap=mmap)
 
 
 class SXU(W90_file):
@@ -673,7 +819,7 @@ class SXU(W90_file):
     def n_neighb(self):
         return 1
 
-    def __init__(self, seedname='wannier90', formatted=False, suffix='sHu'):
+    def __init__(self, seedname='wannier90', formatted=False, suffix='sHu', mmap=False):
         print("----------\n  {0}   \n---------".format(suffix))
 
         if formatted:
@@ -687,19 +833,19 @@ class SXU(W90_file):
 
         print("reading {}.{} : <{}>".format(seedname, suffix, header))
 
-        self.data = np.zeros((NK, NNB, NB, NB, 3), dtype=complex)
-
         if formatted:
-            tmp = np.array([f_sXu_in.readline().split() for i in range(NK * NNB * 3 * NB * NB)], dtype=float)
-            tmp_cplx = tmp[:, 0] + 1j * tmp[:, 1]
+            tmp_cplx = read_complex_text(f_sXu_in, NK * NNB * 3 * NB * NB)
             self.data = tmp_cplx.reshape(NK, NNB, 3, NB, NB).transpose(0, 1, 3, 4, 2)
         else:
-            for ik in range(NK):
-                for ib in range(NNB):
-                    for ipol in range(3):
-                        tmp = f_sXu_in.read_record('f8').reshape((2, NB, NB), order='F').transpose(2, 1, 0)
-                        # tmp[m, n] = <u_{m,k}|S_ipol*X|u_{n,k+b}>
-                        self.data[ik, ib, :, :, ipol] = tmp[:, :, 0] + 1j * tmp[:, :, 1]
+            # records for (ik, ib, ipol), each holding data[ik, ib, :, :, ipol].T in column-major order
+            tmp = mmap_fortran_records(f_sXu_in, 2, (NK, NNB, 3), NB, copy=not mmap)
+            if tmp is None:
+                tmp = np.zeros((NK, NNB, 3, NB, NB), dtype=complex)
+                for ik in range(NK):
+                    for ib in range(NNB):
+                        for ipol in range(3):
+                            tmp[ik, ib, ipol] = f_sXu_in.read_record('c16').reshape(NB, NB)
+            self.data = tmp.transpose(0, 1, 3, 4, 2)
 
         print("----------\n {0} OK  \n---------\n".format(suffix))
         f_sXu_in.close()
@@ -710,8 +856,8 @@ class SIU(SXU):
     SIU.data[ik, ib, m, n, ipol] = <u_{m,k}|S_ipol|u_{n,k+b}>
     """
 
-    def __init__(self, seedname='wannier90', formatted=False):
-        super().__init__(seedname=seedname, formatted=formatted, suffix='sIu')
+    def __init__(self, seedname='wannier90', formatted=False, mmap=False):
+        super().__init__(seedname=seedname, formatted=formatted, suffix='sIu', mmap=mmap)
 
 
 class SHU(SXU):
@@ -719,8 +865,8 @@ class SHU(SXU):
     SHU.data[ik, ib, m, n, ipol] = <u_{m,k}|S_ipol*H(k)|u_{n,k+b}>
     """
 
-    def __init__(self, seedname='wannier90', formatted=False):
-        super().__init__(seedname=seedname, formatted=formatted, suffix='sHu')
+    def __init__(self, seedname='wannier90', formatted=False, mmap=False):
+        super().__init__(seedname=seedname, formatted=formatted, suffix='sHu', mmap=mmap)
 
 
 def parse_win_raw(filename=None, text=None):